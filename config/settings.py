@@ -105,16 +105,52 @@ CELERY_RESULT_BACKEND = 'django-db'
 CELERY_TIMEZONE = 'Europe/Warsaw'
 CELERY_ENABLE_UTC = True
 
+# DataForSEO — adres API (nadpisywany np. lokalną atrapą w testach)
+DATAFORSEO_API_BASE = os.getenv('DATAFORSEO_API_BASE', 'https://api.dataforseo.com/v3')
+
+# DataForSEO — tryb sprawdzania pozycji w nocnym tasku
+# 'standard' = kolejka task_post/task_get (taniej, paczki po 100), 'live' = zapytanie na frazę
+DATAFORSEO_RANK_CHECK_MODE = os.getenv('DATAFORSEO_RANK_CHECK_MODE', 'standard')
+# Kolejka standard (skany geo-grid): co ile sekund pytamy tasks_ready i ile maksymalnie czekamy na wyniki
+DATAFORSEO_TASK_POLL_INTERVAL = 30
+DATAFORSEO_TASK_MAX_WAIT = 45 * 60
+# Pozycje w kolejce standard: po ilu godzinach nieodebrane zadanie SERP uznajemy za stracone
+SERP_TASK_MAX_AGE_HOURS = int(os.getenv('SERP_TASK_MAX_AGE_HOURS', '24'))
+# Tryb live: równoległe zapytania per fraza (pula wątków) w check_keyword_rankings
+DATAFORSEO_RANK_CHECK_CONCURRENT = True
+DATAFORSEO_RANK_CHECK_WORKERS = int(os.getenv('DATAFORSEO_RANK_CHECK_WORKERS', '8'))
+
+# Cache wolumenów fraz (KeywordVolume): ile dni wpis jest ważny w ramach miesiąca danych
+KEYWORD_VOLUME_CACHE_DAYS = int(os.getenv('KEYWORD_VOLUME_CACHE_DAYS', '30'))
+
+# Wolumeny w kolejce standard: po ilu godzinach nieodebrane zadanie uznajemy za stracone
+KEYWORD_VOLUME_TASK_MAX_AGE_HOURS = int(os.getenv('KEYWORD_VOLUME_TASK_MAX_AGE_HOURS', '24'))
+
+# Limity zapytań do zewnętrznych API (zapytań na minutę, wspólne dla wszystkich procesów)
+# DataForSEO pozwala na 2000/min — zostawiamy zapas
+API_RATE_LIMITS = {
+    'dataforseo': int(os.getenv('DATAFORSEO_REQUESTS_PER_MINUTE', '1500')),
+    # Business Profile Performance API — domyślny limit projektu Google to 300/min
+    'gbp_performance': int(os.getenv('GBP_REQUESTS_PER_MINUTE', '240')),
+}
+
+# Metryki GBP: ile lokalizacji pobieramy równolegle (łącznie we wszystkich workerach)
+GBP_FETCH_WORKERS = int(os.getenv('GBP_FETCH_WORKERS', '4'))
+
+# Backfill historii GBP: ile miesięcy wstecz, ile dni w paczce, ile paczek na jedno uruchomienie taska
+GBP_BACKFILL_MONTHS = int(os.getenv('GBP_BACKFILL_MONTHS', '18'))
+GBP_BACKFILL_CHUNK_DAYS = int(os.getenv('GBP_BACKFILL_CHUNK_DAYS', '31'))
+GBP_BACKFILL_ROUNDS_PER_RUN = int(os.getenv('GBP_BACKFILL_ROUNDS_PER_RUN', '6'))
+
+# Harmonogram adaptacyjny: max zapytań SERP (unikalnych fraz + lokalizacji) dziennie
+RANK_CHECK_DAILY_BUDGET = int(os.getenv('RANK_CHECK_DAILY_BUDGET', '200'))
+
 CELERY_BEAT_SCHEDULE = {
-    # Sprawdzanie pozycji fraz — poniedziałek i czwartek o 2:00 w nocy
-    'check-rankings-monday': {
-        'task': 'leads.tasks_analysis.check_all_clients_rankings',
-        'schedule': crontab(day_of_week='monday', hour='2', minute='0'),
-        'options': {'expires': 3600},
-    },
-    'check-rankings-thursday': {
-        'task': 'leads.tasks_analysis.check_all_clients_rankings',
-        'schedule': crontab(day_of_week='thursday', hour='2', minute='0'),
+    # Sprawdzanie pozycji fraz — codziennie o 2:00 w nocy, tylko frazy wybrane
+    # przez harmonogram adaptacyjny (kolejka standard, limit RANK_CHECK_DAILY_BUDGET)
+    'check-rankings-adaptive': {
+        'task': 'leads.tasks_analysis.check_rankings_adaptive',
+        'schedule': crontab(hour='2', minute='0'),
         'options': {'expires': 3600},
     },
     # Snapshot miesięczny — 1. dnia każdego miesiąca o 2:00 w nocy
@@ -123,12 +159,36 @@ CELERY_BEAT_SCHEDULE = {
         'schedule': crontab(day_of_month='1', hour='2', minute='0'),
         'options': {'expires': 3600},
     },
-    # Metryki GBP — codziennie o 3:00 w nocy
+    # Rejestr lokalizacji GBP — codziennie o 0:30
+    'refresh-gbp-locations': {
+        'task': 'leads.tasks.refresh_gbp_locations',
+        'schedule': crontab(hour='0', minute='30'),
+        'options': {'expires': 3600},
+    },
+    # Backfill historii GBP dla nowych klientów — codziennie o 1:00 w nocy (task sam się wznawia)
+    'backfill-gbp-metrics': {
+        'task': 'leads.tasks.backfill_gbp_metrics',
+        'schedule': crontab(hour='1', minute='0'),
+        'options': {'expires': 3600},
+    },
+    # Metryki GBP — codziennie o 3:00 w nocy; kondycja klientów liczona po zakończeniu przebiegu
     'fetch-gbp-metrics-daily': {
         'task': 'leads.tasks.fetch_gbp_metrics_all',
         'schedule': crontab(hour='3', minute='0'),
         'options': {'expires': 3600},
     },
+    # Odbiór SERP-ów sprawdzania pozycji z kolejki standard — co 2 minuty (bez oczekujących zadań kończy się od razu)
+    'collect-rank-checks': {
+        'task': 'leads.tasks_analysis.collect_rank_check_tasks',
+        'schedule': crontab(minute='*/2'),
+        'options': {'expires': 120},
+    },
+    # Odbiór wolumenów fraz z kolejki standard DataForSEO — co 2 minuty (bez oczekujących zadań kończy się od razu)
+    'collect-keyword-volumes': {
+        'task': 'leads.tasks.collect_keyword_volumes_task',
+        'schedule': crontab(minute='*/2'),
+        'options': {'expires': 120},
+    },
     # Sprawdzanie emaili — co godzinę
     'check-unread-emails': {
         'task': 'leads.tasks.check_unread_emails_task',
@@ -137,10 +197,22 @@ CELERY_BEAT_SCHEDULE = {
     },
 }
 
+# Redis wspólny dla procesu web i workerów Celery (baza 1 — broker Celery jest na 0)
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/1')
+
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
+    # Cache widoczny ze wszystkich procesów — single-flight i limity zapytań do API
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'OPTIONS': {
+            'socket_connect_timeout': 1,
+            'socket_timeout': 2,
+        },
+    },
 }
 
 
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0068_contentpostversion_cta_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SerpSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phrase', models.CharField(max_length=200)),
+                ('engine', models.CharField(
+                    max_length=10,
+                    choices=[('maps', 'Google Maps'), ('organic', 'Google (organiczne)')],
+                )),
+                ('location', models.CharField(max_length=100)),
+                ('depth', models.IntegerField()),
+                ('day', models.DateField()),
+                ('items', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-day'],
+                'unique_together': {('phrase', 'location', 'depth', 'engine', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0069_serpsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SerpCompetitorPosition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phrase', models.CharField(max_length=200)),
+                ('engine', models.CharField(
+                    max_length=10,
+                    choices=[('maps', 'Google Maps'), ('organic', 'Google (organiczne)')],
+                )),
+                ('location', models.CharField(max_length=100)),
+                ('day', models.DateField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('cid', models.CharField(blank=True, max_length=30)),
+                ('domain', models.CharField(blank=True, max_length=255)),
+                ('title', models.CharField(blank=True, max_length=255)),
+                ('rating', models.FloatField(blank=True, null=True)),
+                ('reviews_count', models.IntegerField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-day', 'rank'],
+                'indexes': [
+                    models.Index(fields=['cid', 'day'], name='leads_serpc_cid_5700d1_idx'),
+                    models.Index(fields=['domain', 'day'], name='leads_serpc_domain_3815d6_idx'),
+                ],
+                'unique_together': {('phrase', 'location', 'day', 'engine', 'rank')},
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0070_serpcompetitorposition'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeoGridScan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('size', models.PositiveSmallIntegerField(default=5)),
+                ('spacing_km', models.FloatField(default=1.0)),
+                ('points', models.JSONField(default=list)),
+                ('positions', models.JSONField(default=list)),
+                ('changed_cells', models.JSONField(default=list)),
+                ('fetched_cells', models.IntegerField(default=0)),
+                ('failed_cells', models.IntegerField(default=0)),
+                ('status', models.CharField(
+                    max_length=10,
+                    choices=[('pending', 'W toku'), ('done', 'Gotowy'), ('failed', 'Błąd')],
+                    default='pending',
+                )),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('keyword', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='grid_scans',
+                    to='leads.leadkeyword',
+                )),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0071_geogridscan'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gbpmetricssnapshot',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0072_gbpmetricssnapshot_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GBPUnavailableDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Dzień')),
+                ('attempts', models.PositiveSmallIntegerField(default=1, verbose_name='Puste odpowiedzi')),
+                ('last_checked_at', models.DateTimeField(auto_now=True)),
+                ('lead', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='gbp_unavailable_days',
+                    to='leads.lead',
+                    verbose_name='Klient',
+                )),
+            ],
+            options={
+                'verbose_name': 'Niedostępny dzień GBP',
+                'verbose_name_plural': 'Niedostępne dni GBP',
+                'ordering': ['-date'],
+                'unique_together': {('lead', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0073_gbpunavailableday'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GBPBackfill',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_from', models.DateField(verbose_name='Od')),
+                ('date_to', models.DateField(verbose_name='Do')),
+                ('cursor', models.DateField(verbose_name='Następny dzień')),
+                ('status', models.CharField(
+                    max_length=10,
+                    choices=[('pending', 'W toku'), ('done', 'Zakończony'), ('failed', 'Błąd')],
+                    default='pending',
+                )),
+                ('chunks_done', models.IntegerField(default=0)),
+                ('days_saved', models.IntegerField(default=0)),
+                ('errors', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('lead', models.OneToOneField(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='gbp_backfill',
+                    to='leads.lead',
+                    verbose_name='Klient',
+                )),
+            ],
+            options={
+                'verbose_name': 'Backfill metryk GBP',
+                'verbose_name_plural': 'Backfille metryk GBP',
+            },
+        ),
+    ]
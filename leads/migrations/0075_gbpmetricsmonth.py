@@ -0,0 +1,34 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0074_gbpbackfill'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GBPMetricsMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField(verbose_name='Rok')),
+                ('month', models.IntegerField(verbose_name='Miesiąc')),
+                ('data', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('lead', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='gbp_metric_months',
+                    to='leads.lead',
+                    verbose_name='Klient',
+                )),
+            ],
+            options={
+                'verbose_name': 'Metryki GBP (miesiąc)',
+                'verbose_name_plural': 'Metryki GBP (miesiące)',
+                'ordering': ['-year', '-month'],
+                'unique_together': {('lead', 'year', 'month')},
+            },
+        ),
+    ]
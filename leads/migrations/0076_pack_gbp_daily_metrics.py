@@ -0,0 +1,61 @@
+import numpy as np
+from django.db import migrations
+
+# Układ tablicy jak w leads.services.gbp_series (skopiowany — migracja nie może zależeć od zmian w serwisie)
+METRICS = [
+    'calls', 'profile_views', 'website_visits', 'direction_requests',
+    'conversations', 'bookings', 'food_orders', 'food_menu_clicks',
+]
+MISSING = -1
+BATCH = 500
+
+
+def pack_daily_metrics(apps, schema_editor):
+    GBPMetricsSnapshot = apps.get_model('leads', 'GBPMetricsSnapshot')
+    GBPMetricsMonth = apps.get_model('leads', 'GBPMetricsMonth')
+
+    rows = (
+        GBPMetricsSnapshot.objects
+        .filter(source='api', day__isnull=False)
+        .order_by('lead_id', 'year', 'month')
+        .values_list('lead_id', 'year', 'month', 'day', *METRICS)
+        .iterator(chunk_size=5000)
+    )
+    months = []
+    current_key, matrix = None, None
+    for lead_id, year, month, day, *values in rows:
+        key = (lead_id, year, month)
+        if key != current_key:
+            if current_key is not None:
+                months.append(GBPMetricsMonth(
+                    lead_id=current_key[0], year=current_key[1], month=current_key[2],
+                    data=matrix.tobytes(),
+                ))
+            current_key = key
+            matrix = np.full((len(METRICS), 31), MISSING, dtype='<i4')
+        matrix[:, day - 1] = [MISSING if v is None else v for v in values]
+        if len(months) >= BATCH:
+            GBPMetricsMonth.objects.bulk_create(months, ignore_conflicts=True)
+            months = []
+    if current_key is not None:
+        months.append(GBPMetricsMonth(
+            lead_id=current_key[0], year=current_key[1], month=current_key[2],
+            data=matrix.tobytes(),
+        ))
+    GBPMetricsMonth.objects.bulk_create(months, ignore_conflicts=True)
+
+
+def unpack_daily_metrics(apps, schema_editor):
+    # Wiersze dzienne zostają w GBPMetricsSnapshot — wystarczy wyczyścić spakowane miesiące
+    apps.get_model('leads', 'GBPMetricsMonth').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0075_gbpmetricsmonth'),
+    ]
+
+    operations = [
+        migrations.RunPython(pack_daily_metrics, unpack_daily_metrics),
+    ]
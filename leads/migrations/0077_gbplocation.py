@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0076_pack_gbp_daily_metrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GBPLocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location_id', models.CharField(max_length=50, unique=True, verbose_name='ID lokalizacji')),
+                ('account_name', models.CharField(max_length=100, verbose_name='Konto')),
+                ('title', models.CharField(blank=True, max_length=255, verbose_name='Nazwa')),
+                ('address', models.CharField(blank=True, max_length=500, verbose_name='Adres')),
+                ('website', models.URLField(blank=True, max_length=500, verbose_name='Witryna')),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Lokalizacja GBP',
+                'verbose_name_plural': 'Lokalizacje GBP',
+                'ordering': ['title'],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0077_gbplocation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GBPHealth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateField(verbose_name='Dane do dnia')),
+                ('interactions_7d', models.IntegerField(default=0, verbose_name='Interakcje (7 dni)')),
+                ('wow_change', models.FloatField(blank=True, null=True, verbose_name='Zmiana tydzień do tygodnia (%)')),
+                ('mom_change', models.FloatField(blank=True, null=True, verbose_name='Zmiana 28 dni do 28 dni (%)')),
+                ('score', models.FloatField(default=0, verbose_name='Wymaga uwagi')),
+                ('flags', models.JSONField(blank=True, default=list)),
+                ('metrics', models.JSONField(blank=True, default=dict)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('lead', models.OneToOneField(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='gbp_health',
+                    to='leads.lead',
+                    verbose_name='Klient',
+                )),
+            ],
+            options={
+                'verbose_name': 'Kondycja GBP',
+                'verbose_name_plural': 'Kondycja GBP',
+                'ordering': ['-score'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0078_gbphealth'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='gbpmetricssnapshot',
+            index=models.Index(
+                models.F('lead'), models.F('year') * 12 + models.F('month'),
+                name='gbp_metrics_lead_month_idx',
+            ),
+        ),
+    ]
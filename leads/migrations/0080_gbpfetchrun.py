@@ -0,0 +1,67 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0079_gbpmetricssnapshot_month_ordinal_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GBPFetchRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window', models.DateField(unique=True, verbose_name='Okno')),
+                ('date_from', models.DateField()),
+                ('date_to', models.DateField()),
+                ('status', models.CharField(
+                    max_length=10,
+                    choices=[('running', 'W toku'), ('done', 'Zakończony'), ('partial', 'Zakończony z błędami')],
+                    default='running',
+                )),
+                ('clients', models.IntegerField(default=0)),
+                ('failed', models.IntegerField(default=0)),
+                ('rows_written', models.IntegerField(default=0)),
+                ('report', models.JSONField(blank=True, default=dict)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Przebieg metryk GBP',
+                'verbose_name_plural': 'Przebiegi metryk GBP',
+                'ordering': ['-window'],
+            },
+        ),
+        migrations.CreateModel(
+            name='GBPFetchRunItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(
+                    max_length=10,
+                    choices=[('pending', 'Oczekuje'), ('running', 'W toku'), ('done', 'Gotowy'), ('failed', 'Błąd')],
+                    default='pending',
+                )),
+                ('attempts', models.IntegerField(default=0)),
+                ('rows_written', models.IntegerField(default=0)),
+                ('duration', models.FloatField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('lead', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='gbp_fetch_items',
+                    to='leads.lead',
+                )),
+                ('run', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='items',
+                    to='leads.gbpfetchrun',
+                )),
+            ],
+            options={
+                'unique_together': {('run', 'lead')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0080_gbpfetchrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeywordVolume',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phrase', models.CharField(max_length=200)),
+                ('location_code', models.IntegerField()),
+                ('language', models.CharField(max_length=30)),
+                ('month', models.DateField()),
+                ('search_volume', models.IntegerField(blank=True, null=True)),
+                ('fetched_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Wolumen frazy',
+                'verbose_name_plural': 'Wolumeny fraz',
+                'unique_together': {('phrase', 'location_code', 'language', 'month')},
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0081_keywordvolume'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeywordVolumeTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.CharField(max_length=100, unique=True)),
+                ('location_code', models.IntegerField()),
+                ('language', models.CharField(max_length=30)),
+                ('phrases', models.JSONField(default=list)),
+                ('status', models.CharField(
+                    choices=[('pending', 'Oczekuje'), ('done', 'Odebrane'), ('failed', 'Błąd')],
+                    default='pending',
+                    max_length=10,
+                )),
+                ('error', models.TextField(blank=True)),
+                ('posted_at', models.DateTimeField(auto_now_add=True)),
+                ('collected_at', models.DateTimeField(blank=True, null=True)),
+                ('voivodeship', models.ForeignKey(
+                    blank=True,
+                    null=True,
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='volume_tasks',
+                    to='leads.voivodeship',
+                )),
+            ],
+            options={
+                'verbose_name': 'Zadanie wolumenów',
+                'verbose_name_plural': 'Zadania wolumenów',
+                'ordering': ['posted_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0082_keywordvolumetask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SerpTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.CharField(max_length=100, unique=True)),
+                ('engine', models.CharField(
+                    choices=[('maps', 'Google Maps'), ('organic', 'Google (organiczne)')],
+                    max_length=10,
+                )),
+                ('tag', models.CharField(db_index=True, max_length=40)),
+                ('key', models.JSONField()),
+                ('day', models.DateField()),
+                ('keyword_ids', models.JSONField(default=list)),
+                ('status', models.CharField(
+                    choices=[('pending', 'Oczekuje'), ('done', 'Odebrane'), ('failed', 'Błąd')],
+                    default='pending',
+                    max_length=10,
+                )),
+                ('error', models.TextField(blank=True)),
+                ('posted_at', models.DateTimeField(auto_now_add=True)),
+                ('collected_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Zadanie SERP',
+                'verbose_name_plural': 'Zadania SERP',
+                'ordering': ['posted_at'],
+            },
+        ),
+    ]
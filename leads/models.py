@@ -400,6 +400,95 @@ class KeywordRankCheck(models.Model):
         return f"{self.keyword.phrase}: {pos} ({self.checked_at:%d.%m.%Y})"
 
 
+class SerpSnapshot(models.Model):
+    """Pełny SERP frazy dla lokalizacji z danego dnia.
+    Wspólny dla wszystkich leadów śledzących tę samą frazę w tym samym miejscu —
+    pozycję każdej wizytówki z SERP-a wyznaczamy bez kolejnego zapytania do API."""
+    ENGINE_MAPS = 'maps'
+    ENGINE_ORGANIC = 'organic'
+    ENGINE_CHOICES = [
+        (ENGINE_MAPS, 'Google Maps'),
+        (ENGINE_ORGANIC, 'Google (organiczne)'),
+    ]
+
+    phrase = models.CharField(max_length=200)  # znormalizowana: strip + lower
+    engine = models.CharField(max_length=10, choices=ENGINE_CHOICES)
+    location = models.CharField(max_length=100)  # location_coordinate albo location_name
+    depth = models.IntegerField()
+    day = models.DateField()
+    # Skrócone wyniki: [{"rank_absolute": 1, "cid": ..., "title": ..., "domain": ..., "url": ..., "type": ...}]
+    items = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-day']
+        unique_together = [('phrase', 'location', 'depth', 'engine', 'day')]
+
+    def __str__(self):
+        return f"{self.phrase} @ {self.location} ({self.day:%d.%m.%Y})"
+
+
+class SerpCompetitorPosition(models.Model):
+    """Jedna pozycja z SERP-a (wizytówka / domena) — indeks konkurencji.
+    Wypełniany przy każdym zapisie SerpSnapshot, żeby pytania typu
+    'kto jest nad klientem i jak się przesuwał' obsłużyć bez zapytania do API."""
+    phrase = models.CharField(max_length=200)  # jak w SerpSnapshot: strip + lower
+    engine = models.CharField(max_length=10, choices=SerpSnapshot.ENGINE_CHOICES)
+    location = models.CharField(max_length=100)
+    day = models.DateField()
+    rank = models.PositiveSmallIntegerField()  # rank_absolute
+    cid = models.CharField(max_length=30, blank=True)  # tylko Maps
+    domain = models.CharField(max_length=255, blank=True)
+    title = models.CharField(max_length=255, blank=True)
+    rating = models.FloatField(null=True, blank=True)
+    reviews_count = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-day', 'rank']
+        # Indeks unikalności zaczyna się od (fraza, lokalizacja, dzień) — obsługuje też wyszukiwanie
+        unique_together = [('phrase', 'location', 'day', 'engine', 'rank')]
+        indexes = [
+            models.Index(fields=['cid', 'day']),
+            models.Index(fields=['domain', 'day']),
+        ]
+
+    def __str__(self):
+        return f"#{self.rank} {self.title or self.domain} — {self.phrase} ({self.day:%d.%m.%Y})"
+
+
+class SerpTask(models.Model):
+    """Zadanie SERP sprawdzania pozycji w kolejce standard DataForSEO (task_post → tasks_ready → task_get).
+    Zapisujemy ID zaraz po wysłaniu — poller odbiera wyniki także po restarcie workera
+    i zapisuje pozycje fraz czekających na ten SERP."""
+    STATUS_PENDING = 'pending'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Oczekuje'),
+        (STATUS_DONE, 'Odebrane'),
+        (STATUS_FAILED, 'Błąd'),
+    ]
+
+    task_id = models.CharField(max_length=100, unique=True)
+    engine = models.CharField(max_length=10, choices=SerpSnapshot.ENGINE_CHOICES)
+    tag = models.CharField(max_length=40, db_index=True)  # serp_key_tag klucza
+    key = models.JSONField()  # klucz SERP-a w magazynie (serp_key)
+    day = models.DateField()  # dzień SERP-a w magazynie
+    keyword_ids = models.JSONField(default=list)  # LeadKeyword czekające na wynik
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    error = models.TextField(blank=True)
+    posted_at = models.DateTimeField(auto_now_add=True)
+    collected_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['posted_at']
+        verbose_name = 'Zadanie SERP'
+        verbose_name_plural = 'Zadania SERP'
+
+    def __str__(self):
+        return f"{self.key.get('phrase')} ({self.engine}, {self.day:%d.%m.%Y}): {self.status}"
+
+
 class LeadKeyword(models.Model):
     lead = models.ForeignKey(Lead, on_delete=models.CASCADE, related_name='keywords_list')
     phrase = models.CharField(max_length=200)
@@ -412,6 +501,40 @@ class LeadKeyword(models.Model):
         return f"{self.phrase} ({self.lead.name})"
 
 
+class GeoGridScan(models.Model):
+    """Skan pozycji frazy na siatce N×N punktów wokół wizytówki — dane do heatmapy.
+    Punkty są przyciągane do globalnej siatki współrzędnych, więc pobliscy klienci
+    z tą samą frazą trafiają w te same punkty i dzielą SERP-y (SerpSnapshot)."""
+    STATUS_PENDING = 'pending'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'W toku'),
+        (STATUS_DONE, 'Gotowy'),
+        (STATUS_FAILED, 'Błąd'),
+    ]
+
+    keyword = models.ForeignKey(LeadKeyword, on_delete=models.CASCADE, related_name='grid_scans')
+    size = models.PositiveSmallIntegerField(default=5)  # N — siatka N×N
+    spacing_km = models.FloatField(default=1.0)
+    # Macierze N×N (wiersze od północy, kolumny od zachodu)
+    points = models.JSONField(default=list)  # "lat,lng,zoom" dla DataForSEO
+    positions = models.JSONField(default=list)  # pozycja albo None (poza SERP)
+    # Komórki [wiersz, kolumna], w których pozycja zmieniła się względem poprzedniego skanu
+    changed_cells = models.JSONField(default=list)
+    fetched_cells = models.IntegerField(default=0)  # komórki pobrane w tym skanie (reszta z poprzedniego)
+    failed_cells = models.IntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Grid {self.size}×{self.size} — {self.keyword.phrase} ({self.created_at:%d.%m.%Y})"
+
+
 class VoivodeshipKeyword(models.Model):
     """Unikalna fraza kluczowa na poziomie województwa.
     Agreguje frazy ze wszystkich leadów w danym województwie."""
@@ -438,6 +561,59 @@ class VoivodeshipKeyword(models.Model):
         return f"{self.phrase} ({self.voivodeship.name})"
 
 
+class KeywordVolume(models.Model):
+    """Wolumen wyszukiwań frazy z DataForSEO — wspólny cache dla wszystkich województw i leadów.
+    Klucz: oczyszczona fraza (lower) + location_code + język + miesiąc danych.
+    search_volume=None oznacza, że API nie ma danych dla frazy (też nie pytamy drugi raz)."""
+    phrase = models.CharField(max_length=200)
+    location_code = models.IntegerField()
+    language = models.CharField(max_length=30)
+    month = models.DateField()  # pierwszy dzień miesiąca danych
+    search_volume = models.IntegerField(null=True, blank=True)
+    fetched_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [('phrase', 'location_code', 'language', 'month')]
+        verbose_name = 'Wolumen frazy'
+        verbose_name_plural = 'Wolumeny fraz'
+
+    def __str__(self):
+        return f"{self.phrase} @ {self.location_code} ({self.month:%m.%Y}): {self.search_volume}"
+
+
+class KeywordVolumeTask(models.Model):
+    """Zadanie search_volume w kolejce standard DataForSEO (task_post → tasks_ready → task_get).
+    Zapisujemy ID zaraz po wysłaniu — poller odbiera wyniki także po restarcie workera."""
+    STATUS_PENDING = 'pending'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Oczekuje'),
+        (STATUS_DONE, 'Odebrane'),
+        (STATUS_FAILED, 'Błąd'),
+    ]
+
+    task_id = models.CharField(max_length=100, unique=True)
+    voivodeship = models.ForeignKey(
+        Voivodeship, on_delete=models.CASCADE, null=True, blank=True, related_name='volume_tasks',
+    )
+    location_code = models.IntegerField()
+    language = models.CharField(max_length=30)
+    phrases = models.JSONField(default=list)  # klucze fraz (volume_key) wysłane w zadaniu
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    error = models.TextField(blank=True)
+    posted_at = models.DateTimeField(auto_now_add=True)
+    collected_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['posted_at']
+        verbose_name = 'Zadanie wolumenów'
+        verbose_name_plural = 'Zadania wolumenów'
+
+    def __str__(self):
+        return f"{self.task_id} ({len(self.phrases)} fraz, {self.get_status_display()})"
+
+
 class ClientRankSnapshot(models.Model):
     """Zamrozony stan pozycji fraz klienta w danym miesiacu."""
     lead = models.ForeignKey(Lead, on_delete=models.CASCADE, related_name='rank_snapshots')
@@ -1107,12 +1283,21 @@ class GBPMetricsSnapshot(models.Model):
         verbose_name='Źródło',
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    # Dzienne: ostatni zapis z API. Miesięczne: moment przeliczenia sumy (NULL = do przeliczenia)
+    updated_at = models.DateTimeField(auto_now=True, null=True)
 
     class Meta:
         ordering = ['-year', '-month', '-day']
         verbose_name = 'Metryki GBP'
         verbose_name_plural = 'Metryki GBP'
         unique_together = [('lead', 'year', 'month', 'day', 'source')]
+        indexes = [
+            # Zakresy miesięcy po jednym wyrażeniu (gbp_metrics_query.month_ordinal)
+            models.Index(
+                models.F('lead'), models.F('year') * 12 + models.F('month'),
+                name='gbp_metrics_lead_month_idx',
+            ),
+        ]
 
     def __str__(self):
         if self.day:
@@ -1124,4 +1309,232 @@ class GBPMetricsSnapshot(models.Model):
         import calendar
         if self.day:
             return f"{self.day:02d} {calendar.month_abbr[self.month]} {self.year}"
-        return f"{calendar.month_abbr[self.month]} {self.year}"
\ No newline at end of file
+        return f"{calendar.month_abbr[self.month]} {self.year}"
+
+class GBPUnavailableDay(models.Model):
+    """
+    Dzień, dla którego Performance API nie zwróciło danych mimo zapytania.
+    Po kilku pustych próbach nocny task przestaje o niego pytać.
+    """
+    lead = models.ForeignKey(
+        Lead,
+        on_delete=models.CASCADE,
+        related_name='gbp_unavailable_days',
+        verbose_name='Klient',
+    )
+    date = models.DateField(verbose_name='Dzień')
+    attempts = models.PositiveSmallIntegerField(default=1, verbose_name='Puste odpowiedzi')
+    last_checked_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-date']
+        verbose_name = 'Niedostępny dzień GBP'
+        verbose_name_plural = 'Niedostępne dni GBP'
+        unique_together = [('lead', 'date')]
+
+    def __str__(self):
+        return f"{self.lead.name} — {self.date} ({self.attempts}x)"
+
+
+class GBPBackfill(models.Model):
+    """
+    Kursor wstecznego pobierania historii metryk GBP jednego klienta.
+    Zakres idzie od najstarszego dnia do najnowszego paczkami; `cursor`
+    to pierwszy jeszcze niepobrany dzień — po restarcie workera praca
+    jest wznawiana od niego.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'W toku'),
+        (STATUS_DONE, 'Zakończony'),
+        (STATUS_FAILED, 'Błąd'),
+    ]
+
+    lead = models.OneToOneField(
+        Lead,
+        on_delete=models.CASCADE,
+        related_name='gbp_backfill',
+        verbose_name='Klient',
+    )
+    date_from = models.DateField(verbose_name='Od')
+    date_to = models.DateField(verbose_name='Do')
+    cursor = models.DateField(verbose_name='Następny dzień')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    chunks_done = models.IntegerField(default=0)
+    days_saved = models.IntegerField(default=0)
+    errors = models.IntegerField(default=0)  # kolejne nieudane paczki
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Backfill metryk GBP'
+        verbose_name_plural = 'Backfille metryk GBP'
+
+    def __str__(self):
+        return f"{self.lead.name} — {self.cursor} / {self.date_to} ({self.get_status_display()})"
+
+    @property
+    def progress(self):
+        """Postęp w procentach (dni przed kursorem / cały zakres)."""
+        from datetime import timedelta
+        total = (self.date_to - self.date_from).days + 1
+        done = (min(self.cursor, self.date_to + timedelta(days=1)) - self.date_from).days
+        return round(100 * done / total) if total > 0 else 100
+
+
+class GBPMetricsMonth(models.Model):
+    """
+    Dzienne metryki GBP z API spakowane w jeden wiersz na klienta i miesiąc.
+    `data` to tablica int32 (metryki × 31 dni), little-endian; -1 = brak danych
+    za dany dzień. Odczyt i zapis przez leads.services.gbp_series.
+    """
+    lead = models.ForeignKey(
+        Lead,
+        on_delete=models.CASCADE,
+        related_name='gbp_metric_months',
+        verbose_name='Klient',
+    )
+    year = models.IntegerField(verbose_name='Rok')
+    month = models.IntegerField(verbose_name='Miesiąc')
+    data = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-year', '-month']
+        verbose_name = 'Metryki GBP (miesiąc)'
+        verbose_name_plural = 'Metryki GBP (miesiące)'
+        unique_together = [('lead', 'year', 'month')]
+
+    def __str__(self):
+        return f"{self.lead.name} — {self.month:02d}/{self.year}"
+
+
+class GBPLocation(models.Model):
+    """
+    Rejestr wizytówek Google Business Profile dostępnych na koncie.
+    Odświeżany z API (leads.services.gbp_locations.refresh_registry) — codziennie
+    i na żądanie; publikacja postów i metryki biorą stąd pełną ścieżkę
+    accounts/X/locations/Y bez zapytań do Account Management API.
+    """
+    location_id = models.CharField(max_length=50, unique=True, verbose_name='ID lokalizacji')
+    account_name = models.CharField(max_length=100, verbose_name='Konto')  # accounts/XXX
+    title = models.CharField(max_length=255, blank=True, verbose_name='Nazwa')
+    address = models.CharField(max_length=500, blank=True, verbose_name='Adres')
+    website = models.URLField(max_length=500, blank=True, verbose_name='Witryna')
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['title']
+        verbose_name = 'Lokalizacja GBP'
+        verbose_name_plural = 'Lokalizacje GBP'
+
+    def __str__(self):
+        return self.title or self.name
+
+    @property
+    def name(self):
+        """Format Performance API: locations/YYY."""
+        return f'locations/{self.location_id}'
+
+    @property
+    def full_name(self):
+        """Format My Business v4 (posty): accounts/XXX/locations/YYY."""
+        return f'{self.account_name}/locations/{self.location_id}'
+
+
+class GBPHealth(models.Model):
+    """
+    Kondycja metryk GBP klienta — liczona zbiorczo dla wszystkich klientów
+    (leads.services.gbp_health). Lista klientów sortuje po `score`.
+    """
+    lead = models.OneToOneField(
+        Lead,
+        on_delete=models.CASCADE,
+        related_name='gbp_health',
+        verbose_name='Klient',
+    )
+    as_of = models.DateField(verbose_name='Dane do dnia')
+    interactions_7d = models.IntegerField(default=0, verbose_name='Interakcje (7 dni)')
+    wow_change = models.FloatField(null=True, blank=True, verbose_name='Zmiana tydzień do tygodnia (%)')
+    mom_change = models.FloatField(null=True, blank=True, verbose_name='Zmiana 28 dni do 28 dni (%)')
+    score = models.FloatField(default=0, verbose_name='Wymaga uwagi')  # im wyżej, tym gorzej
+    flags = models.JSONField(default=list, blank=True)  # np. ['calls_collapse', 'no_data']
+    metrics = models.JSONField(default=dict, blank=True)  # {metryka: {last_7d, wow, mom, baseline, z}}
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-score']
+        verbose_name = 'Kondycja GBP'
+        verbose_name_plural = 'Kondycja GBP'
+
+    def __str__(self):
+        return f"{self.lead.name} — {self.score:.1f}"
+
+
+class GBPFetchRun(models.Model):
+    """
+    Jeden nocny przebieg pobierania metryk GBP (okno = dzień uruchomienia).
+    Klienci są pobierani w osobnych subtaskach; ponowne uruchomienie w tym samym
+    oknie wznawia przebieg i pomija klientów, którzy już są gotowi.
+    """
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_PARTIAL = 'partial'
+    STATUS_CHOICES = [
+        (STATUS_RUNNING, 'W toku'),
+        (STATUS_DONE, 'Zakończony'),
+        (STATUS_PARTIAL, 'Zakończony z błędami'),
+    ]
+
+    window = models.DateField(unique=True, verbose_name='Okno')
+    date_from = models.DateField()
+    date_to = models.DateField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_RUNNING)
+    clients = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+    rows_written = models.IntegerField(default=0)
+    report = models.JSONField(default=dict, blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-window']
+        verbose_name = 'Przebieg metryk GBP'
+        verbose_name_plural = 'Przebiegi metryk GBP'
+
+    def __str__(self):
+        return f"{self.window} ({self.get_status_display()})"
+
+
+class GBPFetchRunItem(models.Model):
+    """Stan pobrania jednego klienta w przebiegu GBPFetchRun."""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Oczekuje'),
+        (STATUS_RUNNING, 'W toku'),
+        (STATUS_DONE, 'Gotowy'),
+        (STATUS_FAILED, 'Błąd'),
+    ]
+
+    run = models.ForeignKey(GBPFetchRun, on_delete=models.CASCADE, related_name='items')
+    lead = models.ForeignKey(Lead, on_delete=models.CASCADE, related_name='gbp_fetch_items')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.IntegerField(default=0)
+    rows_written = models.IntegerField(default=0)
+    duration = models.FloatField(null=True, blank=True)  # sekundy ostatniej próby
+    error = models.TextField(blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = [('run', 'lead')]
+
+    def __str__(self):
+        return f"{self.run.window} — {self.lead.name} ({self.get_status_display()})"
@@ -0,0 +1,251 @@
+"""
+Wspólny klient DataForSEO dla wszystkich wywołań API.
+
+Jedna sesja requests na proces (keep-alive, pula połączeń) zamiast nowego
+połączenia TCP/TLS przy każdym zapytaniu. Każde zapytanie przechodzi przez
+limiter 'dataforseo' i tę samą politykę ponowień z wykładniczym opóźnieniem
+(1s, 2s, 4s + losowy rozrzut):
+  - błąd nawiązania połączenia (ConnectTimeout, NewConnectionError) i 429 — zawsze
+    (serwer nie przyjął zapytania),
+  - pozostałe błędy połączenia (zerwane keep-alive, RemoteDisconnected po wysłaniu
+    treści), timeout odczytu i 5xx — tylko GET. POST-y (task_post, live) są płatne
+    i nieidempotentne: serwer mógł je przyjąć, więc ponowienie to podwójny
+    koszt albo zdublowane zadania. Wywołujący może je włączyć: post(..., retry=True).
+
+Obsługa statusów: błąd HTTP → requests.HTTPError, status_code odpowiedzi
+różny od 20000 (np. 40100 — złe dane logowania, 40200 — brak środków)
+→ DataForSEOError. Statusy pojedynczych zadań (20100, 40602 itd.) sprawdza wywołujący.
+
+Dla każdego endpointu zbieramy liczbę zapytań, błędów i ponowień, czas odpowiedzi
+i koszt (pole `cost` z odpowiedzi) — endpoint_stats(). Liczniki dnia są w cache
+'shared' (INCR per endpoint), wspólne dla workerów Celery i procesu web; bez Redisa
+liczymy lokalnie w procesie.
+"""
+import base64
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from .rate_limit import CACHE_ALIAS, get_limiter
+
+logger = logging.getLogger(__name__)
+
+# Statusy HTTP po których ponawiamy zapytanie (z rosnącym opóźnieniem)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# ...także POST — 429 oznacza, że zapytanie nie zostało przyjęte
+SAFE_RETRY_STATUSES = (429,)
+MAX_RETRIES = 3
+# Połączeń w puli — tyle, ile wątków równoległego sprawdzania pozycji
+POOL_SIZE = 16
+
+STATUS_OK = 20000
+
+
+class DataForSEOError(Exception):
+    """Odpowiedź DataForSEO ze statusem innym niż 20000."""
+
+    def __init__(self, status_code, message):
+        super().__init__(f'{status_code}: {message}')
+        self.status_code = status_code
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+# Statystyki: liczniki całkowite (INCR) — czas w ms, koszt w milionowych częściach dolara
+STATS_PREFIX = 'dataforseo:stats'
+STATS_FIELDS = ('calls', 'errors', 'retries', 'latency_ms', 'latency_max_ms', 'cost_micro')
+STATS_TTL = 2 * 24 * 3600
+# Po błędzie cache liczymy lokalnie przez tyle sekund, zanim znów spróbujemy Redisa
+STATS_CACHE_RETRY_AFTER = 30
+
+_stats = {}
+_stats_lock = threading.Lock()
+_stats_degraded_until = 0.0
+
+
+def get_session():
+    """Sesja z pulą połączeń, wspólna dla wątków procesu (nowa po forku workera Celery)."""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session, _session_pid = session, os.getpid()
+        return _session
+
+
+def _not_sent(error):
+    """True, gdy zapytanie na pewno nie dotarło do serwera (nie udało się nawiązać połączenia)."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    # requests.ConnectionError opakowuje MaxRetryError z przyczyną w .reason
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def _stats_prefix(day=None):
+    return f'{STATS_PREFIX}:{(day or timezone.localdate()).isoformat()}'
+
+
+def _record_shared(endpoint, values):
+    cache = caches[CACHE_ALIAS]
+    prefix = _stats_prefix()
+    if cache.add(f'{prefix}:{endpoint}:seen', 1, STATS_TTL):
+        # Pierwsze zapytanie endpointu w tym dniu — dopisujemy go do indeksu
+        index = f'{prefix}:endpoints'
+        cache.set(index, sorted(set(cache.get(index) or []) | {endpoint}), STATS_TTL)
+    for field, value in values.items():
+        key = f'{prefix}:{endpoint}:{field}'
+        if field == 'latency_max_ms':
+            if value > (cache.get(key) or 0):
+                cache.set(key, value, STATS_TTL)
+        elif value:
+            cache.add(key, 0, STATS_TTL)
+            cache.incr(key, value)
+
+
+def _record_local(endpoint, values):
+    with _stats_lock:
+        entry = _stats.setdefault(endpoint, dict.fromkeys(STATS_FIELDS, 0))
+        for field, value in values.items():
+            entry[field] = max(entry[field], value) if field == 'latency_max_ms' else entry[field] + value
+
+
+def _record(endpoint, latency, cost=0, error=False, retries=0):
+    global _stats_degraded_until
+    latency_ms = round(latency * 1000)
+    values = {
+        'calls': 1, 'errors': int(error), 'retries': retries,
+        'latency_ms': latency_ms, 'latency_max_ms': latency_ms, 'cost_micro': round((cost or 0) * 1_000_000),
+    }
+    if time.monotonic() >= _stats_degraded_until:
+        try:
+            return _record_shared(endpoint, values)
+        except Exception as e:
+            logger.warning(f'[DataForSEO] cache niedostępny, statystyki lokalne procesu: {e}')
+            _stats_degraded_until = time.monotonic() + STATS_CACHE_RETRY_AFTER
+    _record_local(endpoint, values)
+
+
+def _read_shared():
+    cache = caches[CACHE_ALIAS]
+    prefix = _stats_prefix()
+    endpoints = cache.get(f'{prefix}:endpoints') or []
+    values = cache.get_many([f'{prefix}:{endpoint}:{field}' for endpoint in endpoints for field in STATS_FIELDS])
+    return {
+        endpoint: {field: values.get(f'{prefix}:{endpoint}:{field}', 0) for field in STATS_FIELDS}
+        for endpoint in endpoints
+    }
+
+
+def endpoint_stats():
+    """
+    {endpoint: {'calls', 'errors', 'retries', 'latency_avg', 'latency_max', 'cost'}} — od początku dnia,
+    ze wszystkich procesów (cache 'shared'); bez Redisa — z tego procesu.
+    """
+    try:
+        entries = _read_shared()
+    except Exception:
+        with _stats_lock:
+            entries = {endpoint: dict(entry) for endpoint, entry in _stats.items()}
+    return {
+        endpoint: {
+            'calls': entry['calls'],
+            'errors': entry['errors'],
+            'retries': entry['retries'],
+            'latency_avg': round(entry['latency_ms'] / entry['calls'] / 1000, 3) if entry['calls'] else 0,
+            'latency_max': round(entry['latency_max_ms'] / 1000, 3),
+            'cost': round(entry['cost_micro'] / 1_000_000, 4),
+        }
+        for endpoint, entry in sorted(entries.items())
+    }
+
+
+def reset_stats():
+    global _stats_degraded_until
+    with _stats_lock:
+        _stats.clear()
+        _stats_degraded_until = 0.0
+    try:
+        cache = caches[CACHE_ALIAS]
+        prefix = _stats_prefix()
+        endpoints = cache.get(f'{prefix}:endpoints') or []
+        cache.delete_many([f'{prefix}:endpoints'] + [
+            f'{prefix}:{endpoint}:{field}' for endpoint in endpoints for field in STATS_FIELDS + ('seen',)
+        ])
+    except Exception:
+        pass
+
+
+class DataForSEOClient:
+    """
+    Klient dla jednego konta: client.post('serp/google/maps/task_post', [payload, ...]),
+    client.get('serp/google/maps/task_get/advanced', task_id). Zwraca sparsowany JSON.
+    Adres API z settings.DATAFORSEO_API_BASE (w testach — lokalny serwer HTTP).
+    Statystyki liczone są per endpoint (bez ID zadania w ścieżce).
+    """
+
+    def __init__(self, login, password, base_url=None):
+        credentials = base64.b64encode(f"{login}:{password}".encode()).decode()
+        self.headers = {"Authorization": f"Basic {credentials}", "Content-Type": "application/json"}
+        self.base_url = (base_url or settings.DATAFORSEO_API_BASE).rstrip('/')
+
+    def post(self, endpoint, payload, timeout=60, retry=False):
+        return self.request('post', endpoint, json=payload, timeout=timeout, retry=retry)
+
+    def get(self, endpoint, *path, timeout=60):
+        return self.request('get', endpoint, *path, timeout=timeout, retry=True)
+
+    def request(self, method, endpoint, *path, json=None, timeout=60, retry=None):
+        """
+        retry — ponawiać także po timeoutach odczytu i 5xx (domyślnie tylko GET).
+        Błędy nawiązania połączenia i 429 ponawiamy zawsze.
+        """
+        url = '/'.join([self.base_url, endpoint, *map(str, path)])
+        limiter = get_limiter('dataforseo')
+        session = get_session()
+        send = session.post if method == 'post' else session.get
+        kwargs = {'json': json} if method == 'post' else {}
+        retry = method == 'get' if retry is None else retry
+        retry_statuses = RETRY_STATUSES if retry else SAFE_RETRY_STATUSES
+        started = time.monotonic()
+
+        for attempt in range(MAX_RETRIES + 1):
+            limiter.acquire()
+            try:
+                response = send(url, headers=self.headers, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == MAX_RETRIES or not (retry or _not_sent(e)):
+                    _record(endpoint, time.monotonic() - started, error=True, retries=attempt)
+                    raise
+            else:
+                if response.status_code not in retry_statuses or attempt == MAX_RETRIES:
+                    break
+                logger.warning(f'[DataForSEO] {endpoint}: HTTP {response.status_code} — ponawiam ({attempt + 1}/{MAX_RETRIES})')
+            time.sleep(2 ** attempt + random.random())
+
+        try:
+            response.raise_for_status()
+            data = response.json()
+            status = data.get('status_code', STATUS_OK)
+            if status != STATUS_OK:
+                raise DataForSEOError(status, data.get('status_message'))
+        except Exception:
+            _record(endpoint, time.monotonic() - started, error=True, retries=attempt)
+            raise
+        cost = data.get('cost')
+        _record(endpoint, time.monotonic() - started, cost=cost if isinstance(cost, (int, float)) else 0, retries=attempt)
+        return data
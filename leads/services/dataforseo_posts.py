@@ -1,8 +1,8 @@
-import requests
-import base64
 import time
 from datetime import datetime
 
+from .dataforseo_client import DataForSEOClient
+
 
 def fetch_posts(keyword, login, password):
     """
@@ -14,18 +14,13 @@ def fetch_posts(keyword, login, password):
     if not keyword or not login or not password:
         return None
 
-    credentials = base64.b64encode(f"{login}:{password}".encode()).decode()
-    headers = {
-        "Authorization": f"Basic {credentials}",
-        "Content-Type": "application/json",
-    }
+    client = DataForSEOClient(login, password)
 
     # Krok 1: Utworz zadanie
     try:
-        r = requests.post(
-            "https://api.dataforseo.com/v3/business_data/google/my_business_updates/task_post",
-            headers=headers,
-            json=[{
+        data = client.post(
+            'business_data/google/my_business_updates/task_post',
+            [{
                 "keyword": keyword,
                 "location_name": "Poland",
                 "language_name": "Polish",
@@ -33,8 +28,7 @@ def fetch_posts(keyword, login, password):
             }],
             timeout=30,
         )
-        r.raise_for_status()
-        task = r.json().get('tasks', [{}])[0]
+        task = data.get('tasks', [{}])[0]
         task_id = task.get('id')
         if not task_id:
             return None
@@ -45,13 +39,8 @@ def fetch_posts(keyword, login, password):
     for attempt in range(9):
         time.sleep(10)
         try:
-            r2 = requests.get(
-                f"https://api.dataforseo.com/v3/business_data/google/my_business_updates/task_get/{task_id}",
-                headers=headers,
-                timeout=30,
-            )
-            r2.raise_for_status()
-            task_result = r2.json().get('tasks', [{}])[0]
+            data = client.get('business_data/google/my_business_updates/task_get', task_id, timeout=30)
+            task_result = data.get('tasks', [{}])[0]
             status_code = task_result.get('status_code')
 
             if status_code == 20000:
@@ -0,0 +1,322 @@
+"""
+Sprawdzanie pozycji fraz w Google przez DataForSEO SERP API.
+
+Dwa tryby:
+- live     — jedno blokujące zapytanie `.../live/advanced` na frazę
+- standard — kolejka DataForSEO: task_post (do 100 zadań w jednym requeście)
+             → tasks_ready → task_get. Tańsze i nie blokuje workera na każdej frazie.
+
+Wspólne są budowanie payloadu i dopasowanie wizytówki w wynikach,
+żeby oba tryby zapisywały identyczne pozycje.
+"""
+import hashlib
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from django.conf import settings
+
+from .dataforseo_client import DataForSEOClient
+from .maps_cid_extractor import extract_cid_from_maps_url
+from .singleflight import single_flight
+
+logger = logging.getLogger(__name__)
+
+ENGINE_MAPS = 'maps'
+ENGINE_ORGANIC = 'organic'
+
+# task_post przyjmuje max 100 zadań w jednym requeście
+TASK_POST_LIMIT = 100
+
+
+def lead_cid_number(lead):
+    """CID wizytówki z linku Google Maps (int) albo None."""
+    cid_str = extract_cid_from_maps_url(lead.google_maps_url)
+    if cid_str and cid_str.startswith('cid:'):
+        try:
+            return int(cid_str[4:])
+        except ValueError:
+            pass
+    return None
+
+
+def lead_website_domain(lead):
+    """Domena strony WWW leada do dopasowania w organicznym SERP albo None."""
+    if not lead.website:
+        return None
+    parsed = urlparse(lead.website if lead.website.startswith('http') else f'http://{lead.website}')
+    return parsed.netloc.lower().lstrip('www.')
+
+
+def build_rank_payload(lead, phrase):
+    """
+    Zwraca (engine, payload) dla jednej frazy leada.
+    Cały kraj → organiczny SERP, inaczej Google Maps z GPS lokalu / miasta.
+    """
+    if lead.keyword_search_nationwide:
+        return ENGINE_ORGANIC, {
+            "keyword": phrase,
+            "language_name": "Polish",
+            "location_name": "Poland",
+            "depth": 100,
+        }
+
+    payload = {
+        "keyword": phrase,
+        "language_name": "Polish",
+        "depth": 20,
+    }
+    # Priorytet: GPS lokalu > GPS miasta > nazwa kraju
+    if lead.location_coordinate:
+        payload["location_coordinate"] = lead.location_coordinate
+    elif lead.city.location_coordinate:
+        payload["location_coordinate"] = lead.city.location_coordinate
+    else:
+        payload["location_name"] = "Poland"
+    return ENGINE_MAPS, payload
+
+
+def find_position(lead, engine, items, cid_number=None, website_domain=None):
+    """Szuka wizytówki leada w wynikach SERP. Zwraca rank_absolute albo None."""
+    if engine == ENGINE_ORGANIC:
+        for item in items:
+            if item.get('type') != 'organic':
+                continue
+            item_url = (item.get('url') or '').lower()
+            item_domain = (item.get('domain') or '').lower().lstrip('www.')
+            # Dopasuj po domenie strony WWW lub nazwie firmy w URL
+            domain_match = website_domain and (website_domain in item_domain or item_domain in website_domain)
+            name_match = lead.name.lower() in item_url
+            if domain_match or name_match:
+                return item.get('rank_absolute')
+        return None
+
+    for item in items:
+        item_cid = item.get('cid')
+        cid_match = cid_number and (
+            item_cid == cid_number or
+            str(item_cid) == str(cid_number)
+        )
+        name_match = not cid_number and lead.name.lower() in (item.get('title') or '').lower()
+        if cid_match or name_match:
+            return item.get('rank_absolute')
+    return None
+
+
+# Pola z items SERP potrzebne do dopasowania wizytówki — resztę odrzucamy przed zapisem
+_ITEM_FIELDS = ('type', 'rank_absolute', 'cid', 'title', 'domain', 'url')
+
+
+def serp_key(engine, payload):
+    """Klucz SERP-a w magazynie: (fraza, lokalizacja, głębokość, silnik). Dzień dokłada wywołujący."""
+    return {
+        'phrase': payload['keyword'].strip().lower(),
+        'engine': engine,
+        'location': payload.get('location_coordinate') or payload.get('location_name') or '',
+        'depth': payload['depth'],
+    }
+
+
+def serp_key_tag(key):
+    """Krótki, stabilny identyfikator klucza — używany jako 'tag' zadań w kolejce standard."""
+    raw = json.dumps(key, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def compact_items(items):
+    return [{f: item.get(f) for f in _ITEM_FIELDS if item.get(f) is not None} for item in items]
+
+
+def get_stored_items(keys, day):
+    """
+    Items z magazynu SERP dla wielu kluczy naraz (jedno zapytanie).
+    keys: {tag: klucz}. Zwraca {tag: items} tylko dla SERP-ów już pobranych tego dnia.
+    """
+    from leads.models import SerpSnapshot
+    if not keys:
+        return {}
+    rows = (
+        SerpSnapshot.objects
+        .filter(day=day, phrase__in={key['phrase'] for key in keys.values()})
+        .values('phrase', 'engine', 'location', 'depth', 'items')
+    )
+    stored = {}
+    for row in rows:
+        items = row.pop('items')
+        tag = serp_key_tag(row)
+        if tag in keys:
+            stored[tag] = items
+    return stored
+
+
+def competitor_positions(key, items, day):
+    """
+    Pozycje konkurencji z jednego SERP-a (niezapisane obiekty SerpCompetitorPosition).
+    W organicznym SERP bierzemy tylko wyniki 'organic' — jak przy dopasowaniu klienta.
+    """
+    from leads.models import SerpCompetitorPosition
+    positions = []
+    for item in items:
+        rank = item.get('rank_absolute')
+        if not rank:
+            continue
+        if key['engine'] == ENGINE_ORGANIC and item.get('type') != 'organic':
+            continue
+        rating = item.get('rating') or {}
+        positions.append(SerpCompetitorPosition(
+            phrase=key['phrase'],
+            engine=key['engine'],
+            location=key['location'],
+            day=day,
+            rank=rank,
+            cid=str(item.get('cid') or ''),
+            domain=(item.get('domain') or '').lower()[:255],
+            title=(item.get('title') or '')[:255],
+            rating=rating.get('value'),
+            reviews_count=rating.get('votes_count'),
+        ))
+    return positions
+
+
+def store_items(entries, day):
+    """
+    Zapisuje SERP-y w magazynie i pozycje konkurencji — po jednym bulk_create.
+    entries: lista (klucz, items). Równoległy zapis tego samego klucza jest ignorowany.
+    """
+    from leads.models import SerpSnapshot, SerpCompetitorPosition
+    if not entries:
+        return
+    SerpSnapshot.objects.bulk_create(
+        [SerpSnapshot(day=day, items=compact_items(items), **key) for key, items in entries],
+        ignore_conflicts=True,
+    )
+    SerpCompetitorPosition.objects.bulk_create(
+        [position for key, items in entries for position in competitor_positions(key, items, day)],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def _task_items(task):
+    """Wyciąga listę items z pojedynczego zadania w odpowiedzi DataForSEO."""
+    result = task.get('result') or [{}]
+    return (result[0] or {}).get('items') or []
+
+
+def fetch_live(engine, payload, login, password):
+    """Tryb live — jedno zapytanie, zwraca listę items z SERP.
+    Identyczne równoczesne zapytania (np. podwójne kliknięcie) idą do API raz."""
+    def fetch():
+        data = DataForSEOClient(login, password).post(f'serp/google/{engine}/live/advanced', [payload])
+        return _task_items(data.get('tasks', [{}])[0])
+
+    return single_flight(f'serp/google/{engine}/live/advanced', payload, fetch)
+
+
+def fetch_live_many(requests_by_tag, login, password, max_workers=1):
+    """
+    Pobiera wiele SERP-ów w trybie live na puli wątków (max_workers).
+    requests_by_tag: {tag: (engine, payload)}.
+    Zwraca {tag: items}; SERP-y z błędem mają None.
+    Wątki wykonują tylko HTTP — zapis do bazy robi wywołujący.
+    """
+    def fetch(tag):
+        engine, payload = requests_by_tag[tag]
+        try:
+            return tag, fetch_live(engine, payload, login, password)
+        except Exception as e:
+            logger.error(f'[SERP] błąd live "{payload.get("keyword")}": {e}')
+            return tag, None
+
+    if not requests_by_tag:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        return dict(pool.map(fetch, list(requests_by_tag)))
+
+
+def post_tasks(engine, payloads, login, password):
+    """
+    Wysyła zadania do kolejki standard (po 100 w jednym requeście).
+    Każdy payload musi mieć unikalny 'tag' — po nim mapujemy wyniki.
+    Zwraca słownik {tag: task_id} tylko dla przyjętych zadań.
+    """
+    task_ids = {}
+    client = DataForSEOClient(login, password)
+    for i in range(0, len(payloads), TASK_POST_LIMIT):
+        chunk = payloads[i:i + TASK_POST_LIMIT]
+        try:
+            data = client.post(f'serp/google/{engine}/task_post', chunk)
+            for task in data.get('tasks') or []:
+                # 20100 = Task Created
+                if task.get('status_code') != 20100 or not task.get('id'):
+                    logger.warning(f'[SERP queue] odrzucone zadanie: {task.get("status_code")} {task.get("status_message")}')
+                    continue
+                tag = (task.get('data') or {}).get('tag')
+                if tag:
+                    task_ids[tag] = task['id']
+        except Exception as e:
+            logger.error(f'[SERP queue] błąd task_post {engine} chunk {i}: {e}')
+    return task_ids
+
+
+def get_ready_task_ids(engine, login, password):
+    """Zwraca zbiór ID zadań gotowych do odebrania (tasks_ready)."""
+    data = DataForSEOClient(login, password).get(f'serp/google/{engine}/tasks_ready')
+    ready = set()
+    for task in data.get('tasks') or []:
+        for item in task.get('result') or []:
+            if item.get('id'):
+                ready.add(item['id'])
+    return ready
+
+
+def get_task_items(engine, task_id, login, password):
+    """Pobiera wynik gotowego zadania (task_get). Zwraca items albo None przy błędzie."""
+    data = DataForSEOClient(login, password).get(f'serp/google/{engine}/task_get/advanced', task_id)
+    task = (data.get('tasks') or [{}])[0]
+    if task.get('status_code') != 20000:
+        logger.warning(f'[SERP queue] task_get {task_id}: {task.get("status_code")} {task.get("status_message")}')
+        return None
+    return _task_items(task)
+
+
+def collect_tasks(engine, task_ids, login, password, poll_interval=None, max_wait=None):
+    """
+    Odbiera wyniki zadań z kolejki standard — polling tasks_ready aż wszystkie
+    będą gotowe albo minie max_wait sekund.
+    Zwraca słownik {task_id: items}; zadania nieodebrane lub z błędem mają None.
+    """
+    poll_interval = poll_interval if poll_interval is not None else settings.DATAFORSEO_TASK_POLL_INTERVAL
+    max_wait = max_wait if max_wait is not None else settings.DATAFORSEO_TASK_MAX_WAIT
+
+    pending = set(task_ids)
+    results = {}
+    started = time.monotonic()
+
+    while pending:
+        try:
+            ready = get_ready_task_ids(engine, login, password) & pending
+        except Exception as e:
+            logger.warning(f'[SERP queue] błąd tasks_ready {engine}: {e}')
+            ready = set()
+
+        for task_id in ready:
+            try:
+                results[task_id] = get_task_items(engine, task_id, login, password)
+            except Exception as e:
+                logger.error(f'[SERP queue] błąd task_get {task_id}: {e}')
+                results[task_id] = None
+            pending.discard(task_id)
+
+        if not pending:
+            break
+        if time.monotonic() - started >= max_wait:
+            logger.warning(f'[SERP queue] timeout {engine} — nieodebranych zadań: {len(pending)}')
+            break
+        time.sleep(poll_interval)
+
+    for task_id in pending:
+        results[task_id] = None
+    return results
@@ -1,11 +1,161 @@
 import logging
+import re
+from datetime import timedelta
+
 import requests
-import base64
+from django.conf import settings
+from django.utils import timezone
+
+from ..constants import POLAND_LOCATION_CODE, get_dataforseo_location_code
+from .dataforseo_client import DataForSEOClient, DataForSEOError
 
 logger = logging.getLogger(__name__)
 
+SEARCH_VOLUME_ENDPOINT = 'keywords_data/google_ads/search_volume/live'
+# Kolejka standard: task_post → tasks_ready → task_get/{id}
+SEARCH_VOLUME_QUEUE = 'keywords_data/google_ads/search_volume'
+# task_post przyjmuje max 100 zadań w jednym requeście
+TASK_POST_LIMIT = 100
+# google_ads/search_volume/live przyjmuje max 1000 fraz naraz
+CHUNK_SIZE = 1000
+# Wierszy VoivodeshipKeyword na jedno UPDATE w bulk_update
+UPDATE_BATCH_SIZE = 1000
+
+
+def clean_phrase(phrase):
+    """Fraza bez znaków, przez które DataForSEO odrzuca cały batch."""
+    phrase = phrase.strip()
+    phrase = phrase.strip('.,;:!?()[]{}"\'')
+    phrase = re.sub(r'[^\w\s\-]', '', phrase, flags=re.UNICODE)
+    return phrase.strip()
+
+
+def volume_key(phrase):
+    """Klucz frazy w cache KeywordVolume (oczyszczona, małe litery)."""
+    return clean_phrase(phrase).lower()
+
+
+def data_month(now=None):
+    """Pierwszy dzień bieżącego miesiąca — miesiąc danych Google Ads, do którego przypisujemy wolumen."""
+    return (now or timezone.now()).date().replace(day=1)
+
+
+def cached_volumes(keys, location_code, language_name="Polish"):
+    """
+    {klucz: volume} z cache dla bieżącego miesiąca danych, nie starsze niż
+    KEYWORD_VOLUME_CACHE_DAYS. Jedno zapytanie; brak klucza = trzeba pytać API.
+    """
+    from leads.models import KeywordVolume
+
+    now = timezone.now()
+    return dict(
+        KeywordVolume.objects
+        .filter(
+            phrase__in=list(keys),
+            location_code=location_code,
+            language=language_name,
+            month=data_month(now),
+            fetched_at__gte=now - timedelta(days=settings.KEYWORD_VOLUME_CACHE_DAYS),
+        )
+        .values_list('phrase', 'search_volume')
+    )
+
+
+def store_volumes(volumes, location_code, language_name="Polish"):
+    """Zapisuje {klucz: volume} do cache jednym upsertem."""
+    from leads.models import KeywordVolume
+
+    month = data_month()
+    KeywordVolume.objects.bulk_create(
+        [
+            KeywordVolume(
+                phrase=key[:200], location_code=location_code, language=language_name,
+                month=month, search_volume=volume,
+            )
+            for key, volume in volumes.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['phrase', 'location_code', 'language', 'month'],
+        update_fields=['search_volume', 'fetched_at'],
+    )
+
 
-def fetch_keyword_volumes(phrases, login, password, location_code=2616, language_name="Polish"):
+def _task_volumes(task):
+    """{klucz: volume} z wyniku jednego zadania search_volume (live albo task_get); wyjątek przy błędzie zadania."""
+    task_status = task.get("status_code")
+    if task_status != 20000:
+        raise ValueError(f'task status {task_status}: {task.get("status_message")} | data: {task.get("data")}')
+
+    # google_ads/search_volume zwraca result jako plaska lista obiektow
+    items = task.get("result") or []
+    logger.info(f'[volumes] task OK, items={len(items)}, pierwszy={items[0] if items else None}')
+    volumes = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        keyword = item.get("keyword", "")
+        if keyword:
+            volumes[volume_key(keyword)] = item.get("search_volume")
+    return volumes
+
+
+def _request_volumes(client, chunk, location_code, language_name):
+    """Jedno zapytanie do API. Zwraca {klucz: volume}; wyjątek, gdy task się nie udał."""
+    data = client.post(SEARCH_VOLUME_ENDPOINT, [{
+        "keywords": chunk,
+        "location_code": location_code,
+        "language_name": language_name,
+    }])
+
+    tasks = data.get("tasks") or []
+    if not tasks:
+        raise ValueError(f'brak tasks w odpowiedzi: {data}')
+    return _task_volumes(tasks[0])
+
+
+def fetch_keyword_volumes_with_stats(phrases, login, password, location_code=POLAND_LOCATION_CODE, language_name="Polish"):
+    """
+    Jak fetch_keyword_volumes, ale zwraca też podsumowanie:
+    (wynik, {'phrases', 'hits', 'misses', 'fetched', 'failed', 'hit_ratio'}).
+    """
+    keys = {}
+    for phrase in phrases:
+        key = volume_key(phrase)
+        if key:
+            keys.setdefault(key, []).append(phrase)
+
+    known = cached_volumes(keys, location_code, language_name) if keys else {}
+    misses = [key for key in keys if key not in known]
+    stats = {'phrases': len(keys), 'hits': len(known), 'misses': len(misses), 'fetched': 0, 'failed': 0}
+
+    if misses and login and password:
+        client = DataForSEOClient(login, password)
+        for i in range(0, len(misses), CHUNK_SIZE):
+            chunk = misses[i:i + CHUNK_SIZE]
+            try:
+                fetched = _request_volumes(client, chunk, location_code, language_name)
+            except Exception as e:
+                logger.error(f'[volumes] wyjatek w chunk {i}: {e}')
+                stats['failed'] += len(chunk)
+                continue
+            # Fraza bez wyniku w udanej odpowiedzi — zapamiętujemy brak danych, żeby nie kupować jej ponownie
+            fetched = {key: fetched.get(key) for key in chunk}
+            store_volumes(fetched, location_code, language_name)
+            known.update(fetched)
+            stats['fetched'] += len(chunk)
+    elif misses:
+        stats['failed'] = len(misses)
+
+    stats['hit_ratio'] = round(stats['hits'] / stats['phrases'], 3) if stats['phrases'] else 0
+    result = {
+        phrase: known[key]
+        for key, originals in keys.items() if key in known
+        for phrase in originals
+    }
+    return result, stats
+
+
+def fetch_keyword_volumes(phrases, login, password, location_code=POLAND_LOCATION_CODE, language_name="Polish"):
     """
     Pobiera miesięczne wolumeny wyszukiwań dla listy fraz z DataForSEO.
     Endpoint: keywords_data/google_ads/search_volume/live
@@ -15,62 +165,201 @@ def fetch_keyword_volumes(phrases, login, password, location_code=2616, language
         20847-20862 = poszczególne województwa
     Użyj get_dataforseo_location_code() z constants.py żeby pobrać kod dla województwa.
 
+    Najpierw czyta cache KeywordVolume (fraza + lokalizacja + język + miesiąc danych,
+    ważność KEYWORD_VOLUME_CACHE_DAYS) — do API idą tylko frazy, których w nim nie ma.
+
     Zwraca słownik: {fraza: volume_int_or_None}
-    Przy błędzie zwraca pusty słownik.
+    Frazy z nieudanych zapytań nie trafiają do wyniku.
     """
-    if not phrases or not login or not password:
+    if not phrases:
         return {}
+    return fetch_keyword_volumes_with_stats(phrases, login, password, location_code, language_name)[0]
 
-    credentials = base64.b64encode(f"{login}:{password}".encode()).decode()
-    headers = {
-        "Authorization": f"Basic {credentials}",
-        "Content-Type": "application/json",
-    }
 
-    # google_ads/search_volume/live przyjmuje max 1000 fraz naraz
-    CHUNK_SIZE = 1000
-    result = {}
+def save_voivodeship_volumes(keywords, volumes, now=None):
+    """
+    Zapisuje wolumeny do fraz województwa (VoivodeshipKeyword) zbiorczo:
+    frazy z wolumenem — bulk_update po UPDATE_BATCH_SIZE, frazy bez danych —
+    jedno UPDATE samej daty. Frazy spoza `volumes` (błąd API) zostają bez zmian.
+    Zwraca liczbę zapisanych wolumenów.
+    """
+    from leads.models import VoivodeshipKeyword
+
+    now = now or timezone.now()
+    with_volume, without_volume = [], []
+    for kw in keywords:
+        if kw.phrase not in volumes:
+            continue
+        volume = volumes[kw.phrase]
+        kw.searches_updated_at = now
+        if volume is not None:
+            kw.monthly_searches = str(volume)
+            with_volume.append(kw)
+        else:
+            without_volume.append(kw.pk)
+
+    VoivodeshipKeyword.objects.bulk_update(
+        with_volume, ['monthly_searches', 'searches_updated_at'], batch_size=UPDATE_BATCH_SIZE,
+    )
+    if without_volume:
+        VoivodeshipKeyword.objects.filter(pk__in=without_volume).update(searches_updated_at=now)
+    return len(with_volume)
+
+
+# --- Kolejka standard -------------------------------------------------------
+# fetch_keyword_volumes_task wysyła paczki fraz (task_post) i zapisuje ID zadań
+# w KeywordVolumeTask, collect_keyword_volumes_task (beat) odbiera gotowe wyniki.
+# Każde odebrane zadanie od razu trafia do cache i fraz województwa — przerwany
+# worker nie traci opłaconych paczek, a nieodebrane zadania czekają w bazie.
+
+def _voivodeships_for(location_code):
+    """ID województw, których frazy pobieramy z tym location_code (nieznane nazwy → cała Polska)."""
+    from leads.models import Voivodeship
+
+    return [
+        pk for pk, name in Voivodeship.objects.values_list('pk', 'name')
+        if get_dataforseo_location_code(name) == location_code
+    ]
 
-    for i in range(0, len(phrases), CHUNK_SIZE):
-        chunk = phrases[i:i + CHUNK_SIZE]
+
+def _write_back(voivodeship_ids, fetched):
+    """Zapisuje {klucz: volume} do fraz bez wolumenu w podanych województwach. Zwraca liczbę zapisanych wolumenów."""
+    from leads.models import VoivodeshipKeyword
+
+    if not voivodeship_ids:
+        return 0
+    keywords = list(VoivodeshipKeyword.objects.filter(voivodeship_id__in=voivodeship_ids, monthly_searches__isnull=True))
+    volumes = {kw.phrase: fetched[volume_key(kw.phrase)] for kw in keywords if volume_key(kw.phrase) in fetched}
+    return save_voivodeship_volumes(keywords, volumes)
+
+
+def post_volume_tasks(phrases, login, password, location_code=POLAND_LOCATION_CODE, language_name="Polish",
+                      voivodeship=None):
+    """
+    Wysyła do kolejki standard frazy, których nie ma w cache ani w oczekujących zadaniach.
+    Trafienia z cache zapisuje od razu do fraz województwa (jeśli podane).
+    Zwraca podsumowanie: {'phrases', 'hits', 'pending', 'posted', 'tasks', 'failed', 'hit_ratio', 'updated'}.
+    """
+    from leads.models import KeywordVolumeTask
+
+    keys = list(dict.fromkeys(key for key in map(volume_key, phrases) if key))
+    known = cached_volumes(keys, location_code, language_name) if keys else {}
+    pending = {
+        key
+        for task_phrases in KeywordVolumeTask.objects.filter(
+            status=KeywordVolumeTask.STATUS_PENDING, location_code=location_code, language=language_name,
+        ).values_list('phrases', flat=True)
+        for key in task_phrases
+    }
+    to_post = [key for key in keys if key not in known and key not in pending]
+    stats = {
+        'phrases': len(keys), 'hits': len(known), 'pending': len(set(keys) & pending - set(known)),
+        'posted': 0, 'tasks': 0, 'failed': 0,
+        'hit_ratio': round(len(known) / len(keys), 3) if keys else 0,
+        'updated': _write_back([voivodeship.pk], known) if voivodeship and known else 0,
+    }
+
+    chunks = [to_post[i:i + CHUNK_SIZE] for i in range(0, len(to_post), CHUNK_SIZE)]
+    client = DataForSEOClient(login, password)
+    for i in range(0, len(chunks), TASK_POST_LIMIT):
+        batch = chunks[i:i + TASK_POST_LIMIT]
         try:
-            response = requests.post(
-                "https://api.dataforseo.com/v3/keywords_data/google_ads/search_volume/live",
-                headers=headers,
-                json=[{
-                    "keywords": chunk,
-                    "location_code": location_code,
-                    "language_name": language_name,
-                }],
-                timeout=60,
-            )
-            response.raise_for_status()
-            data = response.json()
+            data = client.post(f'{SEARCH_VOLUME_QUEUE}/task_post', [
+                {"keywords": chunk, "location_code": location_code, "language_name": language_name}
+                for chunk in batch
+            ])
+        except Exception as e:
+            logger.error(f'[volumes queue] błąd task_post: {e}')
+            stats['failed'] += sum(len(chunk) for chunk in batch)
+            continue
 
-            tasks = data.get("tasks") or []
-            if not tasks:
-                logger.warning(f'[volumes] brak tasks w odpowiedzi: {data}')
+        created = []
+        for chunk, task in zip(batch, data.get('tasks') or []):
+            # 20100 = Task Created
+            if task.get('status_code') != 20100 or not task.get('id'):
+                logger.warning(f'[volumes queue] odrzucone zadanie: {task.get("status_code")} {task.get("status_message")}')
+                stats['failed'] += len(chunk)
                 continue
+            created.append(KeywordVolumeTask(
+                task_id=task['id'], voivodeship=voivodeship,
+                location_code=location_code, language=language_name, phrases=chunk,
+            ))
+            stats['posted'] += len(chunk)
+        KeywordVolumeTask.objects.bulk_create(created)
+        stats['tasks'] += len(created)
+    return stats
 
-            task = tasks[0]
-            task_status = task.get("status_code")
-            if task_status != 20000:
-                logger.warning(f'[volumes] task status {task_status}: {task.get("status_message")} | data: {task.get("data")}')
-                continue
 
-            # google_ads/search_volume/live zwraca result jako plaska lista obiektow
-            items = task.get("result") or []
-            logger.info(f'[volumes] chunk {i}: task OK, items={len(items)}, pierwszy={items[0] if items else None}')
-            for item in items:
-                if not isinstance(item, dict):
-                    continue
-                keyword = item.get("keyword", "")
-                volume = item.get("search_volume")
-                if keyword:
-                    result[keyword] = volume
+def collect_volume_tasks(login, password):
+    """
+    Odbiera gotowe zadania z kolejki standard (tasks_ready → task_get), zapisuje wolumeny
+    do cache i fraz wszystkich województw z tym samym location_code — post_volume_tasks
+    nie wysyła fraz oczekujących już w zadaniu innego województwa. Zadanie znika z tasks_ready
+    po pierwszym task_get (np. worker padł przed zapisem), więc zadania starsze niż
+    KEYWORD_VOLUME_TASK_MAX_AGE_HOURS pobieramy bezpośrednio po ID (DataForSEO trzyma wyniki
+    30 dni). Zadania bez wyniku i z błędem task_get oznacza jako failed (frazy wrócą do kolejki
+    przy kolejnym pobieraniu).
+    Zwraca {'pending', 'collected', 'failed', 'updated'}.
+    """
+    from leads.models import KeywordVolumeTask
 
-        except Exception as e:
-            logger.error(f'[volumes] wyjatek w chunk {i}: {e}')
+    pending = list(KeywordVolumeTask.objects.filter(status=KeywordVolumeTask.STATUS_PENDING))
+    summary = {'pending': len(pending), 'collected': 0, 'failed': 0, 'updated': 0}
+    if not pending:
+        return summary
+
+    client = DataForSEOClient(login, password)
+    try:
+        data = client.get(f'{SEARCH_VOLUME_QUEUE}/tasks_ready')
+    except Exception as e:
+        logger.warning(f'[volumes queue] błąd tasks_ready: {e}')
+        return summary
+    ready = {
+        item['id']
+        for task in data.get('tasks') or []
+        for item in task.get('result') or []
+        if item.get('id')
+    }
+
+    now = timezone.now()
+    voivodeships = {}
+    expired_before = now - timedelta(hours=settings.KEYWORD_VOLUME_TASK_MAX_AGE_HOURS)
+    for volume_task in pending:
+        expired = volume_task.posted_at < expired_before
+        if volume_task.task_id not in ready and not expired:
+            continue
+
+        try:
+            result = client.get(f'{SEARCH_VOLUME_QUEUE}/task_get', volume_task.task_id)
+            task = (result.get('tasks') or [{}])[0]
+            if task.get('status_code') in (40601, 40602):
+                # Task Handed / In Queue — odbierzemy przy kolejnym przebiegu
+                if not expired:
+                    continue
+                raise ValueError('nie odebrano w wyznaczonym czasie')
+            volumes = _task_volumes(task)
+        except (DataForSEOError, requests.RequestException, ValueError) as e:
+            logger.error(f'[volumes queue] błąd task_get {volume_task.task_id}: {e}')
+            volume_task.status = KeywordVolumeTask.STATUS_FAILED
+            volume_task.error = str(e)
+            volume_task.save(update_fields=['status', 'error'])
+            summary['failed'] += 1
             continue
 
-    return result
+        # Fraza bez wyniku — zapamiętujemy brak danych, jak w trybie live
+        fetched = {key: volumes.get(key) for key in volume_task.phrases}
+        store_volumes(fetched, volume_task.location_code, volume_task.language)
+        if volume_task.location_code not in voivodeships:
+            voivodeships[volume_task.location_code] = _voivodeships_for(volume_task.location_code)
+        summary['updated'] += _write_back(voivodeships[volume_task.location_code], fetched)
+        volume_task.status = KeywordVolumeTask.STATUS_DONE
+        volume_task.error = ''
+        volume_task.collected_at = now
+        volume_task.save(update_fields=['status', 'error', 'collected_at'])
+        summary['collected'] += 1
+
+    logger.info(
+        f"[volumes queue] oczekujących {summary['pending']}, odebranych {summary['collected']}, "
+        f"błędów {summary['failed']}, zapisanych wolumenów {summary['updated']}"
+    )
+    return summary
@@ -0,0 +1,165 @@
+"""
+Wsteczne pobieranie historii metryk GBP (do GBP_BACKFILL_MONTHS miesięcy).
+
+Każdy klient ma kursor GBPBackfill: pierwszy jeszcze niepobrany dzień.
+Jedna runda to jedna paczka (GBP_BACKFILL_CHUNK_DAYS dni) dla każdego
+aktywnego kursora — pobierana równolegle przez harvester, pod wspólnym
+limitem zapytań Performance API. Z paczki pytamy tylko o brakujące zakresy
+(gbp_gaps), więc dni z nocnego taska nie są pobierane drugi raz.
+
+Kursor zapisujemy po każdej paczce — po restarcie workera backfill rusza
+od miejsca, w którym przerwał. Po ostatniej paczce klienta przeliczamy
+jego sumy miesięczne (rollup_months).
+"""
+import calendar
+import logging
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .gbp_gaps import missing_days, days_between, day_ranges, as_day_tuples, record_unavailable
+from .gbp_harvester import harvest
+from .gbp_locations import performance_name
+from .gbp_rollup import rollup_months
+from .gbp_service import ingest_daily_metrics
+
+logger = logging.getLogger(__name__)
+
+# Po tylu kolejnych nieudanych paczkach kursor przechodzi w status failed
+MAX_ERRORS = 5
+
+
+def backfill_range(today=None, months=None):
+    """
+    (od, do): dzień po dacie sprzed `months` miesięcy — dzisiaj minus bufor Google.
+    Performance API odrzuca zakres sięgający dalej niż 18 miesięcy wstecz, więc nie
+    zaokrąglamy początku do pierwszego dnia miesiąca.
+    """
+    today = today or timezone.now().date()
+    months = months or settings.GBP_BACKFILL_MONTHS
+    index = today.year * 12 + today.month - 1 - months
+    year, month = index // 12, index % 12 + 1
+    date_from = date(year, month, min(today.day, calendar.monthrange(year, month)[1])) + timedelta(days=1)
+    return date_from, today - timedelta(days=5)
+
+
+def start_backfill(leads, restart=False):
+    """
+    Zakłada kursory dla podanych klientów. Istniejące kursory zostają,
+    chyba że restart=True (albo backfill się zakończył) — wtedy zakres jest liczony od nowa.
+    Zwraca liczbę kursorów ustawionych do pobierania.
+    """
+    from leads.models import GBPBackfill
+
+    date_from, date_to = backfill_range()
+    started = 0
+    for lead in leads:
+        backfill, created = GBPBackfill.objects.get_or_create(
+            lead=lead,
+            defaults={'date_from': date_from, 'date_to': date_to, 'cursor': date_from},
+        )
+        if not created and (restart or backfill.status != GBPBackfill.STATUS_PENDING):
+            backfill.date_from, backfill.date_to, backfill.cursor = date_from, date_to, date_from
+            backfill.status = GBPBackfill.STATUS_PENDING
+            backfill.errors = 0
+            backfill.last_error = ''
+            backfill.finished_at = None
+            backfill.save()
+        started += 1
+    return started
+
+
+def enroll_new_clients():
+    """Kursory dla klientów z lokalizacją GBP, którzy jeszcze nie mieli backfillu."""
+    from leads.models import GBPBackfill, Lead
+
+    date_from, date_to = backfill_range()
+    new_clients = (
+        Lead.objects
+        .filter(status='client', gbp_location_name__isnull=False, gbp_backfill__isnull=True)
+        .exclude(gbp_location_name='')
+    )
+    created = GBPBackfill.objects.bulk_create([
+        GBPBackfill(lead=lead, date_from=date_from, date_to=date_to, cursor=date_from)
+        for lead in new_clients
+    ])
+    return len(created)
+
+
+def run_round(backfills, access_token):
+    """
+    Jedna paczka dla każdego kursora. Zapisuje dni, przesuwa kursory
+    i przelicza sumy miesięczne klientów, którzy właśnie skończyli.
+    Zwraca liczbę zapisanych dni.
+    """
+    from leads.models import GBPBackfill
+
+    if not backfills:
+        return 0
+
+    chunk = timedelta(days=settings.GBP_BACKFILL_CHUNK_DAYS - 1)
+    windows = {b.lead_id: (b.cursor, min(b.cursor + chunk, b.date_to)) for b in backfills}
+    missing = missing_days(
+        list(windows),
+        min(start for start, _ in windows.values()),
+        max(end for _, end in windows.values()),
+    )
+    for lead_id, (start, end) in windows.items():
+        missing[lead_id] &= days_between(start, end)
+
+    jobs = [
+        {'key': b.lead_id, 'location_name': performance_name(b.lead.gbp_location_name), 'ranges': day_ranges(missing[b.lead_id])}
+        for b in backfills if missing[b.lead_id]
+    ]
+    results = harvest(jobs, access_token)
+
+    saved_total, finished = 0, []
+    for b in backfills:
+        result = results.get(b.lead_id)
+        if result and result['error']:
+            b.errors += 1
+            b.last_error = result['error']
+            if b.errors >= MAX_ERRORS:
+                b.status = GBPBackfill.STATUS_FAILED
+                logger.error(f'[GBP backfill] {b.lead.name} — przerwany po {b.errors} błędach: {b.last_error}')
+            b.save()
+            continue
+
+        if result:
+            saved = ingest_daily_metrics(
+                b.lead, result['daily'], result['directions'],
+                only_days=as_day_tuples(missing[b.lead_id]),
+            )
+            record_unavailable(b.lead_id, missing[b.lead_id], result['daily'])
+            b.days_saved += saved
+            saved_total += saved
+
+        b.cursor = windows[b.lead_id][1] + timedelta(days=1)
+        b.chunks_done += 1
+        b.errors = 0
+        b.last_error = ''
+        if b.cursor > b.date_to:
+            b.status = GBPBackfill.STATUS_DONE
+            b.finished_at = timezone.now()
+            finished.append(b)
+        b.save()
+
+    if finished:
+        rollup_months(
+            lead_ids=[b.lead_id for b in finished],
+            since=min((b.date_from.year, b.date_from.month) for b in finished),
+        )
+        for b in finished:
+            logger.info(f'[GBP backfill] {b.lead.name} — zakończony, zapisano {b.days_saved} dni')
+    return saved_total
+
+
+def pending_backfills():
+    from leads.models import GBPBackfill
+    return list(
+        GBPBackfill.objects
+        .filter(status=GBPBackfill.STATUS_PENDING)
+        .select_related('lead')
+        .order_by('created_at')
+    )
@@ -0,0 +1,93 @@
+"""
+Luki w dziennych metrykach GBP.
+
+Zamiast pobierać całe okno (30–35 dni), gdy brakuje choćby jednego dnia,
+zamieniamy zbiór brakujących dni na najmniejszą listę ciągłych zakresów
+i o każdy pytamy osobno. Dni, dla których Google kilka razy z rzędu nie
+zwróciło danych (np. sprzed weryfikacji wizytówki), zapisujemy
+w GBPUnavailableDay i pomijamy w kolejnych przebiegach.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import F
+from django.utils import timezone
+
+# Po tylu pustych odpowiedziach dzień uznajemy za niedostępny
+UNAVAILABLE_AFTER_ATTEMPTS = 3
+
+
+def days_between(date_from, date_to):
+    """Zbiór dni (date) od date_from do date_to włącznie."""
+    return {date_from + timedelta(days=n) for n in range((date_to - date_from).days + 1)}
+
+
+def day_ranges(days):
+    """Najmniejsza lista ciągłych zakresów [(od, do), ...] pokrywająca podane dni."""
+    ranges = []
+    for d in sorted(days):
+        if ranges and d - ranges[-1][1] == timedelta(days=1):
+            ranges[-1] = (ranges[-1][0], d)
+        else:
+            ranges.append((d, d))
+    return ranges
+
+
+def as_day_tuples(days):
+    """Dni jako (year, month, day) — format only_days w ingest_daily_metrics."""
+    return {(d.year, d.month, d.day) for d in days}
+
+
+def missing_days(lead_ids, date_from, date_to, include_unavailable=False):
+    """
+    Brakujące dni dla wielu leadów naraz (dwa zapytania niezależnie od liczby leadów).
+    Dzień jest obecny, gdy ma dane w spakowanych miesiącach (GBPMetricsMonth) —
+    tym samym magazynie, z którego czytają raporty, rollup i kondycja.
+    Zwraca {lead_id: set(date)}; dni uznane za niedostępne są pomijane,
+    chyba że include_unavailable=True.
+    """
+    from leads.models import GBPUnavailableDay
+    from .gbp_series import read_leads
+
+    lead_ids = list(lead_ids)
+    window = days_between(date_from, date_to)
+    dates, matrix = read_leads(lead_ids, date_from, date_to)
+    # Dzień z danymi = choć jedna metryka różna od NaN
+    known = ~np.isnan(matrix).all(axis=1)
+    existing = {
+        lead_id: {d.item() for d in dates[known[i]]}
+        for i, lead_id in enumerate(lead_ids)
+    }
+
+    if not include_unavailable:
+        unavailable = GBPUnavailableDay.objects.filter(
+            lead_id__in=lead_ids,
+            date__range=(date_from, date_to),
+            attempts__gte=UNAVAILABLE_AFTER_ATTEMPTS,
+        ).values_list('lead_id', 'date')
+        for lead_id, d in unavailable:
+            existing[lead_id].add(d)
+
+    return {lead_id: window - days for lead_id, days in existing.items()}
+
+
+def record_unavailable(lead_id, requested, daily_data):
+    """
+    Zapamiętuje dni, o które pytaliśmy, a których nie było w odpowiedzi API.
+    requested: zbiór date; daily_data: {'YYYY-MM-DD': metryki}.
+    Zwraca liczbę pustych dni.
+    """
+    from leads.models import GBPUnavailableDay
+
+    empty = sorted(d for d in requested if d.isoformat() not in daily_data)
+    if not empty:
+        return 0
+
+    GBPUnavailableDay.objects.filter(lead_id=lead_id, date__in=empty).update(
+        attempts=F('attempts') + 1, last_checked_at=timezone.now(),
+    )
+    GBPUnavailableDay.objects.bulk_create(
+        [GBPUnavailableDay(lead_id=lead_id, date=d) for d in empty],
+        ignore_conflicts=True,
+    )
+    return len(empty)
@@ -0,0 +1,101 @@
+"""
+Równoległe pobieranie metryk GBP (Performance API) dla wielu lokalizacji.
+
+Każdy brakujący zakres dat lokalizacji to dwa blokujące zapytania
+(fetchMultiDailyMetricsTimeSeries i getDailyMetricsTimeSeries dla tras).
+Wykonujemy je na puli wątków
+(GBP_FETCH_WORKERS) pod wspólnym limitem zapytań na minutę
+(API_RATE_LIMITS['gbp_performance']). Każda lokalizacja zajmuje też miejsce
+w concurrency_slot('gbp_performance') — sufit wspólny z nocnymi podzadaniami
+chorda, więc backfill nałożony na nocny przebieg go nie przekroczy. Wątki robią tylko HTTP — zapis do bazy
+zostaje po stronie wywołującego. Na końcu raport: czasy per lokalizacja i błędy.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .gbp_service import get_performance_metrics, get_direction_requests, parse_performance
+from .rate_limit import concurrency_slot, get_limiter
+
+logger = logging.getLogger(__name__)
+
+# Miejsce w suficie równoległości wygasa samo, gdyby proces padł w trakcie pobierania
+SLOT_TTL = 30 * 60
+
+
+def fetch_location(access_token, location_name, ranges, limiter=None):
+    """
+    Metryki dzienne i trasy jednej lokalizacji dla listy zakresów [(od, do), ...].
+    Zwraca (daily {date_str: metryki}, directions {date_str: n}) scalone ze wszystkich zakresów.
+    """
+    limiter = limiter or get_limiter('gbp_performance')
+    daily, directions = {}, {}
+    for date_from, date_to in ranges:
+        limiter.acquire()
+        raw = get_performance_metrics(access_token, location_name, date_from, date_to)
+        daily.update(parse_performance(raw).get('daily', {}))
+        limiter.acquire()
+        directions.update(get_direction_requests(access_token, location_name, date_from, date_to))
+    return daily, directions
+
+
+def harvest(jobs, access_token, max_workers=None):
+    """
+    Pobiera metryki wielu lokalizacji równolegle.
+    jobs: lista dictów {'key', 'location_name', 'ranges'} (key — np. pk leada,
+    ranges — lista zakresów [(od, do), ...] z gbp_gaps.day_ranges).
+    Zwraca {key: {'daily', 'directions', 'latency', 'error'}}; przy błędzie daily/directions = None.
+    """
+    max_workers = max_workers or settings.GBP_FETCH_WORKERS
+    limiter = get_limiter('gbp_performance')
+
+    def run(job):
+        started = time.monotonic()
+        try:
+            with concurrency_slot('gbp_performance', settings.GBP_FETCH_WORKERS, SLOT_TTL):
+                daily, directions = fetch_location(
+                    access_token, job['location_name'], job['ranges'], limiter,
+                )
+            error = None
+        except Exception as e:
+            daily, directions, error = None, None, str(e)
+        return job['key'], {
+            'daily': daily,
+            'directions': directions,
+            'latency': round(time.monotonic() - started, 2),
+            'error': error,
+        }
+
+    if not jobs:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        return dict(pool.map(run, jobs))
+
+
+def harvest_report(results, names=None):
+    """
+    Podsumowanie przebiegu: liczba lokalizacji, błędy, czasy (średni / max),
+    najwolniejsze lokalizacje. names: {key: nazwa do logów}.
+    """
+    names = names or {}
+    latencies = sorted(((r['latency'], key) for key, r in results.items()), reverse=True)
+    errors = {names.get(key, key): r['error'] for key, r in results.items() if r['error']}
+    report = {
+        'locations': len(results),
+        'failed': len(errors),
+        'latency_avg': round(sum(l for l, _ in latencies) / len(latencies), 2) if latencies else 0,
+        'latency_max': latencies[0][0] if latencies else 0,
+        'slowest': [(names.get(key, key), latency) for latency, key in latencies[:5]],
+        'errors': errors,
+    }
+    logger.info(
+        f"[GBP metrics] lokalizacji {report['locations']}, błędów {report['failed']}, "
+        f"czas śr. {report['latency_avg']}s, max {report['latency_max']}s"
+    )
+    for name, latency in report['slowest']:
+        logger.info(f'[GBP metrics] {name} — {latency}s')
+    for name, error in errors.items():
+        logger.error(f'[GBP metrics] {name} — błąd: {error}')
+    return report
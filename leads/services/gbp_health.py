@@ -0,0 +1,181 @@
+"""
+Kondycja metryk GBP wszystkich klientów naraz.
+
+Dzienne metryki z ostatnich WEEKS tygodni ładujemy jednym zapytaniem
+ze spakowanych miesięcy (gbp_series.read_leads) do macierzy NumPy
+[klient, metryka, dzień]. Na całej macierzy liczymy wektorowo:
+  - zmianę tydzień do tygodnia i 28 dni do poprzednich 28 dni,
+  - bazę sezonową: medianę sum z poprzednich pełnych tygodni (porównujemy
+    całe tygodnie, więc rytm dni tygodnia się znosi) i odchylenie wokół niej,
+  - flagi anomalii: załamanie (np. telefony po zawieszeniu wizytówki),
+    spadek / skok względem bazy, brak danych w ostatnim tygodniu.
+Wynik trafia do GBPHealth — lista klientów sortuje po `score`.
+"""
+import warnings
+from datetime import timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from .gbp_series import read_leads
+from .gbp_service import DAILY_METRIC_FIELDS, INTERACTION_FIELDS
+
+WEEKS = 13
+DAYS = WEEKS * 7
+# Kolejność metryk w macierzy — ta sama co przy zapisie (ingest i spakowane miesiące)
+FIELDS = DAILY_METRIC_FIELDS
+# Metryki oceniane osobno (+ suma interakcji)
+TRACKED = ['calls', 'profile_views', 'website_visits', 'direction_requests', 'interactions']
+
+# Załamanie: ostatni tydzień poniżej 20% bazy, przy bazie co najmniej 10 zdarzeń tygodniowo
+COLLAPSE_RATIO = 0.2
+MIN_BASELINE = 10
+Z_DROP = -2.5
+Z_SPIKE = 3.0
+# Waga flag w score (z-score spadku dodawany wprost)
+FLAG_WEIGHT = 5
+
+
+METRIC_LABELS = {
+    'calls': 'telefony',
+    'profile_views': 'wyświetlenia',
+    'website_visits': 'witryna',
+    'direction_requests': 'trasy',
+    'interactions': 'interakcje',
+}
+FLAG_KINDS = {'collapse': 'załamanie', 'drop': 'spadek', 'spike': 'skok'}
+
+
+def flag_label(flag):
+    """Czytelna nazwa flagi do listy klientów, np. 'calls_collapse' → 'załamanie: telefony'."""
+    if flag == 'no_data':
+        return 'brak danych z ostatniego tygodnia'
+    metric, _, kind = flag.rpartition('_')
+    return f'{FLAG_KINDS.get(kind, kind)}: {METRIC_LABELS.get(metric, metric)}'
+
+
+def load_matrix(lead_ids, as_of, days=DAYS):
+    """
+    Macierz [klient, metryka (FIELDS), dzień] z dni as_of-days+1 … as_of, jednym zapytaniem.
+    NaN = brak danych za dzień. Kolejność klientów jak w lead_ids.
+    """
+    _, matrix = read_leads(lead_ids, as_of - timedelta(days=days - 1), as_of)
+    return matrix
+
+
+def _sum_known(values, axis):
+    """Suma po osi z pominięciem NaN; NaN, gdy w przedziale nie ma żadnego znanego dnia."""
+    known = ~np.isnan(values)
+    return np.where(known.any(axis=axis), np.nansum(values, axis=axis), np.nan)
+
+
+def _pct(current, previous):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(previous > 0, (current - previous) / previous * 100, np.nan)
+
+
+def compute(matrix):
+    """
+    Statystyki dla macierzy z load_matrix. Zwraca dict tablic [klient, metryka (TRACKED)]:
+    last_7d, wow, mom, baseline, z — oraz no_data [klient].
+    """
+    interactions = _sum_known(matrix[:, [FIELDS.index(f) for f in INTERACTION_FIELDS]], axis=1)
+    tracked = np.concatenate(
+        [matrix[:, [FIELDS.index(f) for f in TRACKED[:-1]]], interactions[:, None]], axis=1,
+    )
+
+    days = tracked.shape[-1]
+    weekly = _sum_known(tracked.reshape(*tracked.shape[:2], days // 7, 7), axis=3)
+    last = weekly[..., -1]
+    previous_weeks = weekly[..., :-1]
+
+    with warnings.catch_warnings():
+        # Klienci bez historii dają puste przekroje — wynik NaN jest tu oczekiwany
+        warnings.simplefilter('ignore', RuntimeWarning)
+        baseline = np.nanmedian(previous_weeks, axis=-1)
+        spread = np.nanstd(previous_weeks, axis=-1)
+    # Dolna granica jak dla rozkładu Poissona — przy małych liczbach nie panikujemy z byle powodu
+    spread = np.fmax(spread, np.sqrt(np.fmax(baseline, 1)))
+
+    return {
+        'last_7d': last,
+        'wow': _pct(last, weekly[..., -2]),
+        'mom': _pct(_sum_known(tracked[..., -28:], axis=2), _sum_known(tracked[..., -56:-28], axis=2)),
+        'baseline': baseline,
+        'z': (last - baseline) / spread,
+        'no_data': np.isnan(last).all(axis=1) & ~np.isnan(baseline).all(axis=1),
+    }
+
+
+def _value(x, digits=1):
+    return None if np.isnan(x) else round(float(x), digits)
+
+
+def flags_and_score(stats, i):
+    """Flagi anomalii i score klienta i (wyżej = bardziej wymaga uwagi)."""
+    flags, score = [], 0.0
+    if stats['no_data'][i]:
+        flags.append('no_data')
+        score += FLAG_WEIGHT
+    for m, metric in enumerate(TRACKED):
+        last, baseline, z = stats['last_7d'][i, m], stats['baseline'][i, m], stats['z'][i, m]
+        if np.isnan(z):
+            continue
+        if baseline >= MIN_BASELINE and last < COLLAPSE_RATIO * baseline:
+            flags.append(f'{metric}_collapse')
+            score += FLAG_WEIGHT
+        elif z <= Z_DROP:
+            flags.append(f'{metric}_drop')
+        elif z >= Z_SPIKE:
+            flags.append(f'{metric}_spike')
+        score += max(0.0, -float(z))
+    return flags, round(score, 2)
+
+
+def compute_health(as_of=None):
+    """
+    Liczy kondycję wszystkich klientów z lokalizacją GBP i zapisuje GBPHealth jednym upsertem.
+    Wiersze leadów, które nie są już klientami albo straciły lokalizację, usuwa.
+    as_of — ostatni dzień danych (domyślnie dzisiaj minus bufor Google). Zwraca liczbę klientów.
+    """
+    from leads.models import GBPHealth, Lead
+
+    as_of = as_of or timezone.now().date() - timedelta(days=5)
+    lead_ids = list(
+        Lead.objects
+        .filter(status='client', gbp_location_name__isnull=False)
+        .exclude(gbp_location_name='')
+        .order_by('pk')
+        .values_list('pk', flat=True)
+    )
+    GBPHealth.objects.exclude(lead_id__in=lead_ids).delete()
+    if not lead_ids:
+        return 0
+
+    stats = compute(load_matrix(lead_ids, as_of))
+    interactions = TRACKED.index('interactions')
+    rows = []
+    for i, lead_id in enumerate(lead_ids):
+        flags, score = flags_and_score(stats, i)
+        rows.append(GBPHealth(
+            lead_id=lead_id,
+            as_of=as_of,
+            interactions_7d=int(np.nan_to_num(stats['last_7d'][i, interactions])),
+            wow_change=_value(stats['wow'][i, interactions]),
+            mom_change=_value(stats['mom'][i, interactions]),
+            score=score,
+            flags=flags,
+            metrics={
+                metric: {key: _value(stats[key][i, m], 2 if key == 'z' else 1)
+                         for key in ('last_7d', 'wow', 'mom', 'baseline', 'z')}
+                for m, metric in enumerate(TRACKED)
+            },
+        ))
+
+    GBPHealth.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['lead'],
+        update_fields=['as_of', 'interactions_7d', 'wow_change', 'mom_change', 'score', 'flags', 'metrics', 'computed_at'],
+    )
+    return len(rows)
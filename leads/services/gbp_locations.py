@@ -0,0 +1,111 @@
+"""
+Rejestr lokalizacji GBP i jedna normalizacja nazw lokalizacji.
+
+Lead.gbp_location_name może mieć postać 'accounts/X/locations/Y', 'locations/Y'
+albo samo 'Y'. Performance API chce 'locations/Y', publikacja postów (v4)
+— pełnej ścieżki z kontem. Konto bierzemy z rejestru GBPLocation, który
+odświeżamy z API (codziennie z beat i przyciskiem w widoku przypisań),
+więc rozwiązanie nazwy nie wymaga zapytania do Google.
+"""
+import logging
+
+import requests
+
+from .gbp_service import _auth_headers
+
+logger = logging.getLogger(__name__)
+
+ACCOUNTS_URL = 'https://mybusinessaccountmanagement.googleapis.com/v1/accounts'
+LOCATIONS_URL = 'https://mybusinessbusinessinformation.googleapis.com/v1/{account}/locations'
+
+
+def location_id(raw):
+    """Samo ID lokalizacji ('Y') z dowolnego formatu; '' dla pustej wartości."""
+    raw = (raw or '').strip().rstrip('/')
+    return raw.split('/locations/')[-1].split('/')[-1] if raw else ''
+
+
+def performance_name(raw):
+    """Nazwa dla Performance API: 'locations/Y'."""
+    return f'locations/{location_id(raw)}'
+
+
+def lookup(raw):
+    """GBPLocation z rejestru dla nazwy lokalizacji leada albo None."""
+    from leads.models import GBPLocation
+    loc_id = location_id(raw)
+    return GBPLocation.objects.filter(location_id=loc_id).first() if loc_id else None
+
+
+def full_name(raw):
+    """
+    Pełna ścieżka 'accounts/X/locations/Y' dla posta (v4). Bierze ją z nazwy,
+    jeśli zawiera konto, albo z rejestru; None, gdy lokalizacji nie ma w rejestrze.
+    """
+    raw = (raw or '').strip()
+    if raw.startswith('accounts/') and '/locations/' in raw:
+        return raw
+    location = lookup(raw)
+    return location.full_name if location else None
+
+
+def _format_address(addr):
+    if not addr:
+        return ''
+    parts = addr.get('addressLines', [])
+    city = addr.get('locality', '')
+    return ', '.join(filter(None, parts + [city]))
+
+
+def _paged(url, access_token, params, key):
+    """Wszystkie elementy listy z endpointu stronicowanego nextPageToken."""
+    items, page_token = [], None
+    while True:
+        page_params = dict(params, pageToken=page_token) if page_token else params
+        resp = requests.get(url, headers=_auth_headers(access_token), params=page_params, timeout=30)
+        resp.raise_for_status()
+        data = resp.json()
+        items.extend(data.get(key, []))
+        page_token = data.get('nextPageToken')
+        if not page_token:
+            return items
+
+
+def refresh_registry(access_token):
+    """
+    Pobiera wszystkie konta i ich lokalizacje i zapisuje rejestr jednym upsertem.
+    Lokalizacje, których już nie ma na żadnym koncie, są usuwane.
+    Zwraca liczbę lokalizacji w rejestrze.
+    """
+    from leads.models import GBPLocation
+
+    accounts = _paged(ACCOUNTS_URL, access_token, {'pageSize': 20}, 'accounts')
+    rows = {}
+    for account in accounts:
+        account_name = account.get('name', '')
+        locations = _paged(
+            LOCATIONS_URL.format(account=account_name), access_token,
+            {'readMask': 'name,title,storefrontAddress,websiteUri', 'pageSize': 100},
+            'locations',
+        )
+        for loc in locations:
+            loc_id = location_id(loc.get('name'))
+            rows[loc_id] = GBPLocation(
+                location_id=loc_id,
+                account_name=account_name,
+                title=loc.get('title', '')[:255],
+                address=_format_address(loc.get('storefrontAddress', {}))[:500],
+                website=loc.get('websiteUri', '')[:500],
+            )
+
+    GBPLocation.objects.bulk_create(
+        list(rows.values()),
+        update_conflicts=True,
+        unique_fields=['location_id'],
+        update_fields=['account_name', 'title', 'address', 'website', 'refreshed_at'],
+    )
+    # Pusta odpowiedź to raczej problem z uprawnieniami niż brak wizytówek — rejestru nie czyścimy
+    if rows:
+        GBPLocation.objects.exclude(location_id__in=list(rows)).delete()
+    logger.info(f'[GBP locations] kont {len(accounts)}, lokalizacji {len(rows)}')
+    return len(rows)
@@ -0,0 +1,160 @@
+"""
+Metryki GBP klienta za zakres dat: sumy i rozbicie na miesiące.
+
+Jedno zapytanie po indeksie (lead, year*12+month) grupuje wiersze miesięczne
+zakresu i agreguje warunkowo dwa źródła: sumę miesięczną z API (rollup)
+i wpis miesięczny ręczny. Trzecie źródło — sumy dni z API — to jeden odczyt
+spakowanych miesięcy (gbp_series.read_range). Dla każdego miesiąca
+bierzemy rollup, potem wpis ręczny, a brakujące pola (np. conversations
+w starych wpisach) uzupełniamy sumą dni. Miesiące brzegowe, które zakres
+obejmuje tylko częściowo, liczymy z dni, jeśli są.
+
+Wynik trzymamy w cache z kluczem zależnym od danych klienta
+(max id, liczba wierszy, ostatni zapis) — nowy dzień albo rollup
+od razu go unieważnia.
+"""
+import calendar
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Count, F, Max, Q
+
+from .gbp_series import read_range
+from .gbp_service import DAILY_METRIC_FIELDS, INTERACTION_FIELDS
+
+CACHE_TTL = 24 * 60 * 60
+# Odróżnia brak wpisu w cache od zapamiętanego None (brak danych w zakresie)
+_MISSING = object()
+
+
+def month_ordinal(year, month):
+    """Numer miesiąca liczony ciągle (year*12 + month) — to samo wyrażenie co w indeksie."""
+    return year * 12 + month
+
+
+def _ordinal_expression():
+    return F('year') * 12 + F('month')
+
+
+def _daily_sums(lead_id, date_from, date_to):
+    """{(rok, miesiąc): (dni z danymi, {metryka: suma lub None})} z dni zakresu — spakowane miesiące."""
+    dates, values = read_range(lead_id, date_from, date_to)
+    matrix = np.array([values[field] for field in DAILY_METRIC_FIELDS])
+    known = ~np.isnan(matrix)
+    months = dates.astype('datetime64[M]')
+    sums = {}
+    for month in np.unique(months[known.any(axis=0)]):
+        in_month = months == month
+        year, month_number = divmod(int(month.astype(int)), 12)
+        sums[(1970 + year, month_number + 1)] = (
+            int(known[:, in_month].any(axis=0).sum()),
+            {
+                field: int(np.nansum(matrix[i, in_month])) if known[i, in_month].any() else None
+                for i, field in enumerate(DAILY_METRIC_FIELDS)
+            },
+        )
+    return sums
+
+
+def _monthly_breakdown(lead_id, date_from, date_to):
+    """
+    Wiersze per miesiąc z wartościami trzech źródeł: wiersze miesięczne jednym
+    zapytaniem GROUP BY, dni z API z odczytu spakowanych miesięcy.
+    """
+    from leads.models import GBPMetricsSnapshot
+
+    monthly_api = Q(day__isnull=True, source=GBPMetricsSnapshot.SOURCE_API)
+    monthly_manual = Q(day__isnull=True, source=GBPMetricsSnapshot.SOURCE_MANUAL)
+
+    aggregates = {}
+    for field in DAILY_METRIC_FIELDS:
+        aggregates[f'{field}__api'] = Max(field, filter=monthly_api)
+        aggregates[f'{field}__manual'] = Max(field, filter=monthly_manual)
+    aggregates['has_api'] = Count('id', filter=monthly_api)
+    aggregates['has_manual'] = Count('id', filter=monthly_manual)
+
+    rows = {
+        (row['year'], row['month']): row
+        for row in (
+            GBPMetricsSnapshot.objects
+            .annotate(ordinal=_ordinal_expression())
+            .filter(
+                monthly_api | monthly_manual,
+                lead_id=lead_id,
+                ordinal__gte=month_ordinal(date_from.year, date_from.month),
+                ordinal__lte=month_ordinal(date_to.year, date_to.month),
+            )
+            .values('year', 'month')
+            .annotate(**aggregates)
+            .order_by()
+        )
+    }
+    daily = _daily_sums(lead_id, date_from, date_to)
+    for key in daily.keys() - rows.keys():
+        rows[key] = {'year': key[0], 'month': key[1], 'has_api': 0, 'has_manual': 0}
+        rows[key].update({f'{field}__{source}': None for field in DAILY_METRIC_FIELDS for source in ('api', 'manual')})
+    for key, row in rows.items():
+        days, sums = daily.get(key, (0, {}))
+        row['days'] = days
+        row.update({f'{field}__daily': sums.get(field) for field in DAILY_METRIC_FIELDS})
+    return [rows[key] for key in sorted(rows)]
+
+
+def _resolve_month(row, partial):
+    """Wartości miesiąca: rollup → wpis ręczny → suma dni; dla częściowego miesiąca najpierw dni."""
+    sources = [
+        source for source, present in (('api', row['has_api']), ('manual', row['has_manual']), ('daily', row['days']))
+        if present
+    ]
+    if partial and row['days']:
+        sources = ['daily'] + [source for source in sources if source != 'daily']
+
+    month = {'year': row['year'], 'month': row['month'], 'source': sources[0]}
+    for field in DAILY_METRIC_FIELDS:
+        values = (row[f'{field}__{source}'] for source in sources)
+        month[field] = next((v for v in values if v is not None), None) or 0
+    return month
+
+
+def compute_metrics_for_range(lead_id, date_from, date_to):
+    """Bez cache — patrz metrics_for_range."""
+    months = []
+    for row in _monthly_breakdown(lead_id, date_from, date_to):
+        if not (row['has_api'] or row['has_manual'] or row['days']):
+            continue
+        first = (row['year'], row['month']) == (date_from.year, date_from.month)
+        last = (row['year'], row['month']) == (date_to.year, date_to.month)
+        partial = (first and date_from.day > 1) or (
+            last and date_to.day < calendar.monthrange(row['year'], row['month'])[1]
+        )
+        months.append(_resolve_month(row, partial))
+
+    if not months:
+        return None
+
+    totals = {field: sum(m[field] for m in months) for field in DAILY_METRIC_FIELDS}
+    totals['total_interactions'] = sum(totals[field] for field in INTERACTION_FIELDS)
+    totals['months'] = months
+    return totals
+
+
+def metrics_for_range(lead_id, date_from, date_to):
+    """
+    Sumy metryk klienta za zakres dat i rozbicie na miesiące ('months').
+    None, gdy w zakresie nie ma żadnych danych. Wynik z cache, dopóki nie zmienią się dane klienta.
+    """
+    from leads.models import GBPMetricsSnapshot
+
+    version = GBPMetricsSnapshot.objects.filter(lead_id=lead_id).aggregate(
+        last_id=Max('id'), count=Count('id'), updated=Max('updated_at'),
+    )
+    updated = version['updated'].timestamp() if version['updated'] else 0
+    key = (
+        f"gbp_metrics:{lead_id}:{date_from.isoformat()}:{date_to.isoformat()}:"
+        f"{version['last_id']}:{version['count']}:{updated}"
+    )
+    result = cache.get(key, _MISSING)
+    if result is _MISSING:
+        result = compute_metrics_for_range(lead_id, date_from, date_to)
+        cache.set(key, result, CACHE_TTL)
+    return result
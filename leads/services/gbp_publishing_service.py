@@ -5,6 +5,8 @@ Obsługuje tworzenie, usuwanie i pobieranie lokalnych postów (localPosts).
 import re
 import requests
 
+from .gbp_locations import full_name, performance_name, refresh_registry
+
 GBP_BASE = 'https://mybusiness.googleapis.com/v4'
 
 
@@ -17,54 +19,18 @@ def _auth_headers(access_token):
 
 def get_full_location_name(access_token, location_name_short):
     """
-    Buduje pełną ścieżkę lokalizacji accounts/XXX/locations/YYY
-    pobierając account ID z Account Management API.
-    """
-    loc_id = location_name_short.split('/')[-1]
-
-    resp = requests.get(
-        'https://mybusinessaccountmanagement.googleapis.com/v1/accounts',
-        headers=_auth_headers(access_token),
-        timeout=15,
-    )
-    if not resp.ok:
-        raise ValueError(f'Nie można pobrać kont GBP: {resp.status_code} {resp.text[:200]}')
-
-    accounts = resp.json().get('accounts', [])
-    if not accounts:
-        raise ValueError(f'Brak kont GBP. Odpowiedź: {resp.text[:300]}')
-
-    # Użyj pierwszego konta — weryfikację pomijamy bo różne API mają różne zasady
-    account_name = accounts[0].get('name', '')
-    return f'{account_name}/locations/{loc_id}'
-
-
-def _normalize_location_name_full(raw):
-    """
-    Zwraca pełną ścieżkę lokalizacji dla mybusiness.googleapis.com/v4.
-    Format: accounts/XXX/locations/YYY
+    Pełna ścieżka lokalizacji accounts/XXX/locations/YYY z rejestru GBPLocation.
+    Gdy lokalizacji nie ma w rejestrze, odświeża go raz z API.
     """
-    raw = raw.strip()
-    if raw.startswith('accounts/'):
-        return raw  # już pełna ścieżka
-    elif raw.startswith('locations/'):
-        return raw  # brak accountów — niektóre endpointy akceptują
-    else:
-        return 'locations/' + raw
+    name = full_name(location_name_short)
+    if name:
+        return name
 
-
-def _normalize_location_name(raw):
-    """
-    Normalizuje location_name do formatu 'locations/XXXX'
-    (używane przez Performance API).
-    """
-    raw = raw.strip()
-    if '/locations/' in raw and raw.startswith('accounts/'):
-        return 'locations/' + raw.split('/locations/')[-1]
-    elif raw.startswith('locations/'):
-        return raw
-    else:
-        return 'locations/' + raw
+    refresh_registry(access_token)
+    name = full_name(location_name_short)
+    if not name:
+        raise ValueError(f'Lokalizacja {location_name_short} nie występuje na żadnym koncie GBP')
+    return name
 
 
 def _drive_url_to_media_url(drive_url):
@@ -123,7 +89,7 @@ def publish_local_post(access_token, location_name, body, topic_type='STANDARD',
     Rzuca:
         ValueError — jeśli API zwróci błąd
     """
-    location = _normalize_location_name_full(location_name)
+    location = full_name(location_name) or performance_name(location_name)
     url = f'{GBP_BASE}/{location}/localPosts'
 
     import logging
@@ -209,7 +175,7 @@ def list_local_posts(access_token, location_name, page_size=20):
 
     Zwraca listę postów (dict) posortowaną od najnowszych.
     """
-    location = _normalize_location_name(location_name)
+    location = performance_name(location_name)
     url = f'{GBP_BASE}/{location}/localPosts'
     params = {'pageSize': page_size}
 
@@ -0,0 +1,111 @@
+"""
+Sumy miesięczne metryk GBP (wiersze day=NULL, source='api') liczone zbiorczo.
+
+Sumy liczymy ze spakowanych miesięcy (GBPMetricsMonth, gbp_series) — jeden
+wiersz na klienta i miesiąc zamiast grupowania ~30 wierszy dziennych.
+Przeliczamy tylko miesiące "brudne": bez wiersza miesięcznego albo ze
+spakowanym miesiącem zapisanym po ostatnim przeliczeniu.
+Miesiące oznaczone mark_month_dirty przeliczamy zawsze, także spoza okna `since`;
+jeśli nie zostały im żadne dni, wiersz miesięczny jest usuwany.
+
+Zapis: istniejące wiersze miesięczne — bulk_update, nowe — bulk_create.
+Upsert przez ON CONFLICT nie działa, bo day=NULL nie koliduje w indeksie unikalnym.
+"""
+import logging
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .gbp_series import totals
+from .gbp_service import DAILY_METRIC_FIELDS
+
+logger = logging.getLogger(__name__)
+
+
+def _month_filter(since):
+    """Q dla miesięcy od (rok, miesiąc) włącznie."""
+    year, month = since
+    return Q(year__gt=year) | Q(year=year, month__gte=month)
+
+
+def rollup_months(lead_ids=None, since=None):
+    """
+    Przelicza brudne sumy miesięczne dla leadów (None = wszyscy) od miesiąca `since` (rok, miesiąc).
+    Miesiące oznaczone jako brudne (mark_month_dirty) przelicza niezależnie od `since`.
+    Zwraca dict: created, updated, skipped (miesiące aktualne), deleted (miesiące bez dni).
+    """
+    from leads.models import GBPMetricsMonth, GBPMetricsSnapshot
+
+    # Znacznik sprzed odczytu — dzień zapisany w trakcie rollupu zostanie złapany następnym razem
+    started = timezone.now()
+
+    packed = GBPMetricsMonth.objects.all()
+    monthly = GBPMetricsSnapshot.objects.filter(source=GBPMetricsSnapshot.SOURCE_API, day__isnull=True)
+    if lead_ids is not None:
+        packed = packed.filter(lead_id__in=lead_ids)
+        monthly = monthly.filter(lead_id__in=lead_ids)
+    if since is not None:
+        dirty = Q()
+        for lead_id, year, month in monthly.filter(updated_at__isnull=True).values_list('lead_id', 'year', 'month'):
+            dirty |= Q(lead_id=lead_id, year=year, month=month)
+        packed = packed.filter(_month_filter(since) | dirty)
+        monthly = monthly.filter(_month_filter(since) | Q(updated_at__isnull=True))
+
+    sums = []
+    for lead_id, year, month, data, updated_at in packed.values_list('lead_id', 'year', 'month', 'data', 'updated_at'):
+        month_sums = totals(data)
+        # Miesiąc bez żadnego dnia (wszystkie wyczyszczone) traktujemy jak brak danych
+        if any(value is not None for value in month_sums.values()):
+            sums.append({'lead_id': lead_id, 'year': year, 'month': month, 'last_update': updated_at, **month_sums})
+    existing = {(row.lead_id, row.year, row.month): row for row in monthly}
+
+    to_create, to_update, skipped = [], [], 0
+    seen = set()
+    for row in sums:
+        key = (row['lead_id'], row['year'], row['month'])
+        seen.add(key)
+        values = {field: row[field] or 0 for field in DAILY_METRIC_FIELDS}
+        snapshot = existing.get(key)
+        if snapshot is None:
+            to_create.append(GBPMetricsSnapshot(
+                lead_id=key[0], year=key[1], month=key[2], day=None,
+                source=GBPMetricsSnapshot.SOURCE_API, **values,
+            ))
+            continue
+        fresh = (
+            snapshot.updated_at is not None
+            and row['last_update'] is not None
+            and row['last_update'] <= snapshot.updated_at
+        )
+        if fresh:
+            skipped += 1
+            continue
+        for field, value in values.items():
+            setattr(snapshot, field, value)
+        snapshot.updated_at = started
+        to_update.append(snapshot)
+
+    # Brudny miesiąc bez żadnego dnia (wszystkie usunięte) — stara suma byłaby nieprawdziwa
+    orphaned = [
+        snapshot.pk for key, snapshot in existing.items()
+        if key not in seen and snapshot.updated_at is None
+    ]
+
+    GBPMetricsSnapshot.objects.bulk_create(to_create, batch_size=500)
+    GBPMetricsSnapshot.objects.bulk_update(to_update, DAILY_METRIC_FIELDS + ['updated_at'], batch_size=500)
+    if orphaned:
+        GBPMetricsSnapshot.objects.filter(pk__in=orphaned).delete()
+
+    logger.info(
+        f'[GBP rollup] utworzono {len(to_create)}, zaktualizowano {len(to_update)}, '
+        f'aktualnych {skipped}, usunięto {len(orphaned)}'
+    )
+    return {'created': len(to_create), 'updated': len(to_update), 'skipped': skipped, 'deleted': len(orphaned)}
+
+
+def mark_month_dirty(lead_id, year, month):
+    """Wymusza przeliczenie sumy miesiąca przy następnym rollupie (np. po usunięciu dnia)."""
+    from leads.models import GBPMetricsSnapshot
+    GBPMetricsSnapshot.objects.filter(
+        lead_id=lead_id, year=year, month=month, day__isnull=True, source=GBPMetricsSnapshot.SOURCE_API,
+    ).update(updated_at=None)
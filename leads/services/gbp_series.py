@@ -0,0 +1,179 @@
+"""
+Zwarty zapis dziennych metryk GBP: jeden wiersz GBPMetricsMonth na klienta i miesiąc.
+
+Kolumna `data` to tablica int32 o kształcie (len(METRICS), 31) — wiersz na metrykę,
+kolumna na dzień miesiąca; MISSING (-1) oznacza dzień bez danych. BinaryField
+zamiast ArrayField, żeby działało tak samo na Postgresie i SQLite (testy).
+
+Odczyt dowolnego zakresu dat to jedno zapytanie po kilka wierszy miesięcznych
+i złożenie tablic NumPy; suma miesiąca to odczyt jednego wiersza. Z tych
+odczytów korzystają raporty (gbp_metrics_query), kondycja (gbp_health)
+i sumy miesięczne (gbp_rollup).
+
+Zapis idzie równolegle z GBPMetricsSnapshot (write-through w ingest_daily_metrics).
+Scalanie dni w miesiąc odbywa się pod blokadą wierszy (select_for_update),
+więc równoległe zapisy tego samego miesiąca (nocny chord i backfill) nie gubią
+sobie nawzajem dni.
+"""
+from datetime import date, timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .gbp_service import DAILY_METRIC_FIELDS
+
+METRICS = DAILY_METRIC_FIELDS
+DTYPE = np.dtype('<i4')
+MISSING = -1
+DAYS = 31
+
+
+def empty_month():
+    return np.full((len(METRICS), DAYS), MISSING, dtype=DTYPE)
+
+
+def pack(matrix):
+    return matrix.astype(DTYPE, copy=False).tobytes()
+
+
+def unpack(data):
+    """Tablica (metryki × 31) z bajtów (bytes / memoryview z Postgresa); kopia do zapisu."""
+    return np.frombuffer(bytes(data), dtype=DTYPE).reshape(len(METRICS), DAYS).copy()
+
+
+def _months_between(date_from, date_to):
+    """Q dla wierszy miesięcznych pokrywających zakres dat."""
+    return (
+        (Q(year__gt=date_from.year) | Q(year=date_from.year, month__gte=date_from.month))
+        & (Q(year__lt=date_to.year) | Q(year=date_to.year, month__lte=date_to.month))
+    )
+
+
+def write_days(lead_id, days):
+    """
+    Zapisuje dni do spakowanych miesięcy: brakujące wiersze zakłada, istniejące
+    blokuje, scala i zapisuje w jednej transakcji.
+    days: {date: {metryka: wartość lub None}}. Zwraca liczbę zapisanych miesięcy.
+    """
+    from leads.models import GBPMetricsMonth
+
+    if not days:
+        return 0
+
+    months = {(d.year, d.month) for d in days}
+    with transaction.atomic():
+        # Puste miesiące zakładamy bez nadpisywania — wiersz założony równolegle zostaje
+        GBPMetricsMonth.objects.bulk_create(
+            [
+                GBPMetricsMonth(lead_id=lead_id, year=year, month=month, data=pack(empty_month()))
+                for year, month in months
+            ],
+            ignore_conflicts=True,
+        )
+        rows = {
+            (row.year, row.month): row
+            for row in GBPMetricsMonth.objects.select_for_update().filter(
+                _months_between(min(days), max(days)), lead_id=lead_id,
+            )
+            if (row.year, row.month) in months
+        }
+        matrices = {key: unpack(row.data) for key, row in rows.items()}
+        for d, metrics in days.items():
+            column = matrices[(d.year, d.month)][:, d.day - 1]
+            for i, field in enumerate(METRICS):
+                value = metrics.get(field)
+                column[i] = MISSING if value is None else value
+
+        now = timezone.now()
+        for key, row in rows.items():
+            row.data = pack(matrices[key])
+            row.updated_at = now
+        GBPMetricsMonth.objects.bulk_update(rows.values(), ['data', 'updated_at'])
+    return len(rows)
+
+
+def clear_days(lead_id, dates):
+    """Oznacza dni jako brak danych (np. po usunięciu wpisu dziennego)."""
+    return write_days(lead_id, {d: {} for d in dates})
+
+
+def _range_dates(date_from, date_to):
+    return np.arange(np.datetime64(date_from, 'D'), np.datetime64(date_to + timedelta(days=1), 'D'))
+
+
+def _place(out, dates, year, month, data):
+    """Wpisuje dni miesiąca (year, month) wchodzące w zakres `dates` do out[metryka, dzień]."""
+    matrix = unpack(data).astype(np.float64)
+    matrix[matrix == MISSING] = np.nan
+    month_start = np.datetime64(date(year, month, 1), 'D')
+    month_end = (np.datetime64(f'{year:04d}-{month:02d}', 'M') + 1).astype('datetime64[D]')
+    # Część miesiąca wchodząca w zakres
+    start = max(month_start, dates[0])
+    end = min(month_end, dates[-1] + 1)
+    if start >= end:
+        return
+    src = slice(int((start - month_start).astype(int)), int((end - month_start).astype(int)))
+    dst = slice(int((start - dates[0]).astype(int)), int((end - dates[0]).astype(int)))
+    out[:, dst] = matrix[:, src]
+
+
+def read_leads(lead_ids, date_from, date_to):
+    """
+    Dzienne metryki wielu klientów w zakresie dat (włącznie), jednym zapytaniem.
+    Zwraca (dates, matrix): matrix [klient (jak w lead_ids), metryka (METRICS), dzień],
+    NaN = brak danych za dzień.
+    """
+    from leads.models import GBPMetricsMonth
+
+    dates = _range_dates(date_from, date_to)
+    out = np.full((len(lead_ids), len(METRICS), len(dates)), np.nan)
+    if not len(dates) or not len(lead_ids):
+        return dates, out
+
+    index = {lead_id: i for i, lead_id in enumerate(lead_ids)}
+    rows = GBPMetricsMonth.objects.filter(
+        _months_between(date_from, date_to), lead_id__in=lead_ids,
+    ).values_list('lead_id', 'year', 'month', 'data')
+    for lead_id, year, month, data in rows:
+        _place(out[index[lead_id]], dates, year, month, data)
+    return dates, out
+
+
+def read_range(lead_id, date_from, date_to):
+    """
+    Dzienne metryki klienta w zakresie dat (włącznie), jednym zapytaniem.
+    Zwraca (dates, values): dates — np.ndarray datetime64[D],
+    values — {metryka: np.ndarray float64}, NaN = brak danych za dzień.
+    """
+    dates, matrix = read_leads([lead_id], date_from, date_to)
+    return dates, {field: matrix[0, i] for i, field in enumerate(METRICS)}
+
+
+def totals(data):
+    """
+    Sumy metryk spakowanego miesiąca: {metryka: suma}; None, gdy metryka
+    nie ma żadnego dnia z danymi.
+    """
+    matrix = unpack(data)
+    known = matrix != MISSING
+    return {
+        field: int(matrix[i][known[i]].sum()) if known[i].any() else None
+        for i, field in enumerate(METRICS)
+    }
+
+
+def month_totals(lead_id, year, month):
+    """Sumy metryk miesiąca z jednego wiersza (jak totals); same None, gdy brak wiersza."""
+    from leads.models import GBPMetricsMonth
+
+    data = (
+        GBPMetricsMonth.objects
+        .filter(lead_id=lead_id, year=year, month=month)
+        .values_list('data', flat=True)
+        .first()
+    )
+    if data is None:
+        return {field: None for field in METRICS}
+    return totals(data)
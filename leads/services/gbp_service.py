@@ -9,8 +9,14 @@ Flow:
 Scope: https://www.googleapis.com/auth/business.manage
 """
 
+import hashlib
+import logging
+
 import requests
 from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
 
 
 SCOPES = ['https://www.googleapis.com/auth/business.manage']
@@ -20,6 +26,10 @@ TOKEN_URL = 'https://oauth2.googleapis.com/token'
 GBP_BASE = 'https://mybusinessbusinessinformation.googleapis.com/v1'
 GBP_PERF_BASE = 'https://businessprofileperformance.googleapis.com/v1'
 
+# Access token w cache współdzielonym przez wszystkie procesy; odnawiamy 5 min przed wygaśnięciem
+TOKEN_CACHE_ALIAS = 'shared'
+TOKEN_EXPIRY_MARGIN = 300
+
 
 def get_authorization_url(redirect_uri):
     """Zwraca URL do przekierowania użytkownika na stronę zgody Google."""
@@ -49,7 +59,20 @@ def exchange_code_for_tokens(code, redirect_uri):
 
 
 def get_access_token(refresh_token):
-    """Używa refresh_token żeby dostać świeży access_token."""
+    """
+    Używa refresh_token żeby dostać access_token.
+    Token trzymamy w cache 'shared' (wspólny dla web i workerów) do wygaśnięcia
+    minus margines — kolejne widoki i taski nie odpytują już endpointu OAuth.
+    """
+    key = f"gbp_access_token:{hashlib.sha1(refresh_token.encode()).hexdigest()}"
+    try:
+        token = caches[TOKEN_CACHE_ALIAS].get(key)
+    except Exception as e:
+        logger.warning(f'[GBP token] cache niedostępny: {e}')
+        token = None
+    if token:
+        return token
+
     resp = requests.post(TOKEN_URL, data={
         'refresh_token': refresh_token,
         'client_id': settings.GOOGLE_CLIENT_ID,
@@ -57,29 +80,19 @@ def get_access_token(refresh_token):
         'grant_type': 'refresh_token',
     })
     resp.raise_for_status()
-    return resp.json()['access_token']
+    data = resp.json()
+    try:
+        timeout = max(int(data.get('expires_in', 3600)) - TOKEN_EXPIRY_MARGIN, 60)
+        caches[TOKEN_CACHE_ALIAS].set(key, data['access_token'], timeout)
+    except Exception as e:
+        logger.warning(f'[GBP token] nie udało się zapisać tokenu w cache: {e}')
+    return data['access_token']
 
 
 def _auth_headers(access_token):
     return {'Authorization': f'Bearer {access_token}'}
 
 
-def list_locations(access_token):
-    """Zwraca listę wszystkich lokalizacji z wszystkich kont.
-    Używa wildcard '-' żeby ominąć Account Management API.
-    """
-    resp = requests.get(
-        'https://mybusinessbusinessinformation.googleapis.com/v1/accounts/-/locations',
-        headers=_auth_headers(access_token),
-        params={
-            'readMask': 'name,title,storefrontAddress,websiteUri',
-            'pageSize': 100,
-        },
-    )
-    resp.raise_for_status()
-    return resp.json().get('locations', [])
-
-
 def get_performance_metrics(access_token, location_name, date_from, date_to):
     """
     Pobiera metryki wydajności wizytówki.
@@ -120,55 +133,6 @@ def get_performance_metrics(access_token, location_name, date_from, date_to):
     return resp.json()
 
 
-def compute_monthly_snapshot(lead, year, month):
-    """
-    Sumuje dzienne wpisy API dla danego miesiąca i zapisuje/aktualizuje
-    rekord miesięczny (day=None, source='api').
-    Zwraca (snapshot, created) lub None jeśli brak danych dziennych.
-    """
-    from leads.models import GBPMetricsSnapshot
-    from django.db.models import Sum
-
-    daily = GBPMetricsSnapshot.objects.filter(
-        lead=lead,
-        year=year,
-        month=month,
-        day__isnull=False,
-        source=GBPMetricsSnapshot.SOURCE_API,
-    ).aggregate(
-        calls=Sum('calls'),
-        profile_views=Sum('profile_views'),
-        website_visits=Sum('website_visits'),
-        direction_requests=Sum('direction_requests'),
-        conversations=Sum('conversations'),
-        bookings=Sum('bookings'),
-        food_orders=Sum('food_orders'),
-        food_menu_clicks=Sum('food_menu_clicks'),
-    )
-
-    if all(v is None for v in daily.values()):
-        return None
-
-    snapshot, created = GBPMetricsSnapshot.objects.update_or_create(
-        lead=lead,
-        year=year,
-        month=month,
-        day=None,
-        source=GBPMetricsSnapshot.SOURCE_API,
-        defaults={
-            'calls': daily['calls'] or 0,
-            'profile_views': daily['profile_views'] or 0,
-            'website_visits': daily['website_visits'] or 0,
-            'direction_requests': daily['direction_requests'] or 0,
-            'conversations': daily['conversations'] or 0,
-            'bookings': daily['bookings'] or 0,
-            'food_orders': daily['food_orders'] or 0,
-            'food_menu_clicks': daily['food_menu_clicks'] or 0,
-        },
-    )
-    return snapshot, created
-
-
 def get_direction_requests(access_token, location_name, date_from, date_to):
     """
     Pobiera zapytania o trasę przez getDailyMetricsTimeSeries.
@@ -242,6 +206,61 @@ def _metrics_to_snapshot_kwargs(metrics, direction_requests_map=None, date_str=N
     }
 
 
+DAILY_METRIC_FIELDS = [
+    'calls', 'profile_views', 'website_visits', 'direction_requests',
+    'conversations', 'bookings', 'food_orders', 'food_menu_clicks',
+]
+# Interakcje z wizytówką — wszystkie metryki poza wyświetleniami
+INTERACTION_FIELDS = [field for field in DAILY_METRIC_FIELDS if field != 'profile_views']
+
+
+def ingest_daily_metrics(lead, daily_data, direction_map=None, only_days=None):
+    """
+    Zapisuje dzienne metryki z API jednym upsertem (bulk_create z update_conflicts
+    po unikalnym kluczu lead/year/month/day/source) — dni już obecne są nadpisywane.
+    Te same dni trafiają też do spakowanych miesięcy GBPMetricsMonth (gbp_series) —
+    w tej samej transakcji, bo z nich czytają raporty i wykrywanie luk (gbp_gaps).
+    daily_data: {'YYYY-MM-DD': metryki} z parse_performance()['daily'].
+    only_days: zbiór (year, month, day) do zapisu; None = wszystkie dni z odpowiedzi.
+    Zwraca liczbę zapisanych dni.
+    """
+    from datetime import date
+    from django.db import transaction
+    from leads.models import GBPMetricsSnapshot
+    from .gbp_series import write_days
+
+    rows = []
+    for date_str, metrics in daily_data.items():
+        try:
+            d = date.fromisoformat(date_str)
+        except ValueError:
+            continue
+        if only_days is not None and (d.year, d.month, d.day) not in only_days:
+            continue
+        rows.append(GBPMetricsSnapshot(
+            lead=lead,
+            year=d.year, month=d.month, day=d.day,
+            source=GBPMetricsSnapshot.SOURCE_API,
+            **_metrics_to_snapshot_kwargs(metrics, direction_map, date_str),
+        ))
+
+    with transaction.atomic():
+        GBPMetricsSnapshot.objects.bulk_create(
+            rows,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['lead', 'year', 'month', 'day', 'source'],
+            # updated_at oznacza miesiąc do przeliczenia w rollupie
+            update_fields=DAILY_METRIC_FIELDS + ['updated_at'],
+        )
+        # Write-through do spakowanych miesięcy (GBPMetricsMonth)
+        write_days(lead.pk, {
+            date(row.year, row.month, row.day): {field: getattr(row, field) for field in DAILY_METRIC_FIELDS}
+            for row in rows
+        })
+    return len(rows)
+
+
 def parse_performance(raw):
     result = {}
     daily = {}
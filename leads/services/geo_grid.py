@@ -0,0 +1,227 @@
+"""
+Skan pozycji frazy na siatce N×N punktów wokół wizytówki (geo-grid / heatmapa).
+
+Punkty siatki przyciągamy do globalnej sieci współrzędnych o kroku `spacing_km`
+(krok długości liczony dla pasa szerokości zaokrąglonego do 1°). Dzięki temu
+pobliscy klienci z tą samą frazą trafiają w identyczne punkty — taki punkt ma
+ten sam klucz w SerpSnapshot i jest pobierany z API tylko raz dziennie.
+
+Wszystkie brakujące SERP-y ze wszystkich skanów idą razem przez kolejkę
+standard DataForSEO (task_post po 100 zadań).
+"""
+import logging
+import math
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .dataforseo_serp import (
+    ENGINE_MAPS, serp_key, serp_key_tag, get_stored_items, store_items,
+    post_tasks, collect_tasks, find_position, lead_cid_number,
+)
+
+logger = logging.getLogger(__name__)
+
+KM_PER_DEGREE = 111.32
+GRID_ZOOM = 14
+GRID_DEPTH = 20
+# Dopuszczalny odstęp punktów siatki (km)
+MIN_SPACING_KM = 0.2
+MAX_SPACING_KM = 10.0
+# Tryb changed_only pobiera całą siatkę, jeśli ostatnie pełne pobranie jest starsze
+FULL_REFRESH_DAYS = 7
+
+
+def grid_steps(lat, spacing_km):
+    """Krok siatki w stopniach (szerokość, długość) dla pasa szerokości zaokrąglonego do 1°."""
+    band = round(lat)
+    return spacing_km / KM_PER_DEGREE, spacing_km / (KM_PER_DEGREE * math.cos(math.radians(band)))
+
+
+def _snap(value, step):
+    return round(round(value / step) * step, 6)
+
+
+def grid_points(lat, lng, size, spacing_km):
+    """Macierz size×size punktów "lat,lng,zoom" wokół (lat, lng), wiersze od północy."""
+    lat_step, lng_step = grid_steps(lat, spacing_km)
+    center_lat, center_lng = _snap(lat, lat_step), _snap(lng, lng_step)
+    offsets = [i - size // 2 for i in range(size)]
+    return [
+        [
+            f"{round(center_lat + row * lat_step, 6)},{round(center_lng + col * lng_step, 6)},{GRID_ZOOM}"
+            for col in offsets
+        ]
+        for row in reversed(offsets)
+    ]
+
+
+def scan_center(lead):
+    """(lat, lng) wizytówki, a gdy brak — miasta. None jeśli nie ma żadnych współrzędnych."""
+    if lead.latitude is not None and lead.longitude is not None:
+        return lead.latitude, lead.longitude
+    if lead.city.has_coordinates:
+        return lead.city.latitude, lead.city.longitude
+    return None
+
+
+def create_scan(keyword, size=5, spacing_km=1.0):
+    """Zakłada skan (status pending) z punktami siatki. ValueError gdy lead i miasto nie mają GPS."""
+    from leads.models import GeoGridScan
+    center = scan_center(keyword.lead)
+    if center is None:
+        raise ValueError(f'Brak współrzędnych dla {keyword.lead}')
+    return GeoGridScan.objects.create(
+        keyword=keyword,
+        size=size,
+        spacing_km=spacing_km,
+        points=grid_points(center[0], center[1], size, spacing_km),
+    )
+
+
+def point_payload(phrase, point):
+    return {
+        "keyword": phrase,
+        "language_name": "Polish",
+        "location_coordinate": point,
+        "depth": GRID_DEPTH,
+    }
+
+
+def _neighbours(cells, size):
+    """Komórki z listy wraz z sąsiadami (8 kierunków) — ruch pozycji rozlewa się po okolicy."""
+    result = set()
+    for row, col in cells:
+        for d_row in (-1, 0, 1):
+            for d_col in (-1, 0, 1):
+                r, c = row + d_row, col + d_col
+                if 0 <= r < size and 0 <= c < size:
+                    result.add((r, c))
+    return result
+
+
+def cells_to_fetch(scan, previous, changed_only=False, full_fetched_at=None):
+    """
+    Komórki do pobrania. Bez poprzedniego skanu na tej samej siatce — wszystkie.
+    changed_only — tylko komórki zmienione w poprzednim skanie i ich sąsiedzi;
+    reszta jest przepisywana z poprzedniego skanu. Gdy cała siatka nie była
+    pobierana od FULL_REFRESH_DAYS (full_fetched_at), pobieramy wszystko —
+    inaczej skan bez zmian zamroziłby siatkę na zawsze.
+    """
+    refresh_due = full_fetched_at is None or full_fetched_at < timezone.now() - timedelta(days=FULL_REFRESH_DAYS)
+    if previous is None or not changed_only or refresh_due:
+        return {(r, c) for r in range(scan.size) for c in range(scan.size)}
+    return _neighbours(previous.changed_cells, scan.size)
+
+
+def previous_scan(scan):
+    """Ostatni gotowy skan tej frazy na identycznej siatce albo None."""
+    from leads.models import GeoGridScan
+    previous = (
+        GeoGridScan.objects
+        .filter(keyword=scan.keyword, status=GeoGridScan.STATUS_DONE)
+        .exclude(pk=scan.pk)
+        .first()
+    )
+    if previous is None or previous.points != scan.points:
+        return None
+    return previous
+
+
+def last_full_fetch(scan):
+    """Kiedy ostatnio pobrano całą siatkę tej frazy (ta sama siatka) albo None."""
+    from leads.models import GeoGridScan
+    full_scans = (
+        GeoGridScan.objects
+        .filter(keyword=scan.keyword, status=GeoGridScan.STATUS_DONE, fetched_cells=scan.size * scan.size)
+        .exclude(pk=scan.pk)
+        .only('points', 'finished_at')
+    )
+    for full_scan in full_scans:
+        if full_scan.points == scan.points:
+            return full_scan.finished_at
+    return None
+
+
+def changed_cells(old_positions, new_positions):
+    """Lista [wiersz, kolumna] komórek z inną pozycją niż w poprzednim skanie (bez poprzedniego — wszystkie)."""
+    cells = []
+    for r, row in enumerate(new_positions):
+        for c, position in enumerate(row):
+            if not old_positions or old_positions[r][c] != position:
+                cells.append([r, c])
+    return cells
+
+
+def run_scans(scans, login, password, changed_only=False):
+    """
+    Wykonuje skany (GeoGridScan w statusie pending) jednym przebiegiem kolejki standard.
+    changed_only=True — pobiera tylko komórki zmienione w poprzednim skanie (i sąsiadów).
+    Zwraca dict: scans, cells, serps, tasks, failed.
+    """
+    from leads.models import GeoGridScan
+
+    today = timezone.localdate()
+    plans = []
+    keys, requests_by_tag = {}, {}
+    for scan in scans:
+        previous = previous_scan(scan)
+        full_fetched_at = last_full_fetch(scan) if previous is not None and changed_only else None
+        cells = cells_to_fetch(scan, previous, changed_only, full_fetched_at)
+        cell_tags = {}
+        for row, col in cells:
+            payload = point_payload(scan.keyword.phrase, scan.points[row][col])
+            key = serp_key(ENGINE_MAPS, payload)
+            tag = serp_key_tag(key)
+            cell_tags[(row, col)] = tag
+            if tag not in keys:
+                keys[tag] = key
+                requests_by_tag[tag] = payload
+        plans.append((scan, previous, cell_tags))
+
+    # Punkty wspólne dla wielu skanów / pobrane już dzisiaj nie idą do API
+    items_by_tag = get_stored_items(keys, today)
+    pending = [dict(payload, tag=tag) for tag, payload in requests_by_tag.items() if tag not in items_by_tag]
+    task_ids = post_tasks(ENGINE_MAPS, pending, login, password) if pending else {}
+    if task_ids:
+        results = collect_tasks(ENGINE_MAPS, task_ids.values(), login, password)
+        fetched = {tag: results[task_id] for tag, task_id in task_ids.items() if results.get(task_id) is not None}
+        store_items([(keys[tag], items) for tag, items in fetched.items()], today)
+        items_by_tag.update(fetched)
+
+    total_cells = total_failed = 0
+    for scan, previous, cell_tags in plans:
+        lead = scan.keyword.lead
+        cid_number = lead_cid_number(lead)
+        positions = [row[:] for row in previous.positions] if previous is not None else [
+            [None] * scan.size for _ in range(scan.size)
+        ]
+        failed = 0
+        for (row, col), tag in cell_tags.items():
+            items = items_by_tag.get(tag)
+            if items is None:
+                failed += 1
+                positions[row][col] = None
+                continue
+            positions[row][col] = find_position(lead, ENGINE_MAPS, items, cid_number)
+
+        scan.positions = positions
+        scan.changed_cells = changed_cells(previous.positions if previous else None, positions)
+        scan.fetched_cells = len(cell_tags)
+        scan.failed_cells = failed
+        scan.status = GeoGridScan.STATUS_FAILED if cell_tags and failed == len(cell_tags) else GeoGridScan.STATUS_DONE
+        scan.finished_at = timezone.now()
+        total_cells += len(cell_tags)
+        total_failed += failed
+
+    GeoGridScan.objects.bulk_update(
+        scans, ['positions', 'changed_cells', 'fetched_cells', 'failed_cells', 'status', 'finished_at'],
+    )
+    logger.info(
+        f'[Geo grid] skanów {len(scans)}, komórek {total_cells}, unikalnych SERP {len(keys)}, '
+        f'zadań {len(task_ids)}, błędów {total_failed}'
+    )
+    return {
+        'scans': len(scans), 'cells': total_cells, 'serps': len(keys),
+        'tasks': len(task_ids), 'failed': total_failed,
+    }
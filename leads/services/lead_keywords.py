@@ -0,0 +1,72 @@
+"""
+Hurtowe dodawanie fraz kluczowych leadów i synchronizacja do VoivodeshipKeyword.
+
+Sygnał post_save LeadKeyword synkuje frazę do województwa pojedynczo
+(odczyt miasta i województwa + get_or_create na każdy zapis). Przy imporcie
+wielu fraz add_lead_keywords() zapisuje je jednym bulk_create, a unikalne
+pary (województwo, fraza) jednym bulk_create(ignore_conflicts=True).
+
+Kod, który zapisuje frazy pojedynczo, ale w pętli, może wyłączyć sygnał
+w keyword_sync_disabled() i na końcu wywołać sync_voivodeship_keywords().
+Wyłączenie dotyczy tylko bieżącego wątku.
+"""
+import threading
+from contextlib import contextmanager
+
+_state = threading.local()
+
+
+@contextmanager
+def keyword_sync_disabled():
+    """Wyłącza synchronizację fraz do województwa w sygnale post_save (w tym wątku)."""
+    _state.disabled = getattr(_state, 'disabled', 0) + 1
+    try:
+        yield
+    finally:
+        _state.disabled -= 1
+
+
+def keyword_sync_enabled():
+    return not getattr(_state, 'disabled', 0)
+
+
+def sync_voivodeship_keywords(keywords):
+    """
+    Dodaje frazy LeadKeyword do województw ich leadów (leady bez miasta lub
+    województwa są pomijane, istniejące frazy ignorowane).
+    Zwraca liczbę unikalnych par (województwo, fraza).
+    """
+    from leads.models import Lead, VoivodeshipKeyword
+
+    keywords = list(keywords)
+    voivodeships = dict(
+        Lead.objects.filter(pk__in={kw.lead_id for kw in keywords}, city__voivodeship__isnull=False)
+        .values_list('pk', 'city__voivodeship_id')
+    )
+    pairs = {
+        (voivodeships[kw.lead_id], kw.phrase)
+        for kw in keywords
+        if kw.lead_id in voivodeships
+    }
+    VoivodeshipKeyword.objects.bulk_create(
+        [VoivodeshipKeyword(voivodeship_id=voivodeship_id, phrase=phrase) for voivodeship_id, phrase in pairs],
+        ignore_conflicts=True,
+    )
+    return len(pairs)
+
+
+def add_lead_keywords(lead, phrases):
+    """
+    Dodaje do leada frazy, których jeszcze nie ma (puste i powtórzone pomija),
+    i synkuje je do województwa. Zwraca listę utworzonych LeadKeyword.
+    """
+    from leads.models import LeadKeyword
+
+    phrases = list(dict.fromkeys(p.strip() for p in phrases if p and p.strip()))
+    existing = set(lead.keywords_list.filter(phrase__in=phrases).values_list('phrase', flat=True))
+    created = LeadKeyword.objects.bulk_create([
+        LeadKeyword(lead=lead, phrase=phrase) for phrase in phrases if phrase not in existing
+    ])
+    if created:
+        sync_voivodeship_keywords(created)
+    return created
@@ -0,0 +1,130 @@
+"""
+Analityka historii pozycji dla wykresów klienta (client_detail).
+
+Wszystkie sprawdzenia pozycji leada pobieramy jednym zapytaniem do tablic NumPy
+i liczymy wektorowo: trend, średnią kroczącą, widoczność oraz próbkowanie
+długich serii do stałej liczby punktów wykresu.
+
+Wynik trzymamy w cache z kluczem zależnym od ostatniego sprawdzenia
+(max id + liczba), więc nowe / usunięte sprawdzenie od razu go unieważnia.
+"""
+from datetime import datetime
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils import timezone
+
+# Maksymalna liczba punktów na wykresie — dłuższe serie są uśredniane w przedziałach
+CHART_POINTS = 60
+MOVING_AVERAGE_WINDOW = 5
+# Brak w top 20 = zerowa widoczność
+NOT_RANKED = 21
+CACHE_TTL = 24 * 60 * 60
+
+
+def visibility(positions):
+    """Widoczność 0–100 dla tablicy pozycji (NaN = poza SERP): 1. miejsce = 100, 21+ = 0."""
+    scores = np.clip((NOT_RANKED - positions) / (NOT_RANKED - 1), 0, 1) * 100
+    return np.where(np.isnan(positions), 0.0, scores)
+
+
+def moving_average(positions, window=MOVING_AVERAGE_WINDOW):
+    """Średnia krocząca z pominięciem NaN (okno kończy się na danym punkcie)."""
+    known = ~np.isnan(positions)
+    sums = np.cumsum(np.where(known, positions, 0.0))
+    counts = np.cumsum(known)
+    sums[window:] = sums[window:] - sums[:-window]
+    counts[window:] = counts[window:] - counts[:-window]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def downsample(positions, timestamps, points=CHART_POINTS):
+    """
+    Uśrednia serię do max `points` punktów (średnia ze znanych pozycji w przedziale,
+    NaN gdy w przedziale fraza była tylko poza SERP). Znacznik czasu = koniec przedziału.
+    """
+    if len(positions) <= points:
+        return positions, timestamps
+    starts = np.linspace(0, len(positions), points, endpoint=False).astype(int)
+    known = ~np.isnan(positions)
+    sums = np.add.reduceat(np.where(known, positions, 0.0), starts)
+    counts = np.add.reduceat(known.astype(int), starts)
+    ends = np.append(starts[1:], len(positions)) - 1
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+    return means, timestamps[ends]
+
+
+def trend(positions):
+    """Ostatnia vs przedostatnia znana pozycja (dodatni = lepiej) albo None."""
+    known = positions[~np.isnan(positions)]
+    if len(known) < 2:
+        return None
+    return int(known[-2] - known[-1])
+
+
+def _to_list(values):
+    """Tablica → lista do JSON: NaN → None, pozycje zaokrąglone do 0.1."""
+    return [None if np.isnan(v) else (int(v) if float(v).is_integer() else round(float(v), 1)) for v in values]
+
+
+def _load(lead_id):
+    """Wszystkie sprawdzenia leada jednym zapytaniem → lista (fraza, pozycje, znaczniki czasu)."""
+    from leads.models import KeywordRankCheck
+
+    rows = list(
+        KeywordRankCheck.objects
+        .filter(keyword__lead_id=lead_id)
+        .order_by('keyword__created_at', 'keyword_id', 'checked_at')
+        .values_list('keyword_id', 'keyword__phrase', 'position', 'checked_at')
+    )
+    if not rows:
+        return []
+
+    keyword_ids = np.array([r[0] for r in rows])
+    positions = np.array([np.nan if r[2] is None else r[2] for r in rows], dtype=float)
+    timestamps = np.array([r[3].timestamp() for r in rows])
+
+    # Granice serii poszczególnych fraz (wiersze posortowane po frazie)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(keyword_ids)) + 1))
+    ends = np.append(starts[1:], len(rows))
+    return [(rows[s][1], positions[s:e], timestamps[s:e]) for s, e in zip(starts, ends)]
+
+
+def compute_lead_charts(lead_id):
+    """Dane wykresów dla wszystkich fraz leada (bez cache)."""
+    tz = timezone.get_current_timezone()
+    charts = []
+    for phrase, positions, timestamps in _load(lead_id):
+        averaged = moving_average(positions)
+        points, point_times = downsample(positions, timestamps)
+        average_points, _ = downsample(averaged, timestamps)
+        charts.append({
+            'phrase': phrase,
+            'labels': [
+                datetime.fromtimestamp(ts, tz).strftime('%d.%m.%Y') for ts in point_times
+            ],
+            'data': _to_list(points),
+            'moving_average': _to_list(average_points),
+            'trend': trend(positions),
+            'visibility': round(float(visibility(positions[-1:])[0]), 1),
+            'checks': len(positions),
+        })
+    return charts
+
+
+def lead_charts(lead_id):
+    """Dane wykresów z cache — przeliczane dopiero gdy pojawi się nowe (albo zniknie) sprawdzenie."""
+    from leads.models import KeywordRankCheck
+
+    version = KeywordRankCheck.objects.filter(keyword__lead_id=lead_id).aggregate(
+        last_id=Max('id'), count=Count('id'),
+    )
+    key = f"rank_charts:{lead_id}:{version['last_id']}:{version['count']}"
+    charts = cache.get(key)
+    if charts is None:
+        charts = compute_lead_charts(lead_id)
+        cache.set(key, charts, CACHE_TTL)
+    return charts
@@ -0,0 +1,159 @@
+"""
+Adaptacyjny harmonogram sprawdzania pozycji fraz.
+
+Zamiast sprawdzać każdą frazę w poniedziałek i czwartek, każda fraza dostaje
+własny interwał na podstawie historii KeywordRankCheck:
+- zmienność — średnia zmiana pozycji między kolejnymi sprawdzeniami,
+- odległość od top 3 — pozycje 4–10 ruszają się najczęściej i tam zmiana boli najbardziej,
+- czas od ostatniego sprawdzenia.
+
+Codziennie wybieramy frazy z minionym terminem, sortujemy po priorytecie
+i wydajemy najwyżej RANK_CHECK_DAILY_BUDGET zapytań (unikalnych SERP-ów).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .dataforseo_serp import build_rank_payload, serp_key, serp_key_tag
+
+# Ile historii bierzemy pod uwagę
+HISTORY_DAYS = 90
+HISTORY_CHECKS = 8
+
+# Brak w top 20 liczymy jako pozycję 21 — "nie ma" i "21." to dla nas to samo
+NOT_RANKED = 21
+
+# Dotychczasowy stały harmonogram: poniedziałek + czwartek
+FIXED_CHECKS_PER_WEEK = 2
+
+
+def _capped(position):
+    return NOT_RANKED if position is None else min(position, NOT_RANKED)
+
+
+def volatility(positions):
+    """Średnia bezwzględna zmiana pozycji między kolejnymi sprawdzeniami albo None (za mało danych)."""
+    capped = [_capped(p) for p in positions]
+    if len(capped) < 2:
+        return None
+    return sum(abs(a - b) for a, b in zip(capped, capped[1:])) / (len(capped) - 1)
+
+
+def check_interval(positions):
+    """
+    Interwał (dni) między sprawdzeniami frazy. positions: od najnowszej.
+    0 = sprawdzić od razu (brak historii).
+    """
+    if not positions:
+        return 0
+    vol = volatility(positions)
+    if vol is None:
+        return 2  # jedno sprawdzenie — za mało żeby ocenić
+    if vol >= 3:
+        return 1
+    if vol >= 1:
+        return 2
+
+    # Stabilna fraza — interwał zależy od tego, gdzie stoi
+    last = _capped(positions[0])
+    if last <= 3:
+        return 7
+    if last >= NOT_RANKED:
+        return 14
+    if last <= 10:
+        return 3
+    return 5
+
+
+def priority(positions, days_since, interval):
+    """Im bardziej przeterminowana, zmienna i bliżej top 3 — tym wcześniej w kolejce."""
+    if interval == 0:
+        return float('inf')
+    overdue = days_since / interval
+    vol = volatility(positions) or 0
+    proximity = 1 / (1 + max(0, _capped(positions[0]) - 3) / 5)  # 1.0 w top 3, maleje dalej
+    return overdue * (1 + vol) * (0.5 + proximity)
+
+
+def _histories(today):
+    """{pk frazy: [(pozycja, dzień), ...]} od najnowszego — jedno zapytanie dla wszystkich klientów."""
+    from leads.models import KeywordRankCheck
+
+    since = timezone.now() - timedelta(days=HISTORY_DAYS)
+    rows = (
+        KeywordRankCheck.objects
+        .filter(keyword__lead__status='client', checked_at__gte=since)
+        .order_by('keyword_id', '-checked_at')
+        .values_list('keyword_id', 'position', 'checked_at')
+    )
+    histories = {}
+    for keyword_id, position, checked_at in rows:
+        history = histories.setdefault(keyword_id, [])
+        if len(history) < HISTORY_CHECKS:
+            history.append((position, timezone.localdate(checked_at)))
+    return histories
+
+
+def plan_rank_checks(today=None, budget=None):
+    """
+    Wybiera frazy klientów do sprawdzenia dzisiaj.
+
+    Budżet liczony w unikalnych SERP-ach (tyle zapytań do API) — frazy dzielące
+    SERP z wybraną frazą sprawdzamy przy okazji, bez dodatkowego kosztu.
+    Zwraca dict z keyword_ids i raportem: ile fraz miało termin, ile odłożono
+    przez budżet, ile zapytań wydamy i ile zaoszczędzimy względem stałego
+    harmonogramu (średnio na dzień).
+    """
+    from leads.models import LeadKeyword
+
+    today = today or timezone.localdate()
+    budget = settings.RANK_CHECK_DAILY_BUDGET if budget is None else budget
+
+    keywords = list(LeadKeyword.objects.filter(lead__status='client').select_related('lead', 'lead__city'))
+    histories = _histories(today)
+
+    tags = {}
+    candidates = []
+    for kw in keywords:
+        tags[kw.pk] = serp_key_tag(serp_key(*build_rank_payload(kw.lead, kw.phrase)))
+        history = histories.get(kw.pk, [])
+        positions = [position for position, _ in history]
+        interval = check_interval(positions)
+        days_since = (today - history[0][1]).days if history else None
+        if days_since == 0:
+            continue  # sprawdzona dzisiaj
+        if interval == 0 or days_since >= interval:
+            candidates.append((priority(positions, days_since, interval), kw))
+
+    candidates.sort(key=lambda c: c[0], reverse=True)
+    chosen_tags = set()
+    deferred = 0
+    for _, kw in candidates:
+        tag = tags[kw.pk]
+        if tag in chosen_tags:
+            continue
+        if len(chosen_tags) >= budget:
+            deferred += 1
+            continue
+        chosen_tags.add(tag)
+
+    # Frazy ze wspólnym SERP-em (także bez terminu) — sprawdzamy przy okazji
+    keyword_ids = [
+        kw.pk for kw in keywords
+        if tags[kw.pk] in chosen_tags and not (
+            kw.pk in histories and histories[kw.pk][0][1] == today
+        )
+    ]
+
+    fixed_calls = len(set(tags.values())) * FIXED_CHECKS_PER_WEEK / 7
+    return {
+        'keyword_ids': keyword_ids,
+        'keywords_total': len(keywords),
+        'due': len(candidates),
+        'scheduled': len(keyword_ids),
+        'deferred': deferred,
+        'calls': len(chosen_tags),
+        'fixed_schedule_calls': round(fixed_calls, 1),
+        'calls_saved': round(fixed_calls - len(chosen_tags), 1),
+    }
@@ -0,0 +1,79 @@
+"""
+Miesięczne snapshoty pozycji (ClientRankSnapshot) liczone zbiorczo.
+
+Ostatnią pozycję każdej frazy wszystkich klientów pobieramy jednym zapytaniem
+z funkcją okna (ROW_NUMBER po frazie), budujemy payloady w pamięci i zapisujemy
+jednym bulk upsertem po (lead, year, month). Liczba zapytań nie zależy od
+liczby klientów ani fraz.
+"""
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+
+def latest_checks(lead_ids):
+    """{pk frazy: (pozycja, checked_at)} — ostatnie sprawdzenie każdej frazy leadów, jedno zapytanie."""
+    from leads.models import KeywordRankCheck
+
+    rows = (
+        KeywordRankCheck.objects
+        .filter(keyword__lead_id__in=lead_ids)
+        .annotate(row_number=Window(
+            RowNumber(),
+            partition_by=[F('keyword_id')],
+            order_by=[F('checked_at').desc(), F('id').desc()],
+        ))
+        .filter(row_number=1)
+        .values_list('keyword_id', 'position', 'checked_at')
+    )
+    return {keyword_id: (position, checked_at) for keyword_id, position, checked_at in rows}
+
+
+def snapshot_positions(lead_ids):
+    """{lead_id: positions} w formacie ClientRankSnapshot.positions, frazy w kolejności dodania."""
+    from leads.models import LeadKeyword
+
+    latest = latest_checks(lead_ids)
+    positions = {lead_id: [] for lead_id in lead_ids}
+    keywords = (
+        LeadKeyword.objects
+        .filter(lead_id__in=lead_ids)
+        .order_by('created_at', 'pk')
+        .values_list('pk', 'lead_id', 'phrase')
+    )
+    for keyword_id, lead_id, phrase in keywords:
+        position, checked_at = latest.get(keyword_id, (None, None))
+        positions[lead_id].append({
+            'phrase': phrase,
+            'position': position,
+            'checked_at': checked_at.isoformat() if checked_at else None,
+        })
+    return positions
+
+
+def save_rank_snapshots(lead_ids, triggered_by='auto', year=None, month=None):
+    """
+    Tworzy / nadpisuje snapshoty leadów na dany miesiąc (domyślnie bieżący)
+    jednym bulk upsertem. Zwraca liczbę zapisanych snapshotów.
+    """
+    from leads.models import ClientRankSnapshot
+
+    now = timezone.now()
+    year = year or now.year
+    month = month or now.month
+    lead_ids = list(lead_ids)
+    if not lead_ids:
+        return 0
+
+    snapshots = [
+        ClientRankSnapshot(lead_id=lead_id, year=year, month=month, positions=positions, triggered_by=triggered_by)
+        for lead_id, positions in snapshot_positions(lead_ids).items()
+    ]
+    ClientRankSnapshot.objects.bulk_create(
+        snapshots,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['lead', 'year', 'month'],
+        update_fields=['positions', 'triggered_by'],
+    )
+    return len(snapshots)
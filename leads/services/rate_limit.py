@@ -0,0 +1,144 @@
+"""
+Limiter zapytań do zewnętrznych API.
+
+Limit dostawcy (settings.API_RATE_LIMITS, zapytań na minutę) jest wspólny dla
+wszystkich procesów — workerów Celery, podzadań chorda i gunicorna. Liczymy
+zapytania w oknach czasowych w cache 'shared' (Redis): każde zapytanie to
+INCR klucza bieżącego okna; po wyczerpaniu puli czekamy na następne okno.
+
+Gdy Redis jest niedostępny, limiter przechodzi na lokalny kubełek tokenów
+(TokenBucket) — wtedy limit obowiązuje tylko w obrębie procesu. Do Redisa wraca
+po DEGRADED_RETRY_AFTER sekundach, żeby nieosiągalny host (timeout połączenia)
+nie spowalniał każdego zapytania do API.
+
+concurrency_slot() to wspólny sufit równoległości (np. ile lokalizacji GBP
+pobieramy naraz we wszystkich podzadaniach chorda), też w cache 'shared'.
+"""
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = 'shared'
+KEY_PREFIX = 'ratelimit'
+# Po błędzie cache limiter używa kubełka lokalnego przez tyle sekund, zanim znów spróbuje Redisa
+DEGRADED_RETRY_AFTER = 30
+
+
+class TokenBucket:
+    """Kubełek tokenów: `rate_per_minute` tokenów na minutę, max `burst` naraz."""
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1, int(rate_per_minute // 60) or 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Blokuje do momentu aż token będzie dostępny."""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class SharedRateLimiter:
+    """
+    Limit `rate_per_minute` wspólny dla wszystkich procesów (licznik okna w cache 'shared').
+    Okno trwa 1 s (przy limicie poniżej 60/min — 60 s), więc zapytania rozkładają się
+    równomiernie w minucie zamiast iść całą pulą na jej początku.
+    """
+
+    def __init__(self, provider, rate_per_minute):
+        self.provider = provider
+        self.window = 1 if rate_per_minute >= 60 else 60
+        self.limit = max(1, int(rate_per_minute * self.window / 60))
+        self.fallback = TokenBucket(rate_per_minute)
+        self.degraded = False
+        self.degraded_until = 0.0
+
+    def acquire(self):
+        """Blokuje do momentu aż w bieżącym oknie jest wolne miejsce."""
+        while True:
+            if time.monotonic() < self.degraded_until:
+                return self.fallback.acquire()
+            now = time.time()
+            window_start = int(now // self.window) * self.window
+            key = f'{KEY_PREFIX}:{self.provider}:{window_start}'
+            try:
+                cache = caches[CACHE_ALIAS]
+                cache.add(key, 0, self.window + 1)
+                used = cache.incr(key)
+            except ValueError:
+                continue  # klucz okna wygasł między add a incr
+            except Exception as e:
+                if not self.degraded:
+                    logger.warning(f'[Rate limit] {self.provider}: cache niedostępny, limit lokalny procesu: {e}')
+                    self.degraded = True
+                self.degraded_until = time.monotonic() + DEGRADED_RETRY_AFTER
+                return self.fallback.acquire()
+            self.degraded = False
+            if used <= self.limit:
+                return
+            time.sleep(max(window_start + self.window - now, 0.01))
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider):
+    """Zwraca limiter dostawcy (np. 'dataforseo') ze wspólnym limitem dla wszystkich procesów."""
+    with _limiters_lock:
+        if provider not in _limiters:
+            _limiters[provider] = SharedRateLimiter(provider, settings.API_RATE_LIMITS[provider])
+        return _limiters[provider]
+
+
+SLOT_POLL_INTERVAL = 0.5
+
+
+@contextmanager
+def concurrency_slot(name, limit, ttl):
+    """
+    Zajmuje jedno z `limit` miejsc wspólnych dla wszystkich procesów; czeka, aż któreś się zwolni.
+    Miejsce wygasa samo po `ttl` sekundach (gdyby proces padł). Bez Redisa — bez limitu.
+    """
+    token = uuid.uuid4().hex
+    keys = [f'{KEY_PREFIX}:slot:{name}:{i}' for i in range(max(1, limit))]
+    try:
+        cache = caches[CACHE_ALIAS]
+        taken = None
+        while taken is None:
+            taken = next((key for key in keys if cache.add(key, token, ttl)), None)
+            if taken is None:
+                time.sleep(SLOT_POLL_INTERVAL)
+    except Exception as e:
+        logger.warning(f'[Rate limit] {name}: cache niedostępny, bez limitu równoległości: {e}')
+        yield
+        return
+
+    try:
+        yield
+    finally:
+        try:
+            if cache.get(taken) == token:
+                cache.delete(taken)
+        except Exception as e:
+            logger.warning(f'[Rate limit] {name}: nie zwolniono miejsca: {e}')
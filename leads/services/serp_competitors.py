@@ -0,0 +1,100 @@
+"""
+Indeks konkurencji z zapisanych SERP-ów (SerpCompetitorPosition).
+
+Odpowiada na pytania 'kto jest nad klientem dla tej frazy' i 'jak się przesuwał'
+wyłącznie z lokalnych danych — bez dodatkowego zapytania do DataForSEO.
+Konkurenta identyfikujemy po CID (Maps) albo domenie (organiczne).
+"""
+from datetime import timedelta
+
+from django.db.models import Max
+from django.utils import timezone
+
+from .dataforseo_serp import (
+    ENGINE_MAPS, build_rank_payload, serp_key, find_position,
+    lead_cid_number, lead_website_domain,
+)
+
+
+def keyword_serp_filter(keyword):
+    """Filtr (fraza, silnik, lokalizacja) SERP-a, w którym śledzona jest fraza leada."""
+    engine, payload = build_rank_payload(keyword.lead, keyword.phrase)
+    key = serp_key(engine, payload)
+    return {'phrase': key['phrase'], 'engine': engine, 'location': key['location']}
+
+
+def competitor_identity(position):
+    """Klucz konkurenta między dniami: CID na Maps, domena w organicznych."""
+    if position.engine == ENGINE_MAPS and position.cid:
+        return position.cid
+    return position.domain or position.title
+
+
+def _client_rank(lead, engine, positions):
+    """Pozycja klienta w zapisanym SERP-ie — to samo dopasowanie co przy sprawdzaniu pozycji."""
+    items = [
+        {'type': 'organic', 'rank_absolute': p.rank, 'cid': p.cid, 'title': p.title, 'domain': p.domain}
+        for p in positions
+    ]
+    return find_position(lead, engine, items, lead_cid_number(lead), lead_website_domain(lead))
+
+
+def competitors_above(keyword, day=None, compare_days=7):
+    """
+    Konkurencja nad klientem w ostatnim zapisanym SERP-ie frazy (do dnia `day` włącznie)
+    i zmiana pozycji względem SERP-a sprzed co najmniej `compare_days` dni.
+
+    Zwraca dict: day, client_rank, compared_to, competitors — lista dictów
+    (rank, previous_rank, change, cid, domain, title, rating, reviews_count).
+    Gdy klienta nie ma w SERP, 'nad nim' jest cały SERP.
+    """
+    from leads.models import SerpCompetitorPosition
+
+    filt = keyword_serp_filter(keyword)
+    qs = SerpCompetitorPosition.objects.filter(**filt)
+    if day is not None:
+        qs = qs.filter(day__lte=day)
+
+    latest = qs.aggregate(day=Max('day'))['day']
+    if latest is None:
+        return {'day': None, 'client_rank': None, 'compared_to': None, 'competitors': []}
+
+    positions = list(qs.filter(day=latest).order_by('rank'))
+    client_rank = _client_rank(keyword.lead, filt['engine'], positions)
+    above = [p for p in positions if client_rank is None or p.rank < client_rank]
+
+    compared_to = qs.filter(day__lte=latest - timedelta(days=compare_days)).aggregate(day=Max('day'))['day']
+    previous = {}
+    if compared_to is not None:
+        for p in qs.filter(day=compared_to):
+            previous[competitor_identity(p)] = p.rank
+
+    competitors = []
+    for p in above:
+        previous_rank = previous.get(competitor_identity(p))
+        competitors.append({
+            'rank': p.rank,
+            'previous_rank': previous_rank,
+            # Dodatnia zmiana = konkurent awansował
+            'change': previous_rank - p.rank if previous_rank is not None else None,
+            'cid': p.cid,
+            'domain': p.domain,
+            'title': p.title,
+            'rating': p.rating,
+            'reviews_count': p.reviews_count,
+        })
+
+    return {'day': latest, 'client_rank': client_rank, 'compared_to': compared_to, 'competitors': competitors}
+
+
+def competitor_history(keyword, identity, days=90):
+    """Historia pozycji jednego konkurenta (CID albo domena) dla frazy: lista (dzień, pozycja)."""
+    from leads.models import SerpCompetitorPosition
+
+    filt = keyword_serp_filter(keyword)
+    qs = SerpCompetitorPosition.objects.filter(**filt, day__gte=timezone.localdate() - timedelta(days=days))
+    if filt['engine'] == ENGINE_MAPS:
+        qs = qs.filter(cid=identity)
+    else:
+        qs = qs.filter(domain=identity)
+    return list(qs.order_by('day').values_list('day', 'rank'))
@@ -0,0 +1,143 @@
+"""
+Single-flight dla płatnych zapytań do zewnętrznych API (DataForSEO).
+
+Identyczne zapytania wysłane w tym samym momencie — podwójne kliknięcie
+"sprawdź frazę", nocny sweep nałożony na ręczne sprawdzenie, dwie analizy
+tej samej wizytówki — wykonujemy raz. Klucz to hash endpointu i kanonicznego
+JSON-a payloadu.
+
+Pierwszy wywołujący zakłada blokadę w cache 'shared' (Redis — wspólny dla
+procesu web i workerów Celery), wykonuje zapytanie i odkłada wynik na chwilę.
+Pozostali czekają na ten wynik zamiast płacić za duplikat; każdy taki
+duplikat zwiększa licznik. Gdy Redis jest niedostępny, zapytanie idzie
+zwyczajnie, bez koalescencji.
+"""
+import hashlib
+import json
+import logging
+import time
+import uuid
+
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = 'shared'
+
+# Blokada wygasa sama, gdyby lider padł w trakcie zapytania
+LOCK_TTL = 120
+# Jak długo wynik lidera czeka na oczekujących — nie krócej niż blokada,
+# żeby oczekujący nie przejął zapytania po wygaśnięciu wyniku i nie zapłacił drugi raz
+RESULT_TTL = LOCK_TTL
+WAIT_TIMEOUT = 120
+POLL_INTERVAL = 0.2
+
+COUNTER_KEY = 'singleflight:suppressed'
+
+_MISSING = object()
+
+
+def request_key(endpoint, payload):
+    """Kanoniczny klucz zapytania: endpoint + payload z posortowanymi kluczami."""
+    raw = json.dumps({'endpoint': endpoint, 'payload': payload}, sort_keys=True, ensure_ascii=False, default=str)
+    return f"singleflight:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+
+def _count_suppressed(cache, endpoint):
+    # Licznik jest tylko statystyką — błąd cache nie może zgubić gotowego wyniku
+    try:
+        for key in (COUNTER_KEY, f'{COUNTER_KEY}:{endpoint}'):
+            cache.add(key, 0, None)
+            cache.incr(key)
+    except Exception as e:
+        logger.warning(f'[Single-flight] {endpoint}: nie zwiększono licznika duplikatów: {e}')
+
+
+def suppressed_count(endpoint=None):
+    """Liczba zduplikowanych zapytań obsłużonych wynikiem innego wywołania (łącznie albo dla endpointu)."""
+    key = f'{COUNTER_KEY}:{endpoint}' if endpoint else COUNTER_KEY
+    try:
+        return caches[CACHE_ALIAS].get(key, 0)
+    except Exception:
+        return 0
+
+
+def _shared_result(cache, endpoint, result_key):
+    """Wynik lidera z cache (licząc obsłużony duplikat) albo _MISSING."""
+    try:
+        result = cache.get(result_key, _MISSING)
+    except Exception as e:
+        logger.warning(f'[Single-flight] {endpoint}: błąd odczytu wyniku: {e}')
+        return _MISSING
+    if result is not _MISSING:
+        _count_suppressed(cache, endpoint)
+        logger.info(f'[Single-flight] {endpoint}: duplikat obsłużony wynikiem lidera')
+    return result
+
+
+def _lock_held(cache, endpoint, lock_key):
+    """Czy lider nadal trzyma blokadę; przy błędzie cache zakładamy, że tak (czekamy dalej do timeoutu)."""
+    try:
+        return cache.get(lock_key) is not None
+    except Exception as e:
+        logger.warning(f'[Single-flight] {endpoint}: błąd odczytu blokady: {e}')
+        return True
+
+
+def single_flight(endpoint, payload, fn):
+    """
+    Wykonuje fn() raz dla wszystkich równoczesnych wywołań z tym samym (endpoint, payload)
+    i zwraca jego wynik każdemu z nich. Wynik musi dać się zapisać w cache (JSON / dict / list).
+    Wyjątek lidera nie jest współdzielony — oczekujący po zwolnieniu blokady próbują sami.
+    """
+    key = request_key(endpoint, payload)
+    lock_key, result_key = f'{key}:lock', f'{key}:result'
+    deadline = time.monotonic() + WAIT_TIMEOUT
+
+    while True:
+        try:
+            cache = caches[CACHE_ALIAS]
+            token = uuid.uuid4().hex
+            leader = cache.add(lock_key, token, LOCK_TTL)
+        except Exception as e:
+            logger.warning(f'[Single-flight] cache niedostępny, zapytanie bez koalescencji: {e}')
+            return fn()
+
+        if leader:
+            try:
+                try:
+                    cache.delete(result_key)
+                except Exception as e:
+                    logger.warning(f'[Single-flight] {endpoint}: nie usunięto starego wyniku: {e}')
+                result = fn()
+                # Zapytanie jest już opłacone — błąd cache nie może zgubić wyniku
+                try:
+                    cache.set(result_key, result, RESULT_TTL)
+                except Exception as e:
+                    logger.warning(f'[Single-flight] {endpoint}: nie zapisano wyniku dla oczekujących: {e}')
+                return result
+            finally:
+                try:
+                    if cache.get(lock_key) == token:
+                        cache.delete(lock_key)
+                except Exception as e:
+                    logger.warning(f'[Single-flight] {endpoint}: nie zwolniono blokady: {e}')
+
+        # Ktoś już wykonuje to zapytanie — czekamy na jego wynik
+        while time.monotonic() < deadline:
+            result = _shared_result(cache, endpoint, result_key)
+            if result is not _MISSING:
+                return result
+            if not _lock_held(cache, endpoint, lock_key):
+                # Lider mógł zapisać wynik i zwolnić blokadę między odczytami
+                result = _shared_result(cache, endpoint, result_key)
+                if result is not _MISSING:
+                    return result
+                break  # lider skończył bez wyniku (błąd) — spróbuj przejąć zapytanie
+            time.sleep(POLL_INTERVAL)
+        else:
+            result = _shared_result(cache, endpoint, result_key)
+            if result is not _MISSING:
+                return result
+            logger.warning(f'[Single-flight] {endpoint}: timeout oczekiwania, zapytanie bez koalescencji')
+            return fn()
@@ -1,6 +1,7 @@
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from .models import CallLog, LeadStatusHistory, LeadKeyword, VoivodeshipKeyword
+from .models import CallLog, LeadStatusHistory, LeadKeyword
+from .services.lead_keywords import keyword_sync_enabled, sync_voivodeship_keywords
 
 
 @receiver(post_save, sender=CallLog)
@@ -49,17 +50,10 @@ def sync_keyword_to_voivodeship(sender, instance, created, **kwargs):
     """
     Po dodaniu frazy kluczowej do leada automatycznie synkuje ją
     do tabeli VoivodeshipKeyword (jeśli lead ma miasto z województwem).
-    Istniejące frazy są ignorowane (get_or_create).
+    Istniejące frazy są ignorowane. Wyłączane w keyword_sync_disabled() —
+    operacje hurtowe synkują frazy jednym zapytaniem (services/lead_keywords.py).
     """
-    try:
-        voivodeship = instance.lead.city.voivodeship
-    except AttributeError:
-        return  # lead nie ma miasta lub miasto nie ma województwa
-
-    if voivodeship is None:
+    if not keyword_sync_enabled():
         return
 
-    VoivodeshipKeyword.objects.get_or_create(
-        voivodeship=voivodeship,
-        phrase=instance.phrase,
-    )
+    sync_voivodeship_keywords([instance])
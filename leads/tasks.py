@@ -10,126 +10,280 @@ from .services.pdf_service import html_to_pdf
 
 logger = logging.getLogger(__name__)
 
+# Backfill GBP: blokada jednej instancji i odstęp przed kolejnym uruchomieniem
+BACKFILL_LOCK_KEY = 'gbp-backfill:lock'
+BACKFILL_LOCK_TTL = 60 * 60
+BACKFILL_REQUEUE_DELAY = 60
+# Nocny przebieg GBP: subtask "w toku" dłużej niż tyle minut uznajemy za porzucony (padł worker)
+GBP_ITEM_STALE_MINUTES = 30
+
 
 @shared_task
 def fetch_gbp_metrics_all():
     """
     Nocny task — pobiera dane GBP dla wszystkich klientów
     i aktualizuje sumy miesięczne.
+    Przebieg (GBPFetchRun) na dany dzień rozdziela klientów na osobne subtaski
+    (chord: grupa fetch_gbp_metrics_client → finalize_gbp_fetch_run). Ponowne
+    uruchomienie w tym samym oknie pomija klientów już pobranych, więc restart
+    workera czy błąd tokenu nie zaczyna pracy od zera.
     """
-    from datetime import date, timedelta
+    from datetime import timedelta
+    from celery import chord
     from django.utils import timezone
-    from django.db.models import Sum
-    from .models import GBPMetricsSnapshot, AppSettings
-    from .services.gbp_service import (
-    get_access_token, get_performance_metrics,
-    parse_performance, compute_monthly_snapshot,
-    _metrics_to_snapshot_kwargs, get_direction_requests,
-    )
+    from .models import AppSettings, GBPFetchRun, GBPFetchRunItem
+    from .services.gbp_service import get_access_token
 
     settings = AppSettings.get()
     if not settings.google_refresh_token:
         logger.warning('[GBP metrics] Brak Google Refresh Token — pomijam')
         return
 
+    # Token sprawdzamy przed rozdzieleniem pracy — subtaski biorą go potem z cache
     try:
-        access_token = get_access_token(settings.google_refresh_token)
+        get_access_token(settings.google_refresh_token)
     except Exception as e:
         logger.error(f'[GBP metrics] Błąd access token: {e}')
         return
 
     # Klienci z przypisanym GBP location
-    clients = Lead.objects.filter(
-        status='client',
-        gbp_location_name__isnull=False,
-    ).exclude(gbp_location_name='')
+    client_ids = list(
+        Lead.objects
+        .filter(status='client', gbp_location_name__isnull=False)
+        .exclude(gbp_location_name='')
+        .values_list('pk', flat=True)
+    )
 
     today = timezone.now().date()
-    date_to = today - timedelta(days=5)   # bufor na opóźnienie Google
-    date_from = today - timedelta(days=35)
+    run, created = GBPFetchRun.objects.get_or_create(
+        window=today,
+        defaults={
+            'date_from': today - timedelta(days=35),
+            'date_to': today - timedelta(days=5),   # bufor na opóźnienie Google
+        },
+    )
+    GBPFetchRunItem.objects.bulk_create(
+        [GBPFetchRunItem(run=run, lead_id=pk) for pk in client_ids],
+        ignore_conflicts=True,
+    )
+    if run.status != GBPFetchRun.STATUS_RUNNING:
+        run.status = GBPFetchRun.STATUS_RUNNING
+        run.save(update_fields=['status'])
+
+    # Gotowi klienci są pomijani, "w toku" i czekający na ponowienie (self.retry, pending
+    # po nieudanej próbie) — tylko porzuceni, inaczej ten sam klient szedłby dwa razy naraz
+    stale = timezone.now() - timedelta(minutes=GBP_ITEM_STALE_MINUTES)
+    todo = list(
+        run.items
+        .exclude(status=GBPFetchRunItem.STATUS_DONE)
+        .exclude(
+            status__in=[GBPFetchRunItem.STATUS_RUNNING, GBPFetchRunItem.STATUS_PENDING],
+            attempts__gt=0, started_at__gte=stale,
+        )
+        .values_list('pk', flat=True)
+    )
+    logger.info(
+        f'[GBP metrics] {"Start" if created else "Wznowienie"} przebiegu {run.window}: '
+        f'klientów {len(client_ids)}, do pobrania {len(todo)}, zakres {run.date_from}–{run.date_to}'
+    )
+    if not todo:
+        return finalize_gbp_fetch_run(run.pk)
 
-    logger.info(f'[GBP metrics] Start dla {clients.count()} klientów, zakres {date_from}–{date_to}')
+    chord(fetch_gbp_metrics_client.s(item_id) for item_id in todo)(finalize_gbp_fetch_run.si(run.pk))
+    return {'run': run.pk, 'dispatched': len(todo)}
 
-    for lead in clients:
-        try:
-            # Normalizacja location_name
-            stored = lead.gbp_location_name.strip()
-            if '/locations/' in stored and stored.startswith('accounts/'):
-                location_name = 'locations/' + stored.split('/locations/')[-1]
-            elif stored.startswith('locations/'):
-                location_name = stored
-            else:
-                location_name = 'locations/' + stored
-
-            # Sprawdź jakich dni brakuje
-            existing_days = set(
-                GBPMetricsSnapshot.objects
-                .filter(
-                    lead=lead,
-                    source=GBPMetricsSnapshot.SOURCE_API,
-                    day__isnull=False,
-                    year__gte=date_from.year,
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=300)
+def fetch_gbp_metrics_client(self, item_id):
+    """
+    Pobiera brakujące dni jednego klienta w ramach przebiegu.
+    Błąd — ponowienie tylko tego klienta (max_retries); po ostatniej próbie status failed,
+    a chord i tak domyka przebieg.
+    """
+    import time
+    from django.conf import settings
+    from django.utils import timezone
+    from .models import AppSettings, GBPFetchRunItem
+    from .services.gbp_service import get_access_token, ingest_daily_metrics
+    from .services.gbp_gaps import missing_days, day_ranges, as_day_tuples, record_unavailable
+    from .services.gbp_harvester import SLOT_TTL, fetch_location
+    from .services.gbp_locations import performance_name
+    from .services.rate_limit import concurrency_slot
+
+    item = GBPFetchRunItem.objects.select_related('run', 'lead').get(pk=item_id)
+    if item.status == GBPFetchRunItem.STATUS_DONE:
+        return item.rows_written
+
+    item.status = GBPFetchRunItem.STATUS_RUNNING
+    item.attempts += 1
+    item.started_at = timezone.now()
+    item.save(update_fields=['status', 'attempts', 'started_at'])
+
+    lead, run = item.lead, item.run
+    started = time.monotonic()
+    try:
+        rows = 0
+        missing = missing_days([lead.pk], run.date_from, run.date_to)[lead.pk]
+        if missing:
+            access_token = get_access_token(AppSettings.get().google_refresh_token)
+            # Podzadania chorda idą równolegle na wielu workerach — wspólny sufit
+            # GBP_FETCH_WORKERS lokalizacji naraz, zapytania pod wspólnym limiterem
+            with concurrency_slot('gbp_performance', settings.GBP_FETCH_WORKERS, SLOT_TTL):
+                daily, directions = fetch_location(
+                    access_token, performance_name(lead.gbp_location_name), day_ranges(missing),
                 )
-                .values_list('year', 'month', 'day')
-            )
-
-            all_days = set()
-            d = date_from
-            while d <= date_to:
-                all_days.add((d.year, d.month, d.day))
-                d += timedelta(days=1)
-
-            missing = all_days - existing_days
-            if not missing:
-                logger.info(f'[GBP metrics] {lead.name} — wszystkie dni są w bazie, pomijam API')
-            else:
-                raw = get_performance_metrics(access_token, location_name, date_from, date_to)
-                parsed = parse_performance(raw)
-                daily_data = parsed.get('daily', {})
-                direction_map = get_direction_requests(access_token, location_name, date_from, date_to)
-
-                saved = 0
-                for date_str, metrics in daily_data.items():
-                    try:
-                        d = date.fromisoformat(date_str)
-                    except ValueError:
-                        continue
-
-                    if (d.year, d.month, d.day) in existing_days:
-                        continue
-
-                    GBPMetricsSnapshot.objects.create(
-                        lead=lead,
-                        year=d.year, month=d.month, day=d.day,
-                        source=GBPMetricsSnapshot.SOURCE_API,
-                        **_metrics_to_snapshot_kwargs(metrics, direction_map, date_str),
-                    )
-                    saved += 1
-
-                logger.info(f'[GBP metrics] {lead.name} — zapisano {saved} nowych dni')
-
-            # Aktualizuj sumy miesięczne dla miesięcy w zakresie
-            months_in_range = set()
-            d = date_from
-            while d <= date_to:
-                months_in_range.add((d.year, d.month))
-                d += timedelta(days=1)
-
-            for year, month in months_in_range:
-                try:
-                    result = compute_monthly_snapshot(lead, year, month)
-                    if result:
-                        snap, created = result
-                        action = 'utworzono' if created else 'zaktualizowano'
-                        logger.info(f'[GBP metrics] {lead.name} — {action} sumę {month:02d}/{year}')
-                except Exception as month_err:
-                    logger.warning(f'[GBP metrics] {lead.name} — błąd sumy {month:02d}/{year}: {month_err}')
-
-        except Exception as e:
-            logger.error(f'[GBP metrics] Błąd dla {lead.name}: {e}')
-            continue
+            rows = ingest_daily_metrics(lead, daily, directions, only_days=as_day_tuples(missing))
+            empty = record_unavailable(lead.pk, missing, daily)
+            logger.info(f'[GBP metrics] {lead.name} — bez danych {empty} dni')
+    except Exception as exc:
+        item.duration = round(time.monotonic() - started, 2)
+        item.error = str(exc)
+        if self.request.retries < self.max_retries:
+            item.status = GBPFetchRunItem.STATUS_PENDING
+            item.save(update_fields=['status', 'duration', 'error'])
+            logger.warning(f'[GBP metrics] {lead.name} — błąd, ponawiam: {exc}')
+            raise self.retry(exc=exc)
+        item.status = GBPFetchRunItem.STATUS_FAILED
+        item.finished_at = timezone.now()
+        item.save(update_fields=['status', 'duration', 'error', 'finished_at'])
+        logger.error(f'[GBP metrics] {lead.name} — błąd po {item.attempts} próbach: {exc}')
+        return 0
+
+    item.status = GBPFetchRunItem.STATUS_DONE
+    item.rows_written = rows
+    item.duration = round(time.monotonic() - started, 2)
+    item.error = ''
+    item.finished_at = timezone.now()
+    item.save(update_fields=['status', 'rows_written', 'duration', 'error', 'finished_at'])
+    logger.info(f'[GBP metrics] {lead.name} — zapisano {rows} nowych dni')
+    return rows
+
 
+@shared_task
+def finalize_gbp_fetch_run(run_id):
+    """
+    Domyka przebieg: sumy miesięczne pobranych klientów, raport czasów i błędów
+    oraz kondycja klientów — dopiero po wszystkich subtaskach (z ponowieniami),
+    żeby nie flagować braku danych z niedopisanego dnia.
+    """
+    from django.utils import timezone
+    from .models import GBPFetchRun, GBPFetchRunItem
+    from .services.gbp_harvester import harvest_report
+    from .services.gbp_health import compute_health
+    from .services.gbp_rollup import rollup_months
+
+    run = GBPFetchRun.objects.get(pk=run_id)
+    items = list(run.items.select_related('lead'))
+    done = [item for item in items if item.status == GBPFetchRunItem.STATUS_DONE]
+
+    report = harvest_report(
+        {item.lead_id: {'latency': item.duration or 0, 'error': item.error or None} for item in items},
+        names={item.lead_id: item.lead.name for item in items},
+    )
+    report['rows_written'] = sum(item.rows_written for item in done)
+    # Sumy miesięczne — tylko miesiące, w których zmieniły się dni
+    report['rollup'] = rollup_months(
+        lead_ids=[item.lead_id for item in done],
+        since=(run.date_from.year, run.date_from.month),
+    )
+    report['health'] = compute_health(as_of=run.date_to)
+
+    run.clients = len(items)
+    run.failed = report['failed']
+    run.rows_written = report['rows_written']
+    run.report = report
+    run.status = GBPFetchRun.STATUS_PARTIAL if report['failed'] else GBPFetchRun.STATUS_DONE
+    run.finished_at = timezone.now()
+    run.save()
     logger.info('[GBP metrics] Zakończono')
+    return report
+
+@shared_task
+def compute_gbp_health_all():
+    """Kondycja metryk GBP wszystkich klientów (zmiany, baza sezonowa, anomalie) — ręczne przeliczenie
+    (w nocy liczy ją finalize_gbp_fetch_run po pobraniu metryk)."""
+    from .services.gbp_health import compute_health
+
+    count = compute_health()
+    logger.info(f'[GBP health] Przeliczono {count} klientów')
+    return count
+
+
+@shared_task
+def refresh_gbp_locations():
+    """Odświeża rejestr lokalizacji GBP (konta, ścieżki, nazwy, adresy) z API."""
+    from .models import AppSettings
+    from .services.gbp_service import get_access_token
+    from .services.gbp_locations import refresh_registry
+
+    settings = AppSettings.get()
+    if not settings.google_refresh_token:
+        logger.warning('[GBP locations] Brak Google Refresh Token — pomijam')
+        return
+
+    try:
+        return refresh_registry(get_access_token(settings.google_refresh_token))
+    except Exception as e:
+        logger.error(f'[GBP locations] Błąd odświeżania rejestru: {e}')
+
+
+@shared_task
+def backfill_gbp_metrics(lead_ids=None, restart=False):
+    """
+    Wsteczne pobieranie historii metryk GBP (GBP_BACKFILL_MONTHS miesięcy).
+    lead_ids=None — zakłada kursory nowym klientom; lista — (re)startuje backfill wskazanych.
+    Jedno uruchomienie to GBP_BACKFILL_ROUNDS_PER_RUN paczek na klienta; jeśli coś
+    zostało, task kolejkuje się ponownie. Tylko jedna instancja naraz (blokada w cache 'shared').
+    """
+    from django.conf import settings as django_settings
+    from django.core.cache import caches
+    from .models import AppSettings
+    from .services.gbp_service import get_access_token
+    from .services.gbp_backfill import enroll_new_clients, start_backfill, pending_backfills, run_round
+
+    if lead_ids is None:
+        enrolled = enroll_new_clients()
+        if enrolled:
+            logger.info(f'[GBP backfill] Nowi klienci: {enrolled}')
+    else:
+        start_backfill(Lead.objects.filter(pk__in=lead_ids), restart=restart)
+
+    settings = AppSettings.get()
+    if not settings.google_refresh_token:
+        logger.warning('[GBP backfill] Brak Google Refresh Token — pomijam')
+        return
+
+    # Kursory z innych wywołań podchwyci już działająca instancja
+    cache = caches['shared']
+    try:
+        if not cache.add(BACKFILL_LOCK_KEY, 1, BACKFILL_LOCK_TTL):
+            logger.info('[GBP backfill] Inna instancja w toku — pomijam')
+            return
+    except Exception as e:
+        logger.warning(f'[GBP backfill] Cache niedostępny, działam bez blokady: {e}')
+
+    try:
+        access_token = get_access_token(settings.google_refresh_token)
+        saved = 0
+        for _ in range(django_settings.GBP_BACKFILL_ROUNDS_PER_RUN):
+            backfills = pending_backfills()
+            if not backfills:
+                break
+            saved += run_round(backfills, access_token)
+    except Exception as e:
+        logger.error(f'[GBP backfill] Błąd: {e}')
+        return
+    finally:
+        try:
+            cache.delete(BACKFILL_LOCK_KEY)
+        except Exception:
+            pass
+
+    remaining = len(pending_backfills())
+    logger.info(f'[GBP backfill] Zapisano {saved} dni, pozostało klientów: {remaining}')
+    if remaining:
+        backfill_gbp_metrics.apply_async(countdown=BACKFILL_REQUEUE_DELAY)
+    return {'saved': saved, 'remaining': remaining}
 
 
 @shared_task
@@ -194,11 +348,13 @@ def generate_pdf_report(self, lead_pk, user_pk):
 
 @shared_task(bind=True, time_limit=300)
 def fetch_keyword_volumes_task(self, voivodeship_id):
-    """Pobiera wolumeny wyszukan z DataForSEO dla fraz bez wartosci w tle."""
+    """
+    Wolumeny wyszukan dla fraz bez wartosci: trafienia z cache zapisuje od razu,
+    reszte wysyla do kolejki standard DataForSEO. Wyniki odbiera collect_keyword_volumes_task.
+    """
     import logging
-    from django.utils import timezone
     from .models import AppSettings
-    from .services.dataforseo_volumes import fetch_keyword_volumes
+    from .services.dataforseo_volumes import post_volume_tasks
     from .constants import get_dataforseo_location_code
 
     logger = logging.getLogger(__name__)
@@ -211,87 +367,42 @@ def fetch_keyword_volumes_task(self, voivodeship_id):
         logger.warning('[keyword volumes] brak credentials DataForSEO')
         return
 
-    # Reset daty dla fraz ktore byly sprawdzane z blednym endpointem
-    reset_count = voivodeship.keywords.filter(
-        monthly_searches__isnull=True,
-        searches_updated_at__isnull=False,
-    ).update(searches_updated_at=None)
-    logger.info(f'[keyword volumes] reset searches_updated_at dla {reset_count} fraz')
-
-    keywords_to_update = list(
-        voivodeship.keywords.filter(monthly_searches__isnull=True)
+    phrases = list(
+        voivodeship.keywords.filter(monthly_searches__isnull=True).values_list('phrase', flat=True)
     )
-    logger.info(f'[keyword volumes] fraz do pobrania: {len(keywords_to_update)}')
-    if not keywords_to_update:
+    logger.info(f'[keyword volumes] fraz do pobrania: {len(phrases)}')
+    if not phrases:
         logger.warning('[keyword volumes] brak fraz do pobrania')
         return
 
-    # Oczyszczamy frazy — DataForSEO odrzuca caly batch jesli jedna fraza ma niedozwolone znaki
-    import re as _re
-    def clean_phrase(p):
-        p = p.strip()
-        p = p.strip('.,;:!?()[]{}\"\'')
-        p = _re.sub(r'[^\w\s\-]', '', p, flags=_re.UNICODE)
-        p = p.strip()
-        return p
-
-    # Mapowanie: oczyszczona fraza -> obiekt keyword (do pozniejszego zapisu)
-    phrase_to_kw = {}
-    for kw in keywords_to_update:
-        cleaned = clean_phrase(kw.phrase)
-        if cleaned:
-            phrase_to_kw[cleaned] = kw
-
-    phrases = list(phrase_to_kw.keys())
-    logger.info(f'[keyword volumes] przyklad fraz po czyszczeniu: {phrases[:5]}')
     location_code = get_dataforseo_location_code(voivodeship.name)
-    logger.info(f'[keyword volumes] odpytuje DataForSEO: {len(phrases)} fraz, location_code={location_code}')
-
-    # Wywolanie API bezposrednio (bez serwisu) zeby uniknac problemow z cache .pyc
-    import requests as req
-    import base64 as b64
-    credentials = b64.b64encode(
-        f"{app_settings.dataforseo_login}:{app_settings.dataforseo_password}".encode()
-    ).decode()
-    headers = {"Authorization": f"Basic {credentials}", "Content-Type": "application/json"}
-
-    volumes = {}
-    CHUNK = 1000
-    for i in range(0, len(phrases), CHUNK):
-        chunk = phrases[i:i + CHUNK]
-        try:
-            resp = req.post(
-                "https://api.dataforseo.com/v3/keywords_data/google_ads/search_volume/live",
-                headers=headers,
-                json=[{"keywords": chunk, "location_code": location_code, "language_name": "Polish"}],
-                timeout=120,
-            )
-            resp.raise_for_status()
-            data = resp.json()
-            task0 = (data.get('tasks') or [{}])[0]
-            logger.info(f'[keyword volumes] chunk {i}: status={task0.get("status_code")}, msg={task0.get("status_message")}, result_count={task0.get("result_count")}, sent_data={task0.get("data")}')
-            for item in (task0.get('result') or []):
-                if isinstance(item, dict) and item.get('keyword'):
-                    volumes[item['keyword']] = item.get('search_volume')
-        except Exception as e:
-            logger.error(f'[keyword volumes] blad chunk {i}: {e}')
-
-    logger.info(f'[keyword volumes] DataForSEO zwrocil {len(volumes)} wynikow')
-
-    now = timezone.now()
-    updated = 0
-    for cleaned_phrase, kw in phrase_to_kw.items():
-        volume = volumes.get(cleaned_phrase)
-        if volume is not None:
-            kw.monthly_searches = str(volume)
-            kw.searches_updated_at = now
-            kw.save(update_fields=['monthly_searches', 'searches_updated_at'])
-            updated += 1
-        else:
-            kw.searches_updated_at = now
-            kw.save(update_fields=['searches_updated_at'])
+    # Cache KeywordVolume — do kolejki idą tylko frazy, których nie mamy dla tej lokalizacji i miesiąca
+    stats = post_volume_tasks(
+        phrases,
+        app_settings.dataforseo_login,
+        app_settings.dataforseo_password,
+        location_code=location_code,
+        voivodeship=voivodeship,
+    )
+    logger.info(
+        f"[keyword volumes] location_code={location_code}: fraz {stats['phrases']}, z cache {stats['hits']} "
+        f"(hit ratio {stats['hit_ratio']:.0%}), wyslano {stats['posted']} w {stats['tasks']} zadaniach, "
+        f"juz w kolejce {stats['pending']}, bledow {stats['failed']}"
+    )
+    logger.info(f"[keyword volumes] zapisano {stats['updated']} wolumenow z cache dla {voivodeship.name}")
+    return stats
+
 
-    logger.info(f'[keyword volumes] zapisano {updated} wolumenow dla {voivodeship.name}')
+@shared_task
+def collect_keyword_volumes_task():
+    """Beat: odbiera gotowe zadania wolumenow z kolejki standard i zapisuje je przyrostowo."""
+    from .models import AppSettings
+    from .services.dataforseo_volumes import collect_volume_tasks
+
+    app_settings = AppSettings.get()
+    if not app_settings.dataforseo_login or not app_settings.dataforseo_password:
+        return
+    return collect_volume_tasks(app_settings.dataforseo_login, app_settings.dataforseo_password)
 
 
 @shared_task(bind=True, max_retries=3, default_retry_delay=60)
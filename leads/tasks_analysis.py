@@ -1,17 +1,22 @@
 import requests
-import base64
 from celery import shared_task
 from datetime import datetime
 from leads.services.maps_cid_extractor import extract_cid_from_maps_url
+from leads.services.dataforseo_client import DataForSEOClient
 from leads.services.dataforseo_posts import fetch_posts, parse_posts
+from leads.services.singleflight import single_flight
+from leads.services.dataforseo_serp import (
+    ENGINE_MAPS, ENGINE_ORGANIC,
+    build_rank_payload, find_position, lead_cid_number, lead_website_domain,
+    serp_key, serp_key_tag, get_stored_items, store_items,
+    fetch_live_many, post_tasks, get_ready_task_ids, get_task_items,
+)
 
 # Alias dla wstecznej kompatybilnosci
 extract_keyword_from_maps_url = extract_cid_from_maps_url
 
 
 def get_dataforseo_business_data(business_name, city, login, password, keyword_override=None):
-    credentials = base64.b64encode(f"{login}:{password}".encode()).decode()
-
     keyword = keyword_override if keyword_override else f"{business_name} {city}"
 
     payload = [{
@@ -20,17 +25,11 @@ def get_dataforseo_business_data(business_name, city, login, password, keyword_o
         "language_name": "Polish",
     }]
 
-    response = requests.post(
-        "https://api.dataforseo.com/v3/business_data/google/my_business_info/live",
-        headers={
-            "Authorization": f"Basic {credentials}",
-            "Content-Type": "application/json",
-        },
-        json=payload,
-        timeout=60,
-    )
-    response.raise_for_status()
-    return response.json()
+    def fetch():
+        return DataForSEOClient(login, password).post('business_data/google/my_business_info/live', payload)
+
+    # Dwie analizy tej samej wizytowki w tym samym momencie = jedno zapytanie
+    return single_flight('business_data/google/my_business_info/live', payload, fetch)
 
 
 def extract_business_data(biz):
@@ -407,6 +406,8 @@ def _save_business_data(lead, biz, status):
 def generate_keyword_suggestions(lead_id, batch_id):
     """Generuje sugestie fraz: DataForSEO → scrape WWW → GPT top 10."""
     from .models import Lead, KeywordSuggestionBatch, KeywordSuggestion, AppSettings
+    from .services.dataforseo_volumes import cached_volumes, volume_key
+    from .constants import POLAND_LOCATION_CODE
     import json
     import re as _re
 
@@ -417,18 +418,10 @@ def generate_keyword_suggestions(lead_id, batch_id):
     try:
         # 1. Pobierz sugestie fraz z DataForSEO
         seed_phrase = f"{lead.name} {lead.city.name}"
-        credentials = base64.b64encode(
-            f"{app_settings.dataforseo_login}:{app_settings.dataforseo_password}".encode()
-        ).decode()
-
-        dfs_response = requests.post(
-            "https://api.dataforseo.com/v3/dataforseo_labs/google/keyword_suggestions/live",
-            headers={"Authorization": f"Basic {credentials}", "Content-Type": "application/json"},
-            json=[{"keyword": seed_phrase, "language_name": "Polish", "location_name": "Poland", "limit": 50}],
-            timeout=60,
+        dfs_data = DataForSEOClient(app_settings.dataforseo_login, app_settings.dataforseo_password).post(
+            'dataforseo_labs/google/keyword_suggestions/live',
+            [{"keyword": seed_phrase, "language_name": "Polish", "location_name": "Poland", "limit": 50}],
         )
-        dfs_response.raise_for_status()
-        dfs_data = dfs_response.json()
         raw_keywords = []
         result = (dfs_data.get('tasks') or [{}])[0].get('result') or []
         items = (result[0].get('items') or []) if result else []
@@ -500,10 +493,23 @@ Odpowiedz TYLKO jako JSON, bez zadnego tekstu przed ani po:
         ai_text = _re.sub(r'^```\s*', '', ai_text, flags=_re.MULTILINE)
         suggestions = json.loads(ai_text)
 
+        # Frazy zmienione przez AI — wolumen z cache Google Ads (bez płatnego zapytania),
+        # a gdy go tam nie ma, zostaje wartość podana przez AI
+        suggested = [s.get('fraza', '') for s in suggestions[:10]]
+        known_phrases = {k['phrase'] for k in raw_keywords}
+        cached = cached_volumes(
+            {volume_key(p) for p in suggested if p and p not in known_phrases} - {''},
+            POLAND_LOCATION_CODE,
+        )
+
         # Zapisz sugestie
         for rank, s in enumerate(suggestions[:10], start=1):
             # Znajdz volume z DataForSEO (AI moze go zmienic)
-            matched_volume = next((k['volume'] for k in raw_keywords if k['phrase'] == s.get('fraza')), s.get('wyszukiwania'))
+            cached_volume = cached.get(volume_key(s.get('fraza', '')))
+            matched_volume = next(
+                (k['volume'] for k in raw_keywords if k['phrase'] == s.get('fraza')),
+                cached_volume if cached_volume is not None else s.get('wyszukiwania'),
+            )
             KeywordSuggestion.objects.create(
                 batch=batch,
                 phrase=s.get('fraza', ''),
@@ -522,24 +528,83 @@ Odpowiedz TYLKO jako JSON, bez zadnego tekstu przed ani po:
         batch.save()
 
 
+def _group_keywords_by_serp(keywords, day):
+    """Grupuje frazy po kluczu SERP (fraza + lokalizacja + silnik) — jeden SERP na klucz.
+    Zwraca (keys, kw_tag, items_by_tag, pending):
+    keys {tag: klucz}, kw_tag {pk frazy: tag}, items_by_tag {tag: items} z magazynu
+    oraz pending {tag: (engine, payload)} — SERP-y do pobrania z API."""
+    keys, kw_tag, requests_by_tag = {}, {}, {}
+    for kw in keywords:
+        engine, payload = build_rank_payload(kw.lead, kw.phrase)
+        key = serp_key(engine, payload)
+        tag = serp_key_tag(key)
+        kw_tag[kw.pk] = tag
+        if tag not in keys:
+            keys[tag] = key
+            requests_by_tag[tag] = (engine, payload)
+
+    items_by_tag = get_stored_items(keys, day)
+    pending = {tag: req for tag, req in requests_by_tag.items() if tag not in items_by_tag}
+    return keys, kw_tag, items_by_tag, pending
+
+
+def _keyword_ids_checked_today(keywords):
+    """PK fraz, ktore maja juz dzisiaj sprawdzenie pozycji — jedno zapytanie dla wszystkich."""
+    from .models import KeywordRankCheck
+    from django.utils import timezone
+
+    today = timezone.now().date()
+    return set(
+        KeywordRankCheck.objects
+        .filter(keyword__in=keywords, checked_at__date=today)
+        .values_list('keyword_id', flat=True)
+        .distinct()
+    )
+
+
+def _build_rank_checks(keywords, keys, kw_tag, items_by_tag):
+    """Dopasowuje wizytowki do SERP-ow. Zwraca (lista KeywordRankCheck do zapisu, liczba bledow).
+    Fraza bez SERP-a (blad API) nie dostaje wpisu — position=None znaczy "poza wynikami",
+    a wpis liczy sie jako sprawdzenie dzisiaj."""
+    from .models import KeywordRankCheck
+
+    lead_match = {}
+    checks = []
+    failed = 0
+    for kw in keywords:
+        items = items_by_tag.get(kw_tag[kw.pk])
+        if items is None:
+            failed += 1
+            continue
+        if kw.lead_id not in lead_match:
+            lead_match[kw.lead_id] = (lead_cid_number(kw.lead), lead_website_domain(kw.lead))
+        cid_number, website_domain = lead_match[kw.lead_id]
+        position = find_position(kw.lead, keys[kw_tag[kw.pk]]['engine'], items, cid_number, website_domain)
+        checks.append(KeywordRankCheck(keyword=kw, position=position))
+    return checks, failed
+
+
 @shared_task
-def check_keyword_rankings(lead_id, keyword_ids=None, force=False):
+def check_keyword_rankings(lead_id, keyword_ids=None, force=False, concurrent=None):
     """Sprawdza pozycje wizytowki. Jesli keyword_ids podane - tylko te frazy, inaczej wszystkie.
-    Pomija frazy ktore byly juz sprawdzane dzisiaj, chyba ze force=True."""
+    Pomija frazy ktore byly juz sprawdzane dzisiaj, chyba ze force=True.
+    concurrent=True (domyslnie z DATAFORSEO_RANK_CHECK_CONCURRENT) — zapytania live
+    ida rownolegle na puli DATAFORSEO_RANK_CHECK_WORKERS watkow, pod limiterem zapytan."""
+    from django.conf import settings
     from .models import Lead, LeadKeyword, KeywordRankCheck, AppSettings
     from django.utils import timezone
+    import logging
 
-    lead = Lead.objects.get(pk=lead_id)
+    logger = logging.getLogger(__name__)
+    lead = Lead.objects.select_related('city').get(pk=lead_id)
     app_settings = AppSettings.get()
-    keywords = lead.keywords_list.filter(pk__in=keyword_ids) if keyword_ids else lead.keywords_list.all()
+    keywords_qs = lead.keywords_list.filter(pk__in=keyword_ids) if keyword_ids else lead.keywords_list.all()
+    keywords = list(keywords_qs)
 
     if not force:
-        # Pomiń frazy które były już sprawdzane dzisiaj
-        today = timezone.now().date()
-        keywords = [
-            kw for kw in keywords
-            if not kw.rank_checks.filter(checked_at__date=today).exists()
-        ]
+        # Pomiń frazy które były już sprawdzane dzisiaj (jedno zapytanie dla wszystkich fraz)
+        checked_today = _keyword_ids_checked_today(keywords_qs)
+        keywords = [kw for kw in keywords if kw.pk not in checked_today]
         if not keywords:
             return  # Wszystkie frazy już sprawdzone dzisiaj
 
@@ -548,98 +613,190 @@ def check_keyword_rankings(lead_id, keyword_ids=None, force=False):
     if not app_settings.dataforseo_login or not app_settings.dataforseo_password:
         return
 
-    # Pobierz CID wizytowki zeby dopasowac wynik
-    cid_str = extract_keyword_from_maps_url(lead.google_maps_url)
-    cid_number = None
-    if cid_str and cid_str.startswith('cid:'):
-        try:
-            cid_number = int(cid_str[4:])
-        except ValueError:
-            pass
+    if concurrent is None:
+        concurrent = settings.DATAFORSEO_RANK_CHECK_CONCURRENT
+    max_workers = settings.DATAFORSEO_RANK_CHECK_WORKERS if concurrent else 1
+
+    # SERP z dzisiaj moze juz byc w magazynie (inny lead, ta sama fraza i lokalizacja).
+    # Watki robia tylko HTTP — zapis do bazy zostaje w tym watku.
+    today = timezone.localdate()
+    keys, kw_tag, items_by_tag, pending = _group_keywords_by_serp(keywords, today)
+    fetched = fetch_live_many(
+        pending,
+        app_settings.dataforseo_login, app_settings.dataforseo_password,
+        max_workers=max_workers,
+    )
+    fetched = {tag: items for tag, items in fetched.items() if items is not None}
+    store_items([(keys[tag], items) for tag, items in fetched.items()], today)
+    items_by_tag.update(fetched)
+
+    checks, failed = _build_rank_checks(keywords, keys, kw_tag, items_by_tag)
+    KeywordRankCheck.objects.bulk_create(checks)
+    logger.info(
+        f'[SERP live] {lead.name}: zapisano {len(checks)} pozycji, unikalnych SERP {len(keys)}, '
+        f'zapytan {len(pending)}, bledow {failed}'
+    )
+    return {'keywords': len(checks), 'serps': len(keys), 'requests': len(pending), 'failed': failed}
+
 
-    credentials = base64.b64encode(
-        f"{app_settings.dataforseo_login}:{app_settings.dataforseo_password}".encode()
-    ).decode()
+@shared_task
+def check_rankings_standard_queue(lead_ids=None, force=False, keyword_ids=None):
+    """Sprawdza pozycje fraz wielu klientow przez kolejke standard DataForSEO.
+    Pozycje z SERP-ow pobranych juz dzisiaj zapisuje od razu. Reszte SERP-ow wysyla
+    (wszystkie silniki, paczkami po 100 w task_post) i zapisuje ID zadan w SerpTask —
+    wyniki odbiera collect_rank_check_tasks (beat), worker nie czeka na kolejke.
+    keyword_ids zaweza sprawdzanie do wybranych fraz (harmonogram adaptacyjny).
+    Pomija frazy sprawdzone dzisiaj, chyba ze force=True."""
+    from django.db import transaction
+    from .models import Lead, LeadKeyword, KeywordRankCheck, AppSettings, SerpTask
+    from django.utils import timezone
+    import logging
+
+    logger = logging.getLogger(__name__)
+    app_settings = AppSettings.get()
+    if not app_settings.dataforseo_login or not app_settings.dataforseo_password:
+        return
+    login, password = app_settings.dataforseo_login, app_settings.dataforseo_password
 
+    leads = Lead.objects.filter(status='client') if lead_ids is None else Lead.objects.filter(pk__in=lead_ids)
+    keywords_qs = LeadKeyword.objects.filter(lead__in=leads).select_related('lead', 'lead__city')
+    if keyword_ids is not None:
+        keywords_qs = keywords_qs.filter(pk__in=keyword_ids)
+    keywords = list(keywords_qs)
+
+    if not force:
+        checked_today = _keyword_ids_checked_today(keywords_qs)
+        keywords = [kw for kw in keywords if kw.pk not in checked_today]
+
+    if not keywords:
+        return
+
+    # Frazy o tym samym kluczu SERP wspoldziela jedno zadanie,
+    # SERP-y pobrane juz dzisiaj bierzemy z magazynu bez zapytania do API.
+    today = timezone.localdate()
+    keys, kw_tag, items_by_tag, pending = _group_keywords_by_serp(keywords, today)
+    checks, _ = _build_rank_checks(
+        [kw for kw in keywords if kw_tag[kw.pk] in items_by_tag], keys, kw_tag, items_by_tag,
+    )
+    KeywordRankCheck.objects.bulk_create(checks)
+
+    waiting = {}
     for kw in keywords:
-        try:
-            if lead.keyword_search_nationwide:
-                # Cały kraj — organiczny SERP Google
-                payload = {
-                    "keyword": kw.phrase,
-                    "language_name": "Polish",
-                    "location_name": "Poland",
-                    "depth": 100,
-                }
-                response = requests.post(
-                    "https://api.dataforseo.com/v3/serp/google/organic/live/advanced",
-                    headers={"Authorization": f"Basic {credentials}", "Content-Type": "application/json"},
-                    json=[payload],
-                    timeout=60,
-                )
-                response.raise_for_status()
-                items = response.json().get('tasks', [{}])[0].get('result', [{}])[0].get('items', [])
-
-                position = None
-                website_domain = None
-                if lead.website:
-                    # Wyciagnij domenę ze strony leada do dopasowania
-                    from urllib.parse import urlparse
-                    parsed = urlparse(lead.website if lead.website.startswith('http') else f'http://{lead.website}')
-                    website_domain = parsed.netloc.lower().lstrip('www.')
-
-                for item in items:
-                    if item.get('type') != 'organic':
-                        continue
-                    item_url = (item.get('url') or '').lower()
-                    item_domain = (item.get('domain') or '').lower().lstrip('www.')
-                    # Dopasuj po domenie strony WWW lub nazwie firmy w URL
-                    domain_match = website_domain and (website_domain in item_domain or item_domain in website_domain)
-                    name_match = lead.name.lower() in item_url
-                    if domain_match or name_match:
-                        position = item.get('rank_absolute')
-                        break
+        if kw_tag[kw.pk] in pending:
+            waiting.setdefault(kw_tag[kw.pk], []).append(kw.pk)
+
+    # SERP czekajacy juz w kolejce (wczesniejsze uruchomienie) — dopisujemy frazy zamiast wysylac go ponownie
+    with transaction.atomic():
+        queued = list(
+            SerpTask.objects.select_for_update()
+            .filter(status=SerpTask.STATUS_PENDING, day=today, tag__in=list(waiting))
+        )
+        for serp_task in queued:
+            serp_task.keyword_ids = sorted(set(serp_task.keyword_ids) | set(waiting.pop(serp_task.tag, [])))
+        SerpTask.objects.bulk_update(queued, ['keyword_ids'])
+
+    payloads = {ENGINE_MAPS: [], ENGINE_ORGANIC: []}
+    for tag in waiting:
+        engine, payload = pending[tag]
+        payloads[engine].append(dict(payload, tag=tag))
+
+    # Najpierw wszystkie silniki — zadania organic nie czekaja na odbior maps
+    created = []
+    for engine, engine_payloads in payloads.items():
+        if not engine_payloads:
+            continue
+        for tag, task_id in post_tasks(engine, engine_payloads, login, password).items():
+            created.append(SerpTask(
+                task_id=task_id, engine=engine, tag=tag, key=keys[tag], day=today, keyword_ids=waiting[tag],
+            ))
+    SerpTask.objects.bulk_create(created)
+
+    posted_tags = {serp_task.tag for serp_task in created}
+    failed = sum(len(ids) for tag, ids in waiting.items() if tag not in posted_tags)
+    logger.info(
+        f'[SERP queue] zapisano {len(checks)} pozycji z magazynu, unikalnych SERP {len(keys)}, '
+        f'wyslanych zadan {len(created)}, dopisanych do oczekujacych {len(queued)}, bledow {failed}'
+    )
+    return {'keywords': len(checks), 'serps': len(keys), 'tasks': len(created), 'queued': len(queued), 'failed': failed}
 
-            else:
-                # Miasto lub GPS lokalu — Google Maps SERP
-                payload = {
-                    "keyword": kw.phrase,
-                    "language_name": "Polish",
-                    "depth": 20,
-                }
-                # Priorytet: GPS lokalu > GPS miasta > nazwa kraju
-                if lead.location_coordinate:
-                    payload["location_coordinate"] = lead.location_coordinate
-                elif lead.city.location_coordinate:
-                    payload["location_coordinate"] = lead.city.location_coordinate
-                else:
-                    payload["location_name"] = "Poland"
-
-                response = requests.post(
-                    "https://api.dataforseo.com/v3/serp/google/maps/live/advanced",
-                    headers={"Authorization": f"Basic {credentials}", "Content-Type": "application/json"},
-                    json=[payload],
-                    timeout=60,
-                )
-                response.raise_for_status()
-                items = response.json().get('tasks', [{}])[0].get('result', [{}])[0].get('items', [])
-
-                position = None
-                for item in items:
-                    item_cid = item.get('cid')
-                    cid_match = cid_number and (
-                        item_cid == cid_number or
-                        str(item_cid) == str(cid_number)
-                    )
-                    name_match = not cid_number and lead.name.lower() in (item.get('title') or '').lower()
-                    if cid_match or name_match:
-                        position = item.get('rank_absolute')
-                        break
-
-            KeywordRankCheck.objects.create(keyword=kw, position=position)
 
+@shared_task
+def collect_rank_check_tasks():
+    """Beat: odbiera gotowe zadania SERP z kolejki standard (tasks_ready → task_get), zapisuje SERP
+    w magazynie i pozycje czekajacych fraz. Zadanie nieobecne w tasks_ready dluzej niz
+    SERP_TASK_MAX_AGE_HOURS pobiera bezposrednio po ID (tasks_ready pokazuje je tylko raz),
+    a gdy i tak nie ma wyniku — oznacza jako failed. Frazy z nieudanych zadan nie dostaja wpisu."""
+    from datetime import timedelta
+    from django.conf import settings
+    from django.db import transaction
+    from django.utils import timezone
+    from .models import AppSettings, KeywordRankCheck, LeadKeyword, SerpTask
+    import logging
+
+    logger = logging.getLogger(__name__)
+    app_settings = AppSettings.get()
+    if not app_settings.dataforseo_login or not app_settings.dataforseo_password:
+        return
+    login, password = app_settings.dataforseo_login, app_settings.dataforseo_password
+
+    pending = list(SerpTask.objects.filter(status=SerpTask.STATUS_PENDING))
+    summary = {'pending': len(pending), 'collected': 0, 'failed': 0, 'keywords': 0}
+    if not pending:
+        return summary
+
+    now = timezone.now()
+    expired_before = now - timedelta(hours=settings.SERP_TASK_MAX_AGE_HOURS)
+    ready = {}
+    for engine in {serp_task.engine for serp_task in pending}:
+        try:
+            ready[engine] = get_ready_task_ids(engine, login, password)
         except Exception as e:
-            KeywordRankCheck.objects.create(keyword=kw, position=None)
+            logger.warning(f'[SERP queue] blad tasks_ready {engine}: {e}')
+            ready[engine] = set()
+
+    for serp_task in pending:
+        expired = serp_task.posted_at < expired_before
+        if serp_task.task_id not in ready[serp_task.engine] and not expired:
+            continue
+        try:
+            items = get_task_items(serp_task.engine, serp_task.task_id, login, password)
+            error = 'brak wyniku task_get' if items is None else ''
+        except Exception as e:
+            logger.error(f'[SERP queue] blad task_get {serp_task.task_id}: {e}')
+            items, error = None, str(e)
+
+        with transaction.atomic():
+            # Blokada — rownolegly check_rankings_standard_queue moze dopisywac frazy do zadania
+            serp_task = SerpTask.objects.select_for_update().get(pk=serp_task.pk)
+            if serp_task.status != SerpTask.STATUS_PENDING:
+                continue
+            if items is None:
+                serp_task.status = SerpTask.STATUS_FAILED
+                serp_task.error = error
+                serp_task.save(update_fields=['status', 'error'])
+                summary['failed'] += 1
+                continue
+
+            store_items([(serp_task.key, items)], serp_task.day)
+            keywords = list(
+                LeadKeyword.objects.filter(pk__in=serp_task.keyword_ids).select_related('lead', 'lead__city')
+            )
+            checks, _ = _build_rank_checks(
+                keywords, {serp_task.tag: serp_task.key}, {kw.pk: serp_task.tag for kw in keywords},
+                {serp_task.tag: items},
+            )
+            KeywordRankCheck.objects.bulk_create(checks)
+            serp_task.status = SerpTask.STATUS_DONE
+            serp_task.collected_at = now
+            serp_task.save(update_fields=['status', 'collected_at'])
+        summary['collected'] += 1
+        summary['keywords'] += len(checks)
+
+    logger.info(
+        f"[SERP queue] oczekujacych {summary['pending']}, odebranych {summary['collected']}, "
+        f"bledow {summary['failed']}, zapisanych pozycji {summary['keywords']}"
+    )
+    return summary
 
 
 @shared_task
@@ -776,53 +933,89 @@ def run_google_business_analysis(analysis_id, keywords=None):
 
 
 @shared_task
-def check_all_clients_rankings():
-    """Cotygodniowy task: sprawdza pozycje fraz wszystkich klientow."""
-    from .models import Lead
-    clients = Lead.objects.filter(status='client').prefetch_related('keywords_list')
-    for client in clients:
-        if client.keywords_list.exists():
-            check_keyword_rankings.delay(client.pk)
+def check_rankings_adaptive(budget=None):
+    """Codzienny task: sprawdza tylko frazy wybrane przez adaptacyjny harmonogram
+    (zmiennosc, czas od sprawdzenia, odleglosc od top 3) w ramach dziennego budzetu zapytan.
+    Zwraca raport planu z liczba zapytan zaoszczedzonych wzgledem stalego harmonogramu."""
+    from .services.rank_scheduler import plan_rank_checks
+    import logging
+
+    logger = logging.getLogger(__name__)
+    plan = plan_rank_checks(budget=budget)
+    keyword_ids = plan.pop('keyword_ids')
+    logger.info(
+        f"[Rank scheduler] fraz z terminem {plan['due']}/{plan['keywords_total']}, "
+        f"do sprawdzenia {plan['scheduled']}, odlozonych {plan['deferred']}, "
+        f"zapytan {plan['calls']} (staly harmonogram ~{plan['fixed_schedule_calls']}/dzien, "
+        f"oszczednosc {plan['calls_saved']})"
+    )
+    if keyword_ids:
+        plan['result'] = check_rankings_standard_queue(keyword_ids=keyword_ids)
+    return plan
+
+
+@shared_task
+def run_geo_grid_scans(scan_ids, changed_only=False):
+    """Wykonuje skany geo-grid (heatmapa pozycji) — wszystkie punkty razem przez kolejke standard.
+    changed_only=True — pobiera tylko komorki zmienione w poprzednim skanie."""
+    from .models import GeoGridScan, AppSettings
+    from .services.geo_grid import run_scans
+
+    app_settings = AppSettings.get()
+    if not app_settings.dataforseo_login or not app_settings.dataforseo_password:
+        return
+    scans = list(
+        GeoGridScan.objects
+        .filter(pk__in=scan_ids, status=GeoGridScan.STATUS_PENDING)
+        .select_related('keyword', 'keyword__lead')
+    )
+    if not scans:
+        return
+    return run_scans(scans, app_settings.dataforseo_login, app_settings.dataforseo_password, changed_only=changed_only)
+
+
+@shared_task
+def check_all_clients_rankings(mode=None):
+    """Sprawdza pozycje wszystkich fraz wszystkich klientow (bez harmonogramu adaptacyjnego).
+    mode='standard' — kolejka task_post/task_get (domyslnie z DATAFORSEO_RANK_CHECK_MODE),
+    mode='live' — osobny task check_keyword_rankings per klient."""
+    from django.conf import settings
+    from .models import LeadKeyword
+
+    if (mode or settings.DATAFORSEO_RANK_CHECK_MODE) == 'standard':
+        return check_rankings_standard_queue()
+
+    # Lista fraz do sprawdzenia liczona raz dla wszystkich klientow
+    client_keywords = LeadKeyword.objects.filter(lead__status='client')
+    checked_today = _keyword_ids_checked_today(client_keywords)
+    keyword_ids_by_lead = {}
+    for kw_id, lead_id in client_keywords.values_list('pk', 'lead_id'):
+        if kw_id not in checked_today:
+            keyword_ids_by_lead.setdefault(lead_id, []).append(kw_id)
+
+    for lead_id, keyword_ids in keyword_ids_by_lead.items():
+        # force=True — frazy sprawdzone dzisiaj sa juz odfiltrowane wyzej
+        check_keyword_rankings.delay(lead_id, keyword_ids=keyword_ids, force=True)
 
 
 @shared_task
 def take_client_rank_snapshot(lead_id, triggered_by='auto'):
     """Tworzy snapshot pozycji dla klienta na dany miesiac.
     Jesli snapshot na ten miesiac juz istnieje - nadpisuje go."""
-    from .models import Lead, ClientRankSnapshot, KeywordRankCheck
-    from django.utils import timezone
+    from .services.rank_snapshots import save_rank_snapshots
 
-    lead = Lead.objects.get(pk=lead_id)
-    now = timezone.now()
-
-    # Zbierz ostatnia znana pozycje dla kazdej frazy
-    positions = []
-    for kw in lead.keywords_list.prefetch_related('rank_checks').all():
-        last_check = kw.rank_checks.first()  # ordering = -checked_at
-        positions.append({
-            'phrase': kw.phrase,
-            'position': last_check.position if last_check else None,
-            'checked_at': last_check.checked_at.isoformat() if last_check else None,
-        })
-
-    ClientRankSnapshot.objects.update_or_create(
-        lead=lead,
-        year=now.year,
-        month=now.month,
-        defaults={
-            'positions': positions,
-            'triggered_by': triggered_by,
-        },
-    )
+    save_rank_snapshots([lead_id], triggered_by=triggered_by)
 
 
 @shared_task
 def monthly_snapshot_all_clients():
-    """1. dnia miesiaca: tworzy snapshot dla wszystkich klientow."""
+    """1. dnia miesiaca: tworzy snapshot dla wszystkich klientow jednym przebiegiem
+    (ostatnie pozycje z jednego zapytania, zapis jednym bulk upsertem)."""
     from .models import Lead
-    clients = Lead.objects.filter(status='client')
-    for client in clients:
-        take_client_rank_snapshot.delay(client.pk, triggered_by='auto')
+    from .services.rank_snapshots import save_rank_snapshots
+
+    client_ids = Lead.objects.filter(status='client').values_list('pk', flat=True)
+    return save_rank_snapshots(client_ids, triggered_by='auto')
 
 
 @shared_task
@@ -1,5 +1,6 @@
 from django.test import TestCase
-from ...models import City, Lead, LeadKeyword
+from ...models import City, Lead, LeadKeyword, Voivodeship, VoivodeshipKeyword
+from ...services.lead_keywords import add_lead_keywords, keyword_sync_disabled, sync_voivodeship_keywords
 
 
 class LeadKeywordModelTest(TestCase):
@@ -61,3 +62,43 @@ class LeadKeywordModelTest(TestCase):
         self.lead.delete()
 
         self.assertEqual(LeadKeyword.objects.count(), 0)
+
+
+class LeadKeywordVoivodeshipSyncTest(TestCase):
+
+    def setUp(self):
+        self.voivodeship = Voivodeship.objects.create(name="mazowieckie")
+        self.lead = Lead.objects.create(
+            city=City.objects.create(name="Warszawa", voivodeship=self.voivodeship), name="Jan Kowalski",
+        )
+
+    def test_signal_syncs_single_keyword(self):
+        """Zapis pojedynczej frazy dodaje ją do województwa leada"""
+        LeadKeyword.objects.create(lead=self.lead, phrase="pizza warszawa")
+        LeadKeyword.objects.create(
+            lead=Lead.objects.create(city=City.objects.create(name="Bez województwa"), name="Anna Nowak"), phrase="pizza gdzieś",
+        )
+
+        self.assertEqual(list(VoivodeshipKeyword.objects.values_list('phrase', flat=True)), ["pizza warszawa"])
+
+    def test_add_lead_keywords_in_constant_queries(self):
+        """Hurtowe dodanie fraz: bez duplikatów i ze stałą liczbą zapytań"""
+        LeadKeyword.objects.create(lead=self.lead, phrase="pizza warszawa")
+        phrases = ["pizza warszawa", " pizzeria mokotów ", "pizzeria mokotów", ""] + [f"fraza {i}" for i in range(30)]
+
+        with self.assertNumQueries(4):
+            created = add_lead_keywords(self.lead, phrases)
+
+        self.assertEqual(len(created), 31)
+        self.assertEqual(self.lead.keywords_list.count(), 32)
+        self.assertEqual(self.voivodeship.keywords.count(), 32)
+
+    def test_signal_can_be_disabled_for_bulk_operations(self):
+        """W keyword_sync_disabled() sygnał nie synkuje — robi to jedno wywołanie na końcu"""
+        with keyword_sync_disabled():
+            keywords = [LeadKeyword.objects.create(lead=self.lead, phrase=f"fraza {i}") for i in range(3)]
+        self.assertFalse(VoivodeshipKeyword.objects.exists())
+
+        self.assertEqual(sync_voivodeship_keywords(keywords), 3)
+        LeadKeyword.objects.create(lead=self.lead, phrase="fraza 0")
+        self.assertEqual(self.voivodeship.keywords.count(), 3)
@@ -0,0 +1,122 @@
+from unittest.mock import patch, MagicMock
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from ...services.dataforseo_client import (
+    DataForSEOClient, DataForSEOError, _stats, endpoint_stats, get_session, reset_stats,
+)
+from ...views.settings import get_dataforseo_balance
+
+
+def _refused():
+    """Błąd nawiązania połączenia, tak jak zgłasza go requests."""
+    reason = NewConnectionError(None, 'Failed to establish a new connection: [Errno 111] Connection refused')
+    return requests.ConnectionError(MaxRetryError(None, '/v3/serp', reason))
+
+
+def _response(data, status_code=200):
+    resp = MagicMock()
+    resp.status_code = status_code
+    resp.json.return_value = data
+    resp.raise_for_status.return_value = None
+    return resp
+
+
+SHARED_LOCMEM = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'dataforseo-test'},
+}
+
+
+@override_settings(CACHES=SHARED_LOCMEM)
+class DataForSEOClientTest(TestCase):
+
+    def setUp(self):
+        reset_stats()
+        self.addCleanup(reset_stats)
+
+    def test_calls_share_one_pooled_session(self):
+        """Kolejne zapytania idą przez tę samą sesję (keep-alive), z nagłówkiem Basic"""
+        with patch('leads.services.dataforseo_client.requests.Session.post',
+                   return_value=_response({'status_code': 20000, 'tasks': []})) as post:
+            DataForSEOClient('login', 'haslo').post('serp/google/maps/live/advanced', [{}])
+            DataForSEOClient('login', 'haslo').post('serp/google/maps/live/advanced', [{}])
+
+        self.assertIs(get_session(), get_session())
+        self.assertEqual(post.call_count, 2)
+        url = post.call_args.args[0]
+        self.assertEqual(url, 'https://api.dataforseo.com/v3/serp/google/maps/live/advanced')
+        self.assertEqual(post.call_args.kwargs['headers']['Authorization'], 'Basic bG9naW46aGFzbG8=')
+
+    def test_records_calls_retries_and_cost_per_endpoint(self):
+        """Statystyki per endpoint: zapytania, ponowienia i koszt; ID zadania nie rozbija endpointu"""
+        ok = _response({'status_code': 20000, 'cost': 0.0012, 'tasks': []})
+        with patch('leads.services.dataforseo_client.requests.Session.get',
+                   side_effect=[_response({}, status_code=429), ok, ok]) as get, \
+             patch('leads.services.dataforseo_client.time.sleep'):
+            client = DataForSEOClient('login', 'haslo')
+            client.get('serp/google/maps/task_get/advanced', 'task-1')
+            client.get('serp/google/maps/task_get/advanced', 'task-2')
+
+        self.assertTrue(get.call_args.args[0].endswith('/task_get/advanced/task-2'))
+        stats = endpoint_stats()['serp/google/maps/task_get/advanced']
+        self.assertEqual((stats['calls'], stats['retries'], stats['errors'], stats['cost']), (2, 1, 0, 0.0024))
+        # Liczniki są w cache 'shared' — widzi je też proces web, nie tylko worker, który pytał API
+        self.assertEqual(_stats, {})
+
+    def test_stats_fall_back_to_process_when_cache_is_down(self):
+        """Bez Redisa statystyki liczone są w procesie, a zapytanie do API przechodzi"""
+        with patch('leads.services.dataforseo_client.requests.Session.get',
+                   return_value=_response({'status_code': 20000, 'tasks': []})), \
+             patch.object(caches['shared'], 'add', side_effect=ConnectionError('redis down')), \
+             patch.object(caches['shared'], 'get', side_effect=ConnectionError('redis down')):
+            DataForSEOClient('login', 'haslo').get('appendix/user_data')
+            stats = endpoint_stats()
+
+        self.assertEqual(stats['appendix/user_data']['calls'], 1)
+
+    def test_error_status_raises(self):
+        """Status odpowiedzi inny niż 20000 (np. brak środków) kończy się DataForSEOError"""
+        with patch('leads.services.dataforseo_client.requests.Session.get',
+                   return_value=_response({'status_code': 40200, 'status_message': 'Payment Required.'})):
+            with self.assertRaises(DataForSEOError) as ctx:
+                DataForSEOClient('login', 'haslo').get('appendix/user_data')
+            self.assertIsNone(get_dataforseo_balance('login', 'haslo'))
+
+        self.assertEqual(ctx.exception.status_code, 40200)
+        self.assertEqual(endpoint_stats()['appendix/user_data']['errors'], 2)
+
+    def test_post_is_not_resent_after_read_timeout_or_server_error(self):
+        """Płatny POST nie jest ponawiany po timeoucie odczytu ani 5xx — tylko po 429"""
+        client = DataForSEOClient('login', 'haslo')
+        with patch('leads.services.dataforseo_client.requests.Session.post',
+                   side_effect=requests.ReadTimeout('read timeout')) as post, \
+             patch('leads.services.dataforseo_client.time.sleep'):
+            with self.assertRaises(requests.ReadTimeout):
+                client.post('serp/google/maps/task_post', [{}])
+        self.assertEqual(post.call_count, 1)
+
+        ok = _response({'status_code': 20000, 'tasks': []})
+        bad_gateway = _response({}, status_code=502)
+        bad_gateway.raise_for_status.side_effect = requests.HTTPError('502')
+        with patch('leads.services.dataforseo_client.requests.Session.post',
+                   side_effect=[bad_gateway, ok]) as post:
+            with self.assertRaises(requests.HTTPError):
+                client.post('serp/google/maps/live/advanced', [{}])
+        self.assertEqual(post.call_count, 1)
+
+        with patch('leads.services.dataforseo_client.requests.Session.post',
+                   side_effect=[_refused(), _response({}, status_code=429), ok]) as post, \
+             patch('leads.services.dataforseo_client.time.sleep'):
+            client.post('serp/google/maps/task_post', [{}])
+        self.assertEqual(post.call_count, 3)
+
+    def test_post_is_not_resent_after_connection_dropped_mid_request(self):
+        """Zerwane połączenie po wysłaniu treści (ProtocolError) to nie „niewysłane” — POST idzie raz"""
+        dropped = requests.ConnectionError(ProtocolError('Connection aborted.', ConnectionResetError(104, 'reset')))
+        with patch('leads.services.dataforseo_client.requests.Session.post', side_effect=dropped) as post, \
+             patch('leads.services.dataforseo_client.time.sleep'):
+            with self.assertRaises(requests.ConnectionError):
+                DataForSEOClient('login', 'haslo').post('serp/google/maps/task_post', [{}])
+        self.assertEqual(post.call_count, 1)
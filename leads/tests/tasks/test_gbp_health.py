@@ -0,0 +1,80 @@
+from datetime import date, timedelta
+from django.contrib.auth.models import User
+from django.test import TestCase, Client
+from django.urls import reverse
+from ...models import City, Lead, GBPHealth
+from ...services.gbp_health import DAYS, compute_health
+from ...services.gbp_series import write_days
+
+AS_OF = date(2026, 9, 30)
+
+
+class GBPHealthTest(TestCase):
+
+    def setUp(self):
+        self.city = City.objects.create(name="Kraków")
+
+    def _client(self, name, calls_for_day):
+        """Klient z dziennymi metrykami z ostatnich DAYS dni; calls_for_day(n dni wstecz) → telefony albo None (brak dnia)."""
+        lead = Lead.objects.create(city=self.city, name=name, status='client', gbp_location_name=f'locations/{name}')
+        days = {}
+        for n in range(DAYS):
+            calls = calls_for_day(n)
+            if calls is None:
+                continue
+            days[AS_OF - timedelta(days=n)] = {'calls': calls, 'profile_views': 100 + n % 7, 'website_visits': 2}
+        write_days(lead.pk, days)
+        return lead
+
+    def test_flags_collapse_and_missing_data(self):
+        """Załamanie telefonów i brak danych są flagowane, stabilny klient jest czysty"""
+        steady = self._client('stabilny', lambda n: 5 + n % 3)
+        collapsed = self._client('zawieszony', lambda n: 0 if n < 7 else 6)
+        silent = self._client('cisza', lambda n: None if n < 7 else 4)
+
+        self.assertEqual(compute_health(as_of=AS_OF), 3)
+
+        health = {h.lead_id: h for h in GBPHealth.objects.all()}
+        self.assertEqual(health[steady.pk].flags, [])
+        self.assertIn('calls_collapse', health[collapsed.pk].flags)
+        self.assertIn('no_data', health[silent.pk].flags)
+        self.assertGreater(health[collapsed.pk].score, health[steady.pk].score)
+        self.assertLess(health[collapsed.pk].wow_change, -50)
+        self.assertEqual(health[collapsed.pk].metrics['calls']['last_7d'], 0)
+        self.assertEqual(health[collapsed.pk].metrics['calls']['baseline'], 42)
+
+    def test_recompute_updates_existing_rows(self):
+        """Ponowne przeliczenie nadpisuje wiersz kondycji zamiast dublować"""
+        self._client('stabilny', lambda n: 5)
+        compute_health(as_of=AS_OF)
+        compute_health(as_of=AS_OF + timedelta(days=1))
+
+        self.assertEqual(GBPHealth.objects.get().as_of, AS_OF + timedelta(days=1))
+
+    def test_rows_of_former_clients_are_removed(self):
+        """Klient bez lokalizacji albo już nie-klient traci wiersz kondycji"""
+        kept = self._client('stabilny', lambda n: 5)
+        unassigned = self._client('bez-wizytowki', lambda n: 5)
+        former = self._client('byly-klient', lambda n: 5)
+        compute_health(as_of=AS_OF)
+        Lead.objects.filter(pk=unassigned.pk).update(gbp_location_name='')
+        Lead.objects.filter(pk=former.pk).update(status=Lead.STATUS_CLOSE)
+
+        self.assertEqual(compute_health(as_of=AS_OF), 1)
+
+        self.assertEqual(list(GBPHealth.objects.values_list('lead_id', flat=True)), [kept.pk])
+
+    def test_client_list_sorts_by_health(self):
+        """Lista klientów sortowana po kondycji pokazuje najpierw klientów z anomaliami"""
+        self._client('a-stabilny', lambda n: 5)
+        self._client('b-zawieszony', lambda n: 0 if n < 7 else 6)
+        compute_health(as_of=AS_OF)
+        client = Client()
+        User.objects.create_user(username="testuser", password="testpass")
+        client.login(username="testuser", password="testpass")
+
+        response = client.get(reverse('leads:client_index'), {'sort': 'health'})
+
+        names = [row['lead'].name for row in response.context['data']]
+        self.assertEqual(names, ['b-zawieszony', 'a-stabilny'])
+        self.assertIn('załamanie: telefony', response.context['data'][0]['gbp_flags'])
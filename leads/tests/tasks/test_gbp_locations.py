@@ -0,0 +1,77 @@
+from unittest.mock import patch, MagicMock
+from django.test import TestCase
+from ...models import GBPLocation
+from ...services.gbp_locations import location_id, performance_name, full_name, refresh_registry
+from ...services.gbp_publishing_service import get_full_location_name
+
+
+def _response(data):
+    resp = MagicMock()
+    resp.json.return_value = data
+    resp.raise_for_status.return_value = None
+    return resp
+
+
+class FakeBusinessApi:
+    """Account Management + Business Information API: konto accounts/1 z dwiema stronami lokalizacji."""
+
+    def __init__(self):
+        self.calls = []
+
+    def get(self, url, params=None, **kwargs):
+        self.calls.append(url)
+        if url.endswith('/v1/accounts'):
+            return _response({'accounts': [{'name': 'accounts/1'}]})
+        if params.get('pageToken') is None:
+            return _response({
+                'locations': [{'name': 'locations/10', 'title': 'Pizzeria Roma',
+                               'storefrontAddress': {'addressLines': ['Długa 1'], 'locality': 'Kraków'}}],
+                'nextPageToken': 'p2',
+            })
+        return _response({'locations': [{'name': 'locations/20', 'title': 'Salon Ewa'}]})
+
+
+class GBPLocationRegistryTest(TestCase):
+
+    def test_location_name_formats_are_normalized(self):
+        """Każdy zapis nazwy lokalizacji daje to samo ID i nazwę dla Performance API"""
+        for raw in ('accounts/1/locations/10', 'locations/10', '10', ' locations/10/ '):
+            self.assertEqual(location_id(raw), '10')
+            self.assertEqual(performance_name(raw), 'locations/10')
+
+    def test_refresh_stores_full_paths_and_drops_stale(self):
+        """Odświeżenie zapisuje wszystkie strony lokalizacji z kontem i usuwa nieistniejące"""
+        GBPLocation.objects.create(location_id='99', account_name='accounts/1', title='Stara')
+        api = FakeBusinessApi()
+
+        with patch('leads.services.gbp_locations.requests.get', side_effect=api.get):
+            count = refresh_registry('token')
+
+        self.assertEqual(count, 2)
+        roma = GBPLocation.objects.get(location_id='10')
+        self.assertEqual(roma.full_name, 'accounts/1/locations/10')
+        self.assertEqual(roma.address, 'Długa 1, Kraków')
+        self.assertFalse(GBPLocation.objects.filter(location_id='99').exists())
+
+    def test_publish_path_comes_from_registry_without_network(self):
+        """Pełna ścieżka do publikacji jest brana z rejestru, bez zapytań do Google"""
+        GBPLocation.objects.create(location_id='10', account_name='accounts/1', title='Pizzeria Roma')
+
+        with patch('leads.services.gbp_locations.requests.get') as get:
+            self.assertEqual(get_full_location_name('token', 'locations/10'), 'accounts/1/locations/10')
+
+        get.assert_not_called()
+        self.assertIsNone(full_name('locations/404'))
+
+    def test_unknown_location_refreshes_registry_once(self):
+        """Lokalizacja spoza rejestru odświeża go raz; nadal nieznana — błąd"""
+        api = FakeBusinessApi()
+
+        with patch('leads.services.gbp_locations.requests.get', side_effect=api.get):
+            self.assertEqual(get_full_location_name('token', '20'), 'accounts/1/locations/20')
+            calls = len(api.calls)
+            with self.assertRaises(ValueError):
+                get_full_location_name('token', 'locations/404')
+
+        self.assertEqual(calls, 3)
+        self.assertEqual(len(api.calls), 6)
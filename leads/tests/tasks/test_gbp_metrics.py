@@ -0,0 +1,529 @@
+from datetime import date, timedelta
+from urllib.parse import parse_qsl, urlsplit
+from unittest.mock import patch, MagicMock
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from config.celery import app as celery_app
+from ...models import (
+    City, Lead, AppSettings, GBPFetchRun, GBPFetchRunItem, GBPHealth, GBPMetricsSnapshot, GBPUnavailableDay,
+)
+from ...services.gbp_service import get_access_token
+from ...tasks import fetch_gbp_metrics_all
+
+SHARED_LOCMEM = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'gbp-test'},
+}
+
+
+def _fast_rate_limits(test):
+    """Wysokie limity zapytań na czas testu — bez czekania na prawdziwy limiter GBP (240/min)."""
+    limits = override_settings(API_RATE_LIMITS={'dataforseo': 60000, 'gbp_performance': 60000})
+    limits.enable()
+    test.addCleanup(limits.disable)
+    # Limitery są tworzone raz na proces — nowe, z limitem z testu
+    limiters = patch.dict('leads.services.rate_limit._limiters', clear=True)
+    limiters.start()
+    test.addCleanup(limiters.stop)
+
+
+def _response(data, ok=True):
+    resp = MagicMock()
+    resp.ok = ok
+    resp.status_code = 200 if ok else 500
+    resp.text = ''
+    resp.json.return_value = data
+    resp.raise_for_status.return_value = None
+    return resp
+
+
+def _token_response(*args, **kwargs):
+    return _response({'access_token': 'token-123', 'expires_in': 3599})
+
+
+def _range(url):
+    """(od, do) z parametrów dailyRange zapytania."""
+    params = dict(parse_qsl(urlsplit(url).query))
+    return tuple(
+        date(int(params[f'dailyRange.{edge}.year']), int(params[f'dailyRange.{edge}.month']),
+             int(params[f'dailyRange.{edge}.day']))
+        for edge in ('startDate', 'endDate')
+    )
+
+
+class FakePerformanceApi:
+    """
+    Performance API z metrykami dla podanych dni (w granicach zapytanego zakresu);
+    lokalizacje z `failing` zwracają HTTP 500.
+    """
+
+    def __init__(self, days, failing=()):
+        self.days = days
+        self.failing = set(failing)
+        self.calls = []
+        self.ranges = []
+
+    def _dated(self, value, date_from, date_to):
+        return [
+            {'date': {'year': d.year, 'month': d.month, 'day': d.day}, 'value': str(value)}
+            for d in self.days if date_from <= d <= date_to
+        ]
+
+    def get(self, url, **kwargs):
+        location = url.split('/v1/')[1].split(':')[0]
+        self.calls.append(location)
+        if location in self.failing:
+            return _response({}, ok=False)
+        date_from, date_to = _range(url)
+        if ':getDailyMetricsTimeSeries' in url:
+            return _response({'timeSeries': {'datedValues': self._dated(2, date_from, date_to)}})
+        self.ranges.append((location, date_from, date_to))
+        return _response({'multiDailyMetricTimeSeries': [{'dailyMetricTimeSeries': [
+            {'dailyMetric': 'CALL_CLICKS', 'timeSeries': {'datedValues': self._dated(3, date_from, date_to)}},
+            {'dailyMetric': 'BUSINESS_IMPRESSIONS_MOBILE_MAPS',
+             'timeSeries': {'datedValues': self._dated(10, date_from, date_to)}},
+        ]}]})
+
+
+@override_settings(CACHES=SHARED_LOCMEM)
+class GBPMetricsHarvestTest(TestCase):
+
+    def setUp(self):
+        caches['shared'].clear()
+        _fast_rate_limits(self)
+        settings = AppSettings.get()
+        settings.google_refresh_token = 'refresh'
+        settings.save()
+        city = City.objects.create(name="Kraków")
+        self.leads = [
+            Lead.objects.create(city=city, name=f"Klient {i}", status='client', gbp_location_name=f'locations/{i}')
+            for i in range(3)
+        ]
+        today = timezone.now().date()
+        self.days = [today - timedelta(days=n) for n in (6, 7, 8)]
+        # Subtaski przebiegu (chord) wykonywane od razu, w wątku testu
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, 'task_always_eager', False)
+
+    def _run(self, api, new_window=False):
+        """new_window — jak kolejna noc (nowy przebieg zamiast wznowienia)."""
+        if new_window:
+            GBPFetchRun.objects.all().delete()
+        with patch('leads.services.gbp_service.requests.post', side_effect=_token_response) as post, \
+             patch('leads.services.gbp_service.requests.get', side_effect=api.get):
+            fetch_gbp_metrics_all()
+        return GBPFetchRun.objects.get().report, post
+
+    def test_access_token_is_cached(self):
+        """Access token jest pobierany raz i trzymany w cache do wygaśnięcia"""
+        with patch('leads.services.gbp_service.requests.post', side_effect=_token_response) as post:
+            self.assertEqual(get_access_token('refresh'), 'token-123')
+            self.assertEqual(get_access_token('refresh'), 'token-123')
+
+        self.assertEqual(post.call_count, 1)
+
+    def test_harvests_all_locations_and_reports(self):
+        """Wszystkie lokalizacje są pobrane, dni zapisane, raport zawiera czasy i błędy"""
+        api = FakePerformanceApi(self.days, failing={'locations/2'})
+
+        report, post = self._run(api)
+
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual(report['locations'], 3)
+        self.assertEqual(report['failed'], 1)
+        self.assertEqual(report['rows_written'], 6)
+        self.assertIn('Klient 2', report['errors'])
+        daily = GBPMetricsSnapshot.objects.filter(day__isnull=False)
+        self.assertEqual(daily.filter(lead=self.leads[0]).count(), 3)
+        self.assertFalse(daily.filter(lead=self.leads[2]).exists())
+        row = daily.filter(lead=self.leads[1]).first()
+        self.assertEqual((row.calls, row.profile_views, row.direction_requests), (3, 10, 2))
+
+    def test_requests_only_missing_ranges(self):
+        """Do API idą tylko brakujące ciągłe zakresy, a nie całe okno"""
+        from ...services.gbp_service import ingest_daily_metrics
+        api = FakePerformanceApi(self.days)
+        window_to = timezone.now().date() - timedelta(days=5)
+        window = [window_to - timedelta(days=n) for n in range(31)]
+        # Klient 0 ma komplet poza dniami 6, 7 i 20 dni temu; 1 i 2 — komplet
+        have = [d for d in window if (timezone.now().date() - d).days not in (6, 7, 20)]
+        for lead in self.leads:
+            ingest_daily_metrics(lead, {d.isoformat(): {} for d in (have if lead == self.leads[0] else window)})
+
+        self._run(api)
+
+        today = timezone.now().date()
+        self.assertEqual(sorted(api.ranges), [
+            ('locations/0', today - timedelta(days=20), today - timedelta(days=20)),
+            ('locations/0', today - timedelta(days=7), today - timedelta(days=6)),
+        ])
+        self.assertEqual(set(api.calls), {'locations/0'})
+
+    def test_unavailable_days_are_not_fetched_again(self):
+        """Dni bez danych w odpowiedzi są zapamiętywane i po kilku próbach pomijane"""
+        from ...services.gbp_gaps import UNAVAILABLE_AFTER_ATTEMPTS
+        api = FakePerformanceApi(self.days)
+
+        for _ in range(UNAVAILABLE_AFTER_ATTEMPTS):
+            self._run(api, new_window=True)
+        requests_before = len(api.calls)
+        report, _ = self._run(api, new_window=True)
+
+        self.assertEqual(len(api.calls), requests_before)
+        self.assertEqual(report['rows_written'], 0)
+        self.assertEqual(GBPUnavailableDay.objects.filter(lead=self.leads[0]).count(), 28)
+        self.assertEqual(
+            GBPUnavailableDay.objects.filter(lead=self.leads[0]).values_list('attempts', flat=True).distinct().get(),
+            UNAVAILABLE_AFTER_ATTEMPTS,
+        )
+
+    def test_run_records_status_rows_and_duration_per_client(self):
+        """Przebieg zapisuje status, liczbę wierszy i czas każdego klienta"""
+        self._run(FakePerformanceApi(self.days))
+
+        run = GBPFetchRun.objects.get()
+        self.assertEqual((run.status, run.clients, run.failed, run.rows_written), (GBPFetchRun.STATUS_DONE, 3, 0, 9))
+        self.assertIsNotNone(run.finished_at)
+        # Kondycja liczona na koniec przebiegu, z ostatnim dniem okna
+        self.assertEqual(run.report['health'], 3)
+        self.assertEqual(set(GBPHealth.objects.values_list('as_of', flat=True)), {run.date_to})
+        for item in run.items.all():
+            self.assertEqual((item.status, item.rows_written, item.attempts), (GBPFetchRunItem.STATUS_DONE, 3, 1))
+            self.assertIsNotNone(item.duration)
+
+    def test_rerun_in_same_window_skips_finished_clients(self):
+        """Ponowne uruchomienie tego samego dnia pobiera tylko klientów, którym się nie udało"""
+        self._run(FakePerformanceApi(self.days, failing={'locations/2'}))
+        run = GBPFetchRun.objects.get()
+        self.assertEqual(run.status, GBPFetchRun.STATUS_PARTIAL)
+        failed = run.items.get(lead=self.leads[2])
+        # Pierwsza próba + ponowienia subtaska
+        self.assertEqual((failed.status, failed.attempts), (GBPFetchRunItem.STATUS_FAILED, 4))
+        GBPMetricsSnapshot.objects.filter(lead=self.leads[0]).delete()
+
+        api = FakePerformanceApi(self.days)
+        report, _ = self._run(api)
+
+        # Klient 0 był gotowy — nie jest pobierany ponownie, mimo braku dni w bazie
+        self.assertEqual(set(api.calls), {'locations/2'})
+        self.assertEqual(report['failed'], 0)
+        run.refresh_from_db()
+        self.assertEqual((run.status, run.rows_written), (GBPFetchRun.STATUS_DONE, 9))
+        self.assertEqual(GBPMetricsSnapshot.objects.filter(lead=self.leads[2], day__isnull=False).count(), 3)
+
+
+    def test_rerun_skips_clients_waiting_for_retry(self):
+        """Klient z zaplanowanym ponowieniem nie jest wysyłany drugi raz; porzucony — tak"""
+        today = timezone.now().date()
+        run = GBPFetchRun.objects.create(
+            window=today, date_from=today - timedelta(days=35), date_to=today - timedelta(days=5),
+        )
+        GBPFetchRunItem.objects.create(
+            run=run, lead=self.leads[0], status=GBPFetchRunItem.STATUS_PENDING, attempts=1, started_at=timezone.now(),
+        )
+        GBPFetchRunItem.objects.create(
+            run=run, lead=self.leads[1], status=GBPFetchRunItem.STATUS_PENDING, attempts=1,
+            started_at=timezone.now() - timedelta(hours=2),
+        )
+
+        api = FakePerformanceApi(self.days)
+        self._run(api)
+
+        self.assertEqual(set(api.calls), {'locations/1', 'locations/2'})
+
+
+class DayRangesTest(TestCase):
+
+    def test_groups_days_into_contiguous_ranges(self):
+        """Brakujące dni są łączone w najmniejszą listę ciągłych zakresów"""
+        from ...services.gbp_gaps import day_ranges
+        days = {date(2026, 2, 27), date(2026, 3, 1), date(2026, 2, 28), date(2026, 3, 5), date(2026, 3, 6)}
+
+        self.assertEqual(day_ranges(days), [
+            (date(2026, 2, 27), date(2026, 3, 1)),
+            (date(2026, 3, 5), date(2026, 3, 6)),
+        ])
+        self.assertEqual(day_ranges(set()), [])
+
+
+class IngestDailyMetricsTest(TestCase):
+
+    def setUp(self):
+        city = City.objects.create(name="Kraków")
+        self.lead = Lead.objects.create(city=city, name="Klient", status='client')
+
+    def test_upsert_overwrites_existing_days(self):
+        """Ponowny zapis tych samych dni aktualizuje wiersze zamiast dublować"""
+        from ...services.gbp_service import ingest_daily_metrics
+        daily = {'2026-03-01': {'CALL_CLICKS': 1}, '2026-03-02': {'CALL_CLICKS': 2}}
+        ingest_daily_metrics(self.lead, daily)
+
+        saved = ingest_daily_metrics(self.lead, {'2026-03-02': {'CALL_CLICKS': 9}}, {'2026-03-02': 4})
+
+        self.assertEqual(saved, 1)
+        rows = GBPMetricsSnapshot.objects.filter(lead=self.lead).order_by('day')
+        self.assertEqual([(r.day, r.calls) for r in rows], [(1, 1), (2, 9)])
+        self.assertEqual(rows[1].direction_requests, 4)
+
+    def test_only_days_limits_written_rows(self):
+        """only_days zapisuje wyłącznie wskazane dni"""
+        from ...services.gbp_service import ingest_daily_metrics
+        daily = {'2026-03-01': {'CALL_CLICKS': 1}, '2026-03-02': {'CALL_CLICKS': 2}}
+
+        ingest_daily_metrics(self.lead, daily, only_days={(2026, 3, 2)})
+
+        self.assertEqual(list(GBPMetricsSnapshot.objects.values_list('day', flat=True)), [2])
+
+    def test_failed_month_write_rolls_back_daily_rows(self):
+        """Błąd zapisu spakowanego miesiąca cofa też wiersze dzienne — dzień zostaje do pobrania"""
+        from django.db import OperationalError
+        from ...services.gbp_gaps import missing_days
+        from ...services.gbp_service import ingest_daily_metrics
+
+        with patch('leads.services.gbp_series.write_days', side_effect=OperationalError('lock timeout')):
+            with self.assertRaises(OperationalError):
+                ingest_daily_metrics(self.lead, {'2026-03-01': {'CALL_CLICKS': 1}})
+
+        self.assertFalse(GBPMetricsSnapshot.objects.exists())
+        self.assertEqual(missing_days([self.lead.pk], date(2026, 3, 1), date(2026, 3, 1))[self.lead.pk], {date(2026, 3, 1)})
+
+    def test_gaps_are_read_from_packed_months(self):
+        """Dzień bez danych w GBPMetricsMonth jest brakujący, nawet gdy ma wiersz dzienny"""
+        from ...services.gbp_gaps import missing_days
+        from ...services.gbp_service import ingest_daily_metrics
+        ingest_daily_metrics(self.lead, {'2026-03-01': {'CALL_CLICKS': 1}, '2026-03-02': {'CALL_CLICKS': 2}})
+        GBPMetricsSnapshot.objects.create(
+            lead=self.lead, year=2026, month=3, day=3, source=GBPMetricsSnapshot.SOURCE_API, calls=3,
+        )
+
+        missing = missing_days([self.lead.pk], date(2026, 2, 28), date(2026, 3, 3))
+
+        self.assertEqual(missing[self.lead.pk], {date(2026, 2, 28), date(2026, 3, 3)})
+
+
+class MonthlyRollupTest(TestCase):
+
+    def setUp(self):
+        city = City.objects.create(name="Kraków")
+        self.leads = [Lead.objects.create(city=city, name=f"Klient {i}", status='client') for i in range(3)]
+
+    def _ingest(self, lead, days, calls):
+        from ...services.gbp_service import ingest_daily_metrics
+        ingest_daily_metrics(lead, {d: {'CALL_CLICKS': calls} for d in days})
+
+    def _monthly(self, lead, month):
+        return GBPMetricsSnapshot.objects.get(lead=lead, year=2026, month=month, day__isnull=True)
+
+    def test_rollup_sums_all_clients_and_months(self):
+        """Jeden rollup liczy sumy dla wszystkich klientów i miesięcy"""
+        from ...services.gbp_rollup import rollup_months
+        for lead in self.leads:
+            self._ingest(lead, ['2026-02-27', '2026-02-28', '2026-03-01'], calls=2)
+
+        result = rollup_months()
+
+        self.assertEqual(result['created'], 6)
+        self.assertEqual(self._monthly(self.leads[0], 2).calls, 4)
+        self.assertEqual(self._monthly(self.leads[2], 3).calls, 2)
+
+    def test_only_changed_months_are_recomputed(self):
+        """Drugi rollup pomija aktualne miesiące i przelicza tylko zmieniony"""
+        from ...services.gbp_rollup import rollup_months
+        for lead in self.leads:
+            self._ingest(lead, ['2026-02-28', '2026-03-01'], calls=1)
+        rollup_months()
+
+        self.assertEqual(rollup_months(), {'created': 0, 'updated': 0, 'skipped': 6, 'deleted': 0})
+
+        self._ingest(self.leads[1], ['2026-03-01'], calls=5)
+        result = rollup_months()
+
+        self.assertEqual(result['updated'], 1)
+        self.assertEqual(self._monthly(self.leads[1], 3).calls, 5)
+        self.assertEqual(self._monthly(self.leads[1], 2).calls, 1)
+
+    def test_dirty_months_outside_window_are_recomputed_or_removed(self):
+        """Brudny miesiąc spoza okna `since` jest przeliczany, a bez dni — usuwany"""
+        from ...services.gbp_rollup import mark_month_dirty, rollup_months
+        from ...services.gbp_series import clear_days
+        lead = self.leads[0]
+        self._ingest(lead, ['2026-01-10', '2026-01-11', '2026-02-10', '2026-05-01'], calls=1)
+        rollup_months()
+
+        # Jak akcja usuwania dnia w widoku gbp_metrics_daily
+        for day in (date(2026, 1, 10), date(2026, 2, 10)):
+            GBPMetricsSnapshot.objects.filter(lead=lead, year=day.year, month=day.month, day=day.day).delete()
+            mark_month_dirty(lead.pk, day.year, day.month)
+            clear_days(lead.pk, [day])
+        result = rollup_months(since=(2026, 5))
+
+        self.assertEqual((result['updated'], result['deleted']), (1, 1))
+        self.assertEqual(self._monthly(lead, 1).calls, 1)
+        self.assertFalse(GBPMetricsSnapshot.objects.filter(lead=lead, month=2).exists())
+
+    def test_query_count_does_not_grow_with_clients(self):
+        """Rollup wykonuje stałą liczbę zapytań niezależnie od liczby klientów"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from ...services.gbp_rollup import rollup_months
+        self._ingest(self.leads[0], ['2026-03-01'], calls=1)
+        rollup_months()
+        self._ingest(self.leads[0], ['2026-03-02', '2026-04-01'], calls=1)
+        with CaptureQueriesContext(connection) as few:
+            rollup_months()
+
+        for lead in self.leads:
+            self._ingest(lead, ['2026-03-03', '2026-05-01'], calls=1)
+        with CaptureQueriesContext(connection) as many:
+            result = rollup_months()
+
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+        self.assertEqual((result['created'], result['updated']), (5, 1))
+
+
+@override_settings(CACHES=SHARED_LOCMEM, GBP_BACKFILL_MONTHS=2, GBP_BACKFILL_CHUNK_DAYS=31, GBP_BACKFILL_ROUNDS_PER_RUN=1)
+class GBPBackfillTest(TestCase):
+
+    def setUp(self):
+        caches['shared'].clear()
+        _fast_rate_limits(self)
+        settings = AppSettings.get()
+        settings.google_refresh_token = 'refresh'
+        settings.save()
+        city = City.objects.create(name="Kraków")
+        self.lead = Lead.objects.create(city=city, name="Nowy klient", status='client', gbp_location_name='locations/7')
+        today = timezone.now().date()
+        self.days = [today - timedelta(days=n) for n in range(5, 100)]
+
+    def _run(self, api, **kwargs):
+        from ...tasks import backfill_gbp_metrics
+        with patch('leads.services.gbp_service.requests.post', side_effect=_token_response), \
+             patch('leads.services.gbp_service.requests.get', side_effect=api.get), \
+             patch('leads.tasks.backfill_gbp_metrics.apply_async') as requeue:
+            result = backfill_gbp_metrics(**kwargs)
+        return result, requeue
+
+    def test_new_client_gets_full_history_in_chunks(self):
+        """Nowy klient dostaje kursor; paczki idą aż do końca zakresu, potem rollup"""
+        from ...models import GBPBackfill
+        from ...services.gbp_backfill import backfill_range
+        api = FakePerformanceApi(self.days)
+        date_from, date_to = backfill_range()
+
+        result, requeue = self._run(api)
+
+        backfill = GBPBackfill.objects.get(lead=self.lead)
+        self.assertEqual(backfill.cursor, date_from + timedelta(days=31))
+        self.assertEqual(result['saved'], 31)
+        requeue.assert_called_once()
+
+        while backfill.status == GBPBackfill.STATUS_PENDING:
+            self._run(api)
+            backfill.refresh_from_db()
+
+        self.assertEqual(backfill.status, GBPBackfill.STATUS_DONE)
+        self.assertEqual(backfill.days_saved, (date_to - date_from).days + 1)
+        monthly = GBPMetricsSnapshot.objects.filter(lead=self.lead, day__isnull=True)
+        self.assertEqual(monthly.count(), len({(d.year, d.month) for d in self.days if d >= date_from}))
+
+    def test_failed_chunk_keeps_cursor_for_resume(self):
+        """Nieudana paczka nie przesuwa kursora — kolejne uruchomienie wznawia od tego miejsca"""
+        from ...models import GBPBackfill
+        self._run(FakePerformanceApi(self.days))
+        cursor = GBPBackfill.objects.get(lead=self.lead).cursor
+
+        self._run(FakePerformanceApi(self.days, failing={'locations/7'}))
+        backfill = GBPBackfill.objects.get(lead=self.lead)
+        self.assertEqual((backfill.cursor, backfill.errors), (cursor, 1))
+
+        api = FakePerformanceApi(self.days)
+        self._run(api)
+        backfill.refresh_from_db()
+        self.assertEqual(backfill.errors, 0)
+        self.assertEqual(api.ranges[0][1], cursor)
+
+    def test_second_instance_is_skipped_while_locked(self):
+        """Gdy inna instancja trzyma blokadę, task nie pobiera nic z API"""
+        from ...tasks import BACKFILL_LOCK_KEY
+        caches['shared'].add(BACKFILL_LOCK_KEY, 1)
+        api = FakePerformanceApi(self.days)
+
+        result, requeue = self._run(api)
+
+        self.assertIsNone(result)
+        self.assertEqual(api.calls, [])
+        requeue.assert_not_called()
+
+    def test_range_starts_within_api_limit(self):
+        """Początek zakresu w połowie miesiąca to dzień po dacie sprzed 18 miesięcy, nie 1. dzień miesiąca"""
+        from ...services.gbp_backfill import backfill_range
+
+        self.assertEqual(backfill_range(date(2026, 10, 18), 18)[0], date(2025, 4, 19))
+        self.assertEqual(backfill_range(date(2026, 3, 31), 18)[0], date(2024, 10, 1))
+
+
+class GBPSeriesTest(TestCase):
+
+    def setUp(self):
+        city = City.objects.create(name="Kraków")
+        self.lead = Lead.objects.create(city=city, name="Klient", status='client')
+
+    def test_ingest_writes_through_and_range_read_spans_months(self):
+        """ingest zapisuje też spakowane miesiące; odczyt zakresu skleja miesiące, brak dnia = NaN"""
+        import numpy as np
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from ...services.gbp_service import ingest_daily_metrics
+        from ...services.gbp_series import read_range
+        ingest_daily_metrics(self.lead, {
+            '2026-02-27': {'CALL_CLICKS': 1},
+            '2026-03-01': {'CALL_CLICKS': 3},
+            '2026-03-02': {'CALL_CLICKS': 4, 'WEBSITE_CLICKS': 2},
+        })
+
+        with CaptureQueriesContext(connection) as ctx:
+            dates, values = read_range(self.lead.pk, date(2026, 2, 27), date(2026, 3, 2))
+
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(str(dates[0]), '2026-02-27')
+        self.assertEqual(len(dates), 4)
+        np.testing.assert_array_equal(values['calls'], [1, np.nan, 3, 4])
+        np.testing.assert_array_equal(values['website_visits'], [0, np.nan, 0, 2])
+
+    def test_month_totals_and_overwrite(self):
+        """Suma miesiąca to odczyt jednego wiersza; ponowny zapis dnia nadpisuje wartość"""
+        from ...models import GBPMetricsMonth
+        from ...services.gbp_service import ingest_daily_metrics
+        from ...services.gbp_series import month_totals, clear_days
+        ingest_daily_metrics(self.lead, {'2026-03-01': {'CALL_CLICKS': 3}, '2026-03-02': {'CALL_CLICKS': 4}})
+        ingest_daily_metrics(self.lead, {'2026-03-02': {'CALL_CLICKS': 10}})
+
+        self.assertEqual(GBPMetricsMonth.objects.count(), 1)
+        totals = month_totals(self.lead.pk, 2026, 3)
+        self.assertEqual((totals['calls'], totals['direction_requests']), (13, None))
+
+        clear_days(self.lead.pk, [date(2026, 3, 1)])
+        self.assertEqual(month_totals(self.lead.pk, 2026, 3)['calls'], 10)
+        self.assertIsNone(month_totals(self.lead.pk, 2026, 4)['calls'])
+
+    def test_data_migration_packs_existing_rows(self):
+        """Migracja danych pakuje istniejące wiersze dzienne w miesiące"""
+        import importlib
+        import numpy as np
+        from django.apps import apps
+        from ...models import GBPMetricsMonth
+        from ...services.gbp_series import read_range
+        migration = importlib.import_module('leads.migrations.0076_pack_gbp_daily_metrics')
+        for day, calls in ((30, 5), (31, 6)):
+            GBPMetricsSnapshot.objects.create(
+                lead=self.lead, year=2026, month=1, day=day, source=GBPMetricsSnapshot.SOURCE_API, calls=calls,
+            )
+        GBPMetricsSnapshot.objects.create(lead=self.lead, year=2026, month=1, source=GBPMetricsSnapshot.SOURCE_MANUAL, calls=99)
+
+        migration.pack_daily_metrics(apps, None)
+
+        self.assertEqual(GBPMetricsMonth.objects.count(), 1)
+        _, values = read_range(self.lead.pk, date(2026, 1, 30), date(2026, 1, 31))
+        np.testing.assert_array_equal(values['calls'], [5, 6])
+        self.assertTrue(np.isnan(values['profile_views']).all())
@@ -0,0 +1,111 @@
+from datetime import timedelta
+from unittest.mock import patch, MagicMock
+from django.test import TestCase
+from django.utils import timezone
+from ...models import City, Lead, LeadKeyword, AppSettings, GeoGridScan
+from ...services.geo_grid import create_scan, grid_points
+from ...tasks_analysis import run_geo_grid_scans
+
+
+def _response(data):
+    resp = MagicMock()
+    resp.json.return_value = data
+    resp.raise_for_status.return_value = None
+    resp.status_code = 200
+    return resp
+
+
+class GeoGridScanTest(TestCase):
+
+    def setUp(self):
+        settings = AppSettings.get()
+        settings.dataforseo_login = 'login'
+        settings.dataforseo_password = 'haslo'
+        settings.save()
+
+        self.city = City.objects.create(name="Kraków", latitude=50.06, longitude=19.94)
+        self.lead = Lead.objects.create(
+            city=self.city, name="Pizzeria Roma", status='client',
+            google_maps_url='https://maps.google.com/?cid=123456',
+            latitude=50.0614, longitude=19.9366,
+        )
+        self.kw = LeadKeyword.objects.create(lead=self.lead, phrase="pizzeria kraków")
+        self.rank = 1
+
+    def _fake_post(self, url, json=None, **kwargs):
+        tasks = []
+        for t in json:
+            task_id = f"task-{len(self.posted)}"
+            self.posted[task_id] = t
+            tasks.append({'id': task_id, 'status_code': 20100, 'data': t})
+        return _response({'tasks': tasks})
+
+    def _fake_get(self, url, **kwargs):
+        if url.endswith('tasks_ready'):
+            return _response({'tasks': [{'result': [{'id': task_id} for task_id in self.posted]}]})
+        items = [{'cid': 123456, 'rank_absolute': self.rank, 'title': 'Pizzeria Roma'}]
+        return _response({'tasks': [{'status_code': 20000, 'result': [{'items': items}]}]})
+
+    def _run(self, scans, changed_only=False):
+        self.posted = {}
+        with patch('leads.services.dataforseo_client.requests.Session.post', side_effect=self._fake_post), \
+             patch('leads.services.dataforseo_client.requests.Session.get', side_effect=self._fake_get):
+            return run_geo_grid_scans([scan.pk for scan in scans], changed_only=changed_only)
+
+    def test_grid_points_snap_to_shared_lattice(self):
+        """Pobliskie wizytówki dostają punkty z tej samej siatki"""
+        a = {p for row in grid_points(50.0614, 19.9366, 3, 1.0) for p in row}
+        b = {p for row in grid_points(50.0650, 19.9400, 3, 1.0) for p in row}
+        self.assertEqual(a, b)
+
+    def test_scan_stores_position_matrix(self):
+        """Skan zapisuje macierz N×N pozycji"""
+        scan = create_scan(self.kw, size=3)
+        summary = self._run([scan])
+
+        scan.refresh_from_db()
+        self.assertEqual(scan.status, GeoGridScan.STATUS_DONE)
+        self.assertEqual(scan.positions, [[1, 1, 1]] * 3)
+        self.assertEqual(summary['tasks'], 9)
+
+    def test_nearby_clients_share_serp_fetches(self):
+        """Dwa skany tej samej frazy w pobliżu = jedno zadanie na wspólny punkt"""
+        other = Lead.objects.create(
+            city=self.city, name="Inna pizzeria", status='client', latitude=50.0650, longitude=19.9400,
+        )
+        other_kw = LeadKeyword.objects.create(lead=other, phrase="Pizzeria Kraków")
+
+        summary = self._run([create_scan(self.kw, size=3), create_scan(other_kw, size=3)])
+
+        self.assertEqual(summary['cells'], 18)
+        self.assertEqual(summary['tasks'], 9)
+
+    def test_changed_only_rescans_changed_cells(self):
+        """Ponowny skan tylko zmienionych komórek nie pobiera stabilnej siatki"""
+        first = create_scan(self.kw, size=3)
+        self._run([first])
+        second = create_scan(self.kw, size=3)
+        self._run([second])  # ten sam dzień — SERP-y z magazynu, brak zmian
+
+        second.refresh_from_db()
+        self.assertEqual(second.changed_cells, [])
+
+        third = create_scan(self.kw, size=3)
+        summary = self._run([third], changed_only=True)
+
+        third.refresh_from_db()
+        self.assertEqual(summary['cells'], 0)
+        self.assertEqual(third.positions, [[1, 1, 1]] * 3)
+
+    def test_changed_only_refreshes_whole_grid_after_full_refresh_days(self):
+        """Bez pełnego pobrania od FULL_REFRESH_DAYS tryb changed_only pobiera całą siatkę"""
+        first = create_scan(self.kw, size=3)
+        self._run([first])
+        second = create_scan(self.kw, size=3)
+        self._run([second], changed_only=True)
+        GeoGridScan.objects.update(finished_at=timezone.now() - timedelta(days=8))
+
+        third = create_scan(self.kw, size=3)
+        summary = self._run([third], changed_only=True)
+
+        self.assertEqual(summary['cells'], 9)
@@ -0,0 +1,276 @@
+import json
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch, MagicMock
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from ...constants import POLAND_LOCATION_CODE
+from ...models import (
+    AppSettings, City, KeywordSuggestionBatch, KeywordVolume, KeywordVolumeTask, Lead, Voivodeship, VoivodeshipKeyword,
+)
+from ...services.dataforseo_volumes import fetch_keyword_volumes_with_stats, store_volumes
+from ...tasks import collect_keyword_volumes_task, fetch_keyword_volumes_task
+from ...tasks_analysis import generate_keyword_suggestions
+
+
+class FakeDataForSEO:
+    """
+    Lokalny serwer HTTP w miejscu search_volume DataForSEO (live i kolejka standard).
+    Wolumen = długość frazy; frazy z 'kebab' nie mają danych w odpowiedzi.
+    Zadanie z kolejki jest gotowe dopiero po mark_ready(); task_get zadań z `broken` zwraca błąd API.
+    """
+
+    def __init__(self):
+        self.sent = []
+        self.tasks = {}
+        self.ready = set()
+        self.broken = set()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, data):
+                body = json.dumps(data).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                self._reply(fake.post(self.path, json.loads(self.rfile.read(int(self.headers['Content-Length'])))))
+
+            def do_GET(self):
+                self._reply(fake.get(self.path))
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/v3'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @staticmethod
+    def _result(keywords):
+        return [{'keyword': k, 'search_volume': len(k)} for k in keywords if 'kebab' not in k]
+
+    def post(self, path, payload):
+        if path.endswith('/live'):
+            self.sent.append(payload[0]['keywords'])
+            return {'status_code': 20000, 'tasks': [{'status_code': 20000, 'result': self._result(payload[0]['keywords'])}]}
+        tasks = []
+        for task in payload:
+            task_id = f'task-{len(self.tasks)}'
+            self.tasks[task_id] = task['keywords']
+            self.sent.append(task['keywords'])
+            tasks.append({'id': task_id, 'status_code': 20100})
+        return {'status_code': 20000, 'cost': 0.05 * len(tasks), 'tasks': tasks}
+
+    def get(self, path):
+        if path.endswith('/tasks_ready'):
+            return {'status_code': 20000, 'tasks': [{'result': [{'id': task_id} for task_id in sorted(self.ready)]}]}
+        task_id = path.rsplit('/', 1)[-1]
+        if task_id in self.broken:
+            return {'status_code': 50000, 'status_message': 'Internal Error.'}
+        self.ready.discard(task_id)
+        return {'status_code': 20000, 'tasks': [{'status_code': 20000, 'result': self._result(self.tasks[task_id])}]}
+
+    def mark_ready(self, *task_ids):
+        self.ready |= set(task_ids or self.tasks)
+
+
+class KeywordVolumeCacheTest(TestCase):
+
+    def setUp(self):
+        settings = AppSettings.get()
+        settings.dataforseo_login = 'login'
+        settings.dataforseo_password = 'haslo'
+        settings.save()
+        self.voivodeship = Voivodeship.objects.create(name='małopolskie')
+        for phrase in ('pizzeria kraków', 'pizza kraków!', 'kebab kraków'):
+            VoivodeshipKeyword.objects.create(voivodeship=self.voivodeship, phrase=phrase)
+
+        self.api = FakeDataForSEO()
+        self.addCleanup(self.api.stop)
+        api_base = override_settings(DATAFORSEO_API_BASE=self.api.url)
+        api_base.enable()
+        self.addCleanup(api_base.disable)
+
+    def _fetch_and_collect(self):
+        VoivodeshipKeyword.objects.update(monthly_searches=None)
+        posted = fetch_keyword_volumes_task(self.voivodeship.pk)
+        self.api.mark_ready()
+        return posted, collect_keyword_volumes_task()
+
+    def test_second_run_is_served_from_cache(self):
+        """Drugi przebieg nie pyta API — wolumeny i brak danych są w cache"""
+        first, collected = self._fetch_and_collect()
+        second, _ = self._fetch_and_collect()
+
+        self.assertEqual([sorted(sent) for sent in self.api.sent], [['kebab kraków', 'pizza kraków', 'pizzeria kraków']])
+        self.assertEqual((first['hits'], first['posted'], collected['updated']), (0, 3, 2))
+        self.assertEqual((second['hits'], second['hit_ratio'], second['posted'], second['updated']), (3, 1.0, 0, 2))
+        self.assertEqual(
+            VoivodeshipKeyword.objects.get(phrase='pizza kraków!').monthly_searches, str(len('pizza kraków')),
+        )
+        self.assertIsNone(KeywordVolume.objects.get(phrase='kebab kraków').search_volume)
+
+    def test_cache_is_per_location_and_expires(self):
+        """Inna lokalizacja i wpis starszy niż TTL idą do API, reszta z cache"""
+        fetch_keyword_volumes_with_stats(['pizzeria kraków', 'pizza kraków'], 'login', 'haslo', location_code=20851)
+        KeywordVolume.objects.filter(phrase='pizza kraków').update(fetched_at=timezone.now() - timedelta(days=40))
+
+        volumes, stats = fetch_keyword_volumes_with_stats(
+            ['Pizzeria Kraków', 'pizza kraków'], 'login', 'haslo', location_code=20851,
+        )
+        fetch_keyword_volumes_with_stats(['pizzeria kraków'], 'login', 'haslo', location_code=2616)
+
+        self.assertEqual(self.api.sent[1:], [['pizza kraków'], ['pizzeria kraków']])
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_ratio']), (1, 1, 0.5))
+        self.assertEqual(volumes['Pizzeria Kraków'], len('pizzeria kraków'))
+
+    def test_failed_request_is_not_cached(self):
+        """Błąd API nie trafia do cache — fraza zostaje do pobrania"""
+        with patch('leads.services.dataforseo_client.requests.Session.post', side_effect=ConnectionError('timeout')):
+            volumes, stats = fetch_keyword_volumes_with_stats(['pizzeria kraków'], 'login', 'haslo')
+
+        self.assertEqual((volumes, stats['failed']), ({}, 1))
+        self.assertFalse(KeywordVolume.objects.exists())
+
+    def test_collected_chunks_survive_restart_and_are_not_reposted(self):
+        """Odebrane paczki są zapisane od razu, reszta czeka w bazie na kolejny przebieg pollera"""
+        with patch('leads.services.dataforseo_volumes.CHUNK_SIZE', 2):
+            posted = fetch_keyword_volumes_task(self.voivodeship.pk)
+            # Ponowne kliknięcie przed odebraniem wyników nie wysyła fraz drugi raz
+            again = fetch_keyword_volumes_task(self.voivodeship.pk)
+
+        self.assertEqual((posted['tasks'], again['tasks'], again['pending']), (2, 0, 3))
+        self.api.mark_ready(KeywordVolumeTask.objects.first().task_id)
+        summary = collect_keyword_volumes_task()
+
+        self.assertEqual((summary['pending'], summary['collected']), (2, 1))
+        self.assertEqual(KeywordVolumeTask.objects.filter(status=KeywordVolumeTask.STATUS_PENDING).count(), 1)
+        self.assertEqual(VoivodeshipKeyword.objects.filter(searches_updated_at__isnull=False).count(), 2)
+
+        # Nowy proces pollera — cały stan jest w bazie
+        self.api.mark_ready()
+        summary = collect_keyword_volumes_task()
+
+        self.assertEqual((summary['pending'], summary['collected']), (1, 1))
+        self.assertFalse(KeywordVolumeTask.objects.filter(status=KeywordVolumeTask.STATUS_PENDING).exists())
+        self.assertFalse(VoivodeshipKeyword.objects.filter(searches_updated_at__isnull=True).exists())
+        self.assertEqual(len(self.api.sent), 2)
+
+    def test_phrase_pending_for_other_voivodeship_is_written_to_both(self):
+        """Fraza czekająca w zadaniu innego województwa z tym samym location_code trafia do obu"""
+        other = Voivodeship.objects.create(name='Małopolskie ')
+        VoivodeshipKeyword.objects.create(voivodeship=other, phrase='Pizzeria Kraków')
+
+        fetch_keyword_volumes_task(self.voivodeship.pk)
+        posted = fetch_keyword_volumes_task(other.pk)
+        self.api.mark_ready()
+        summary = collect_keyword_volumes_task()
+
+        self.assertEqual((posted['pending'], posted['posted'], summary['updated']), (1, 0, 3))
+        self.assertEqual(
+            VoivodeshipKeyword.objects.get(voivodeship=other).monthly_searches, str(len('pizzeria kraków')),
+        )
+
+    def test_expired_task_is_fetched_by_id(self):
+        """Zadanie, które zniknęło z tasks_ready (worker padł po task_get), jest odbierane po ID"""
+        fetch_keyword_volumes_task(self.voivodeship.pk)
+        KeywordVolumeTask.objects.update(posted_at=timezone.now() - timedelta(days=2))
+
+        summary = collect_keyword_volumes_task()
+
+        self.assertEqual((summary['collected'], summary['failed']), (1, 0))
+        self.assertEqual(len(self.api.sent), 1)
+        self.assertEqual(
+            VoivodeshipKeyword.objects.get(phrase='pizzeria kraków').monthly_searches, str(len('pizzeria kraków')),
+        )
+
+    def test_task_get_error_fails_only_that_task(self):
+        """Błąd API przy task_get oznacza zadanie jako failed, pozostałe są odbierane"""
+        with patch('leads.services.dataforseo_volumes.CHUNK_SIZE', 2):
+            fetch_keyword_volumes_task(self.voivodeship.pk)
+        broken, ok = KeywordVolumeTask.objects.all()
+        self.api.broken.add(broken.task_id)
+        self.api.mark_ready()
+
+        summary = collect_keyword_volumes_task()
+
+        broken.refresh_from_db()
+        ok.refresh_from_db()
+        self.assertEqual((summary['failed'], summary['collected']), (1, 1))
+        self.assertEqual((broken.status, ok.status), (KeywordVolumeTask.STATUS_FAILED, KeywordVolumeTask.STATUS_DONE))
+        self.assertIn('Internal Error', broken.error)
+
+    def test_write_back_query_count_does_not_grow_with_phrases(self):
+        """Zapis 5000 fraz województwa to kilka zapytań, a nie jedno na frazę"""
+        VoivodeshipKeyword.objects.bulk_create([
+            VoivodeshipKeyword(voivodeship=self.voivodeship, phrase=f'fraza {i}') for i in range(5000)
+        ])
+        fetch_keyword_volumes_task(self.voivodeship.pk)
+        self.api.mark_ready()
+
+        with CaptureQueriesContext(connection) as queries:
+            summary = collect_keyword_volumes_task()
+
+        self.assertEqual((summary['collected'], summary['updated']), (6, 5002))
+        self.assertEqual(VoivodeshipKeyword.objects.filter(monthly_searches__isnull=True, searches_updated_at__isnull=False).count(), 1)
+        # Na Postgresie UPDATE po 1000 wierszy na paczkę; SQLite (limit parametrów) tnie paczki drobniej
+        updates = [q for q in queries.captured_queries if q['sql'].startswith('UPDATE "leads_voivodeshipkeyword"')]
+        self.assertLessEqual(len(updates), 40)
+        self.assertLess(len(queries), 200)
+
+
+class KeywordSuggestionVolumesTest(TestCase):
+
+    def setUp(self):
+        settings = AppSettings.get()
+        settings.dataforseo_login = 'login'
+        settings.dataforseo_password = 'haslo'
+        settings.openai_api_key = 'klucz'
+        settings.save()
+        self.lead = Lead.objects.create(city=City.objects.create(name="Kraków"), name="Pizzeria Roma")
+        self.batch = KeywordSuggestionBatch.objects.create(lead=self.lead)
+
+    def _generate(self, ai_phrases):
+        labs = {'status_code': 20000, 'tasks': [{'result': [{'items': [
+            {'keyword': 'pizzeria kraków', 'keyword_info': {'search_volume': 880}},
+            {'keyword': 'pizza nowa huta', 'keyword_info': {'search_volume': None}},
+        ]}]}]}
+        ai = MagicMock()
+        ai.json.return_value = {'choices': [{'message': {'content': json.dumps(ai_phrases)}}]}
+        with patch('leads.tasks_analysis.DataForSEOClient.post', return_value=labs) as dfs_post, \
+             patch('leads.tasks_analysis.requests.post', return_value=ai):
+            generate_keyword_suggestions(self.lead.pk, self.batch.pk)
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.status, 'ready', self.batch.error_message)
+        return dfs_post, dict(self.batch.suggestions.values_list('phrase', 'volume'))
+
+    def test_labs_volumes_stay_out_of_ads_cache(self):
+        """Wolumeny z keyword_suggestions (Labs) nie trafiają do cache search_volume"""
+        _, volumes = self._generate([{'fraza': 'pizzeria kraków', 'wyszukiwania': 1}])
+
+        self.assertEqual(volumes, {'pizzeria kraków': 880})
+        self.assertFalse(KeywordVolume.objects.exists())
+
+    def test_rewritten_phrase_uses_ads_cache_or_ai_value(self):
+        """Fraza zmieniona przez AI bierze wolumen z cache, a bez niego — wartość AI; bez płatnego zapytania"""
+        store_volumes({'pizza kraków centrum': 320, 'pizza roma kraków': None}, POLAND_LOCATION_CODE)
+
+        dfs_post, volumes = self._generate([
+            {'fraza': 'pizza kraków centrum', 'wyszukiwania': 10},
+            {'fraza': 'pizza roma kraków', 'wyszukiwania': 20},
+            {'fraza': 'pizza na wynos kraków', 'wyszukiwania': 30},
+        ])
+
+        self.assertEqual(dfs_post.call_count, 1)
+        self.assertEqual(volumes, {'pizza kraków centrum': 320, 'pizza roma kraków': 20, 'pizza na wynos kraków': 30})
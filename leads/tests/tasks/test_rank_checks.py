@@ -0,0 +1,311 @@
+from datetime import timedelta
+from unittest.mock import patch, MagicMock
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from ...models import (
+    City, Lead, LeadKeyword, KeywordRankCheck, AppSettings, SerpSnapshot, SerpCompetitorPosition, SerpTask,
+)
+from ...tasks_analysis import check_rankings_standard_queue, check_keyword_rankings, collect_rank_check_tasks
+
+
+def _response(data):
+    resp = MagicMock()
+    resp.json.return_value = data
+    resp.raise_for_status.return_value = None
+    return resp
+
+
+class StandardQueueRankCheckTest(TestCase):
+
+    def setUp(self):
+        settings = AppSettings.get()
+        settings.dataforseo_login = 'login'
+        settings.dataforseo_password = 'haslo'
+        settings.save()
+
+        self.city = City.objects.create(name="Kraków", latitude=50.06, longitude=19.94)
+        self.lead = Lead.objects.create(
+            city=self.city, name="Pizzeria Roma", status='client',
+            google_maps_url='https://maps.google.com/?cid=123456',
+        )
+        self.kw1 = LeadKeyword.objects.create(lead=self.lead, phrase="pizzeria kraków")
+        self.kw2 = LeadKeyword.objects.create(lead=self.lead, phrase="pizza kraków")
+        self.posted = {}
+        self.ready = None  # None = wszystkie wysłane zadania gotowe
+        self.broken = set()
+
+    def _fake_post(self, url, json=None, **kwargs):
+        """task_post — przyjmuje wszystkie zadania, id = 'task-<fraza>'."""
+        tasks = []
+        for t in json:
+            task_id = f"task-{t['keyword']}"
+            self.posted[task_id] = t
+            tasks.append({'id': task_id, 'status_code': 20100, 'data': t})
+        return _response({'tasks': tasks})
+
+    def _fake_get(self, url, **kwargs):
+        if url.endswith('tasks_ready'):
+            ready = self.posted if self.ready is None else self.ready
+            return _response({'tasks': [{'result': [{'id': task_id} for task_id in ready]}]})
+        task_id = url.rsplit('/', 1)[-1]
+        if task_id in self.broken:
+            return _response({'tasks': [{'status_code': 40400, 'status_message': 'Not Found.'}]})
+        items = [{'cid': 999, 'rank_absolute': 1, 'title': 'Inna pizzeria'}]
+        if self.posted[task_id]['keyword'] == self.kw1.phrase:
+            items.append({'cid': 123456, 'rank_absolute': 2, 'title': 'Pizzeria Roma'})
+        return _response({'tasks': [{'status_code': 20000, 'result': [{'items': items}]}]})
+
+    def _api(self):
+        return (
+            patch('leads.services.dataforseo_client.requests.Session.post', side_effect=self._fake_post),
+            patch('leads.services.dataforseo_client.requests.Session.get', side_effect=self._fake_get),
+        )
+
+    def _run(self):
+        """Wysłanie zadań i jeden przebieg pollera. Zwraca (podsumowanie wysyłki, podsumowanie odbioru, mock post)."""
+        post_patch, get_patch = self._api()
+        with post_patch as post, get_patch:
+            summary = check_rankings_standard_queue()
+            collected = collect_rank_check_tasks()
+        return summary, collected, post
+
+    def test_writes_positions_for_all_keywords(self):
+        """Kolejka standard zapisuje pozycje wszystkich fraz po odbiorze przez poller"""
+        summary, collected, post = self._run()
+
+        self.assertEqual(post.call_count, 1)  # obie frazy w jednym task_post
+        self.assertEqual((summary['tasks'], collected['collected'], collected['keywords']), (2, 2, 2))
+        self.assertEqual(self.kw1.rank_checks.get().position, 2)
+        self.assertIsNone(self.kw2.rank_checks.get().position)
+        self.assertFalse(SerpTask.objects.exclude(status=SerpTask.STATUS_DONE).exists())
+
+    def test_posts_all_engines_without_waiting_for_results(self):
+        """Zadania maps i organic idą od razu; task nie czeka na kolejkę ani nie zapisuje pozycji"""
+        nationwide = Lead.objects.create(city=self.city, name="Sklep", status='client', keyword_search_nationwide=True)
+        LeadKeyword.objects.create(lead=nationwide, phrase="pizza online")
+
+        post_patch, get_patch = self._api()
+        with post_patch as post, get_patch as get:
+            summary = check_rankings_standard_queue()
+
+        self.assertEqual(post.call_count, 2)
+        get.assert_not_called()
+        self.assertEqual(summary['tasks'], 3)
+        self.assertEqual(set(SerpTask.objects.values_list('engine', flat=True)), {'maps', 'organic'})
+        self.assertFalse(KeywordRankCheck.objects.exists())
+
+    def test_failed_serp_writes_no_rank_check(self):
+        """SERP z błędem task_get nie zapisuje pozycji None — fraza zostaje do sprawdzenia"""
+        self.broken.add('task-pizza kraków')
+
+        _, collected, _ = self._run()
+
+        self.assertEqual((collected['collected'], collected['failed']), (1, 1))
+        self.assertEqual(self.kw1.rank_checks.get().position, 2)
+        self.assertFalse(self.kw2.rank_checks.exists())
+        self.assertEqual(SerpTask.objects.get(task_id='task-pizza kraków').status, SerpTask.STATUS_FAILED)
+
+    def test_rerun_before_collection_joins_pending_tasks(self):
+        """Ponowne uruchomienie przed odbiorem nie wysyła SERP-ów drugi raz"""
+        post_patch, get_patch = self._api()
+        with post_patch as post, get_patch:
+            check_rankings_standard_queue()
+            again = check_rankings_standard_queue(force=True)
+            collect_rank_check_tasks()
+
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual((again['tasks'], again['queued']), (0, 2))
+        self.assertEqual(KeywordRankCheck.objects.count(), 2)
+
+    def test_expired_task_is_fetched_by_id(self):
+        """Zadanie, którego nie ma już w tasks_ready, jest pobierane po ID zamiast przepadać"""
+        post_patch, get_patch = self._api()
+        with post_patch, get_patch:
+            check_rankings_standard_queue()
+        SerpTask.objects.update(posted_at=timezone.now() - timedelta(days=2))
+        self.ready = set()
+
+        _, collected, post = self._run()
+
+        self.assertEqual(collected['collected'], 2)
+        self.assertEqual(self.kw1.rank_checks.get().position, 2)
+        post.assert_not_called()
+
+    def test_skips_keywords_checked_today(self):
+        """Frazy sprawdzone dzisiaj nie są wysyłane ponownie"""
+        KeywordRankCheck.objects.create(keyword=self.kw1, position=3)
+        KeywordRankCheck.objects.create(keyword=self.kw2, position=4)
+
+        with patch('leads.services.dataforseo_client.requests.Session.post') as post:
+            check_rankings_standard_queue()
+
+        post.assert_not_called()
+
+    def test_leads_with_same_phrase_share_one_serp(self):
+        """Dwa leady z tą samą frazą w tym samym mieście = jedno zadanie SERP"""
+        other = Lead.objects.create(city=self.city, name="Inna pizzeria", status='client')
+        other_kw = LeadKeyword.objects.create(lead=other, phrase="Pizzeria Kraków ")
+
+        summary, _, post = self._run()
+
+        self.assertEqual(summary['tasks'], 2)
+        self.assertEqual(SerpSnapshot.objects.count(), 2)
+        self.assertEqual(other_kw.rank_checks.get().position, 1)
+
+    def test_uses_serp_already_stored_today(self):
+        """SERP pobrany dzisiaj jest brany z magazynu bez zapytania do API"""
+        self._run()
+        KeywordRankCheck.objects.all().delete()
+
+        summary, _, post = self._run()
+
+        post.assert_not_called()
+        self.assertEqual(self.kw1.rank_checks.get().position, 2)
+
+
+class LiveRankCheckTest(TestCase):
+
+    def setUp(self):
+        settings = AppSettings.get()
+        settings.dataforseo_login = 'login'
+        settings.dataforseo_password = 'haslo'
+        settings.save()
+
+        self.city = City.objects.create(name="Kraków", latitude=50.06, longitude=19.94)
+        self.lead = Lead.objects.create(
+            city=self.city, name="Pizzeria Roma", status='client',
+            google_maps_url='https://maps.google.com/?cid=123456',
+        )
+        self.keywords = [
+            LeadKeyword.objects.create(lead=self.lead, phrase=f"pizza kraków {i}") for i in range(5)
+        ]
+
+    def _live_response(self, url, json=None, **kwargs):
+        rank = int(json[0]['keyword'].rsplit(' ', 1)[-1]) + 1
+        return _response({'tasks': [{'result': [{'items': [{'cid': 123456, 'rank_absolute': rank}]}]}]})
+
+    def test_concurrent_mode_saves_position_per_keyword(self):
+        """Tryb równoległy zapisuje poprawną pozycję dla każdej frazy"""
+        with patch('leads.services.dataforseo_client.requests.Session.post', side_effect=self._live_response) as post:
+            summary = check_keyword_rankings(self.lead.pk, concurrent=True)
+
+        self.assertEqual(post.call_count, 5)
+        self.assertEqual((summary['keywords'], summary['failed']), (5, 0))
+        for i, kw in enumerate(self.keywords):
+            self.assertEqual(kw.rank_checks.get().position, i + 1)
+
+    def test_retries_after_rate_limit(self):
+        """HTTP 429 jest ponawiany, a pozycja zapisana po udanej próbie"""
+        limited = MagicMock(status_code=429)
+        ok = self._live_response(None, json=[{'keyword': 'pizza kraków 0'}])
+        ok.status_code = 200
+
+        with patch('leads.services.dataforseo_client.requests.Session.post', side_effect=[limited, ok]), \
+             patch('leads.services.dataforseo_client.time.sleep'):
+            check_keyword_rankings(self.lead.pk, keyword_ids=[self.keywords[0].pk], concurrent=False)
+
+        self.assertEqual(self.keywords[0].rank_checks.get().position, 1)
+
+
+class RankCheckQueryCountTest(TestCase):
+
+    def setUp(self):
+        settings = AppSettings.get()
+        settings.dataforseo_login = 'login'
+        settings.dataforseo_password = 'haslo'
+        settings.save()
+        self.city = City.objects.create(name="Kraków", latitude=50.06, longitude=19.94)
+
+    def _lead_with_keywords(self, name, count):
+        lead = Lead.objects.create(city=self.city, name=name, status='client')
+        for i in range(count):
+            LeadKeyword.objects.create(lead=lead, phrase=f"{name} fraza {i}")
+        return lead
+
+    def _count_queries(self, lead):
+        response = _response({'tasks': [{'result': [{'items': [{'cid': 1, 'rank_absolute': 1}]}]}]})
+        response.status_code = 200
+        with patch('leads.services.dataforseo_client.requests.Session.post', return_value=response), \
+             CaptureQueriesContext(connection) as ctx:
+            check_keyword_rankings(lead.pk, concurrent=False)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_keywords(self):
+        """Liczba zapytań do bazy jest stała niezależnie od liczby fraz"""
+        small = self._lead_with_keywords("mala", 2)
+        large = self._lead_with_keywords("duza", 15)
+
+        small_queries = self._count_queries(small)
+        large_queries = self._count_queries(large)
+
+        self.assertEqual(small_queries, large_queries)
+        self.assertEqual(KeywordRankCheck.objects.count(), 17)
+
+
+class CompetitorIndexTest(TestCase):
+
+    def setUp(self):
+        settings = AppSettings.get()
+        settings.dataforseo_login = 'login'
+        settings.dataforseo_password = 'haslo'
+        settings.save()
+
+        self.city = City.objects.create(name="Kraków", latitude=50.06, longitude=19.94)
+        self.lead = Lead.objects.create(
+            city=self.city, name="Pizzeria Roma", status='client',
+            google_maps_url='https://maps.google.com/?cid=123456',
+        )
+        self.kw = LeadKeyword.objects.create(lead=self.lead, phrase="pizzeria kraków")
+
+    def _check(self, items):
+        response = _response({'tasks': [{'result': [{'items': items}]}]})
+        response.status_code = 200
+        with patch('leads.services.dataforseo_client.requests.Session.post', return_value=response):
+            check_keyword_rankings(self.lead.pk, force=True, concurrent=False)
+
+    def test_stores_every_serp_item(self):
+        """Każda pozycja z SERP-a trafia do indeksu konkurencji z oceną i liczbą opinii"""
+        self._check([
+            {'cid': '999', 'rank_absolute': 1, 'title': 'Inna pizzeria', 'domain': 'inna.pl',
+             'rating': {'value': 4.7, 'votes_count': 320}},
+            {'cid': '123456', 'rank_absolute': 2, 'title': 'Pizzeria Roma'},
+        ])
+
+        positions = list(SerpCompetitorPosition.objects.order_by('rank'))
+        self.assertEqual([p.rank for p in positions], [1, 2])
+        self.assertEqual(positions[0].cid, '999')
+        self.assertEqual(positions[0].rating, 4.7)
+        self.assertEqual(positions[0].reviews_count, 320)
+        self.assertEqual(positions[0].phrase, 'pizzeria kraków')
+
+    def test_competitors_above_with_movement(self):
+        """Konkurencja nad klientem i zmiana pozycji liczone z lokalnego indeksu"""
+        from ...services.serp_competitors import competitors_above, competitor_history
+        from ...services.dataforseo_serp import store_items, serp_key, build_rank_payload
+        from django.utils import timezone
+        from datetime import timedelta
+
+        today = timezone.localdate()
+        key = serp_key(*build_rank_payload(self.lead, self.kw.phrase))
+        store_items([(key, [
+            {'cid': '123456', 'rank_absolute': 1, 'title': 'Pizzeria Roma'},
+            {'cid': '999', 'rank_absolute': 3, 'title': 'Inna pizzeria'},
+        ])], today - timedelta(days=7))
+        store_items([(key, [
+            {'cid': '999', 'rank_absolute': 1, 'title': 'Inna pizzeria'},
+            {'cid': '777', 'rank_absolute': 2, 'title': 'Nowa pizzeria'},
+            {'cid': '123456', 'rank_absolute': 3, 'title': 'Pizzeria Roma'},
+        ])], today)
+
+        with patch('leads.services.dataforseo_client.requests.Session.post') as post:
+            result = competitors_above(self.kw)
+        post.assert_not_called()
+
+        self.assertEqual(result['client_rank'], 3)
+        self.assertEqual(result['compared_to'], today - timedelta(days=7))
+        self.assertEqual([c['cid'] for c in result['competitors']], ['999', '777'])
+        self.assertEqual(result['competitors'][0]['change'], 2)
+        self.assertIsNone(result['competitors'][1]['previous_rank'])
+        self.assertEqual(competitor_history(self.kw, '999'), [(today - timedelta(days=7), 3), (today, 1)])
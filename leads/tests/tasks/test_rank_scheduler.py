@@ -0,0 +1,72 @@
+from datetime import timedelta
+from django.test import TestCase
+from django.utils import timezone
+from ...models import City, Lead, LeadKeyword, KeywordRankCheck
+from ...services.rank_scheduler import check_interval, plan_rank_checks
+
+
+class CheckIntervalTest(TestCase):
+
+    def test_no_history_is_due_immediately(self):
+        """Fraza bez historii jest sprawdzana od razu"""
+        self.assertEqual(check_interval([]), 0)
+
+    def test_stable_top_position_gets_long_interval(self):
+        """Fraza stabilnie na 1. miejscu jest sprawdzana rzadko"""
+        self.assertEqual(check_interval([1, 1, 1, 1]), 7)
+
+    def test_stable_not_ranked_gets_longest_interval(self):
+        """Fraza od miesięcy poza top 20 jest sprawdzana najrzadziej"""
+        self.assertEqual(check_interval([None, None, None]), 14)
+
+    def test_volatile_keyword_checked_daily(self):
+        """Fraza skacząca po pozycjach jest sprawdzana codziennie"""
+        self.assertEqual(check_interval([4, 9, 2, 12]), 1)
+
+
+class PlanRankChecksTest(TestCase):
+
+    def setUp(self):
+        self.city = City.objects.create(name="Kraków", latitude=50.06, longitude=19.94)
+        self.lead = Lead.objects.create(city=self.city, name="Pizzeria Roma", status='client')
+        self.today = timezone.localdate()
+
+    def _keyword(self, phrase, positions, last_checked_days_ago):
+        """Fraza z historią sprawdzeń co dzień, od najnowszego."""
+        kw = LeadKeyword.objects.create(lead=self.lead, phrase=phrase)
+        for i, position in enumerate(positions):
+            check = KeywordRankCheck.objects.create(keyword=kw, position=position)
+            checked_at = timezone.now() - timedelta(days=last_checked_days_ago + i)
+            KeywordRankCheck.objects.filter(pk=check.pk).update(checked_at=checked_at)
+        return kw
+
+    def test_skips_stable_keywords_and_reports_savings(self):
+        """Stabilne frazy czekają na swój termin, zmienne i nowe są sprawdzane"""
+        stable = self._keyword("pizza stabilna", [1, 1, 1], last_checked_days_ago=3)
+        volatile = self._keyword("pizza zmienna", [5, 12, 3], last_checked_days_ago=1)
+        new = LeadKeyword.objects.create(lead=self.lead, phrase="pizza nowa")
+
+        plan = plan_rank_checks(budget=10)
+
+        self.assertCountEqual(plan['keyword_ids'], [volatile.pk, new.pk])
+        self.assertNotIn(stable.pk, plan['keyword_ids'])
+        self.assertEqual(plan['calls'], 2)
+        self.assertEqual(plan['fixed_schedule_calls'], round(3 * 2 / 7, 1))
+
+    def test_budget_prefers_most_likely_to_move(self):
+        """Przy wyczerpanym budżecie wygrywa fraza bez historii, potem najbardziej zmienna"""
+        self._keyword("pizza spokojna", [8, 8, 9], last_checked_days_ago=5)
+        volatile = self._keyword("pizza zmienna", [5, 12, 3], last_checked_days_ago=1)
+
+        plan = plan_rank_checks(budget=1)
+
+        self.assertEqual(plan['keyword_ids'], [volatile.pk])
+        self.assertEqual(plan['deferred'], 1)
+
+    def test_keywords_checked_today_are_skipped(self):
+        """Frazy sprawdzone dzisiaj nie wracają do planu"""
+        self._keyword("pizza zmienna", [5, 12, 3], last_checked_days_ago=0)
+
+        plan = plan_rank_checks(budget=10)
+
+        self.assertEqual(plan['keyword_ids'], [])
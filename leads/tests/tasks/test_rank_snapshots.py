@@ -0,0 +1,61 @@
+from datetime import timedelta
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from ...models import City, Lead, LeadKeyword, KeywordRankCheck, ClientRankSnapshot
+from ...tasks_analysis import monthly_snapshot_all_clients, take_client_rank_snapshot
+
+
+class MonthlySnapshotTest(TestCase):
+
+    def setUp(self):
+        self.city = City.objects.create(name="Kraków")
+
+    def _client(self, name, keyword_positions):
+        """Klient z frazami; dla każdej frazy lista pozycji od najstarszej."""
+        lead = Lead.objects.create(city=self.city, name=name, status='client')
+        for i, positions in enumerate(keyword_positions):
+            kw = LeadKeyword.objects.create(lead=lead, phrase=f"{name} fraza {i}")
+            for days_ago, position in zip(range(len(positions), 0, -1), positions):
+                check = KeywordRankCheck.objects.create(keyword=kw, position=position)
+                KeywordRankCheck.objects.filter(pk=check.pk).update(
+                    checked_at=timezone.now() - timedelta(days=days_ago),
+                )
+        return lead
+
+    def test_snapshot_uses_latest_position_per_keyword(self):
+        """Snapshot zapisuje ostatnią znaną pozycję każdej frazy"""
+        lead = self._client("roma", [[9, 4], [None, 7, None], []])
+
+        take_client_rank_snapshot(lead.pk, triggered_by='manual')
+
+        snapshot = lead.rank_snapshots.get()
+        self.assertEqual([p['position'] for p in snapshot.positions], [4, None, None])
+        self.assertIsNone(snapshot.positions[2]['checked_at'])
+        self.assertEqual(snapshot.triggered_by, 'manual')
+
+    def test_existing_snapshot_is_overwritten(self):
+        """Ponowny snapshot w tym samym miesiącu nadpisuje poprzedni"""
+        lead = self._client("roma", [[5]])
+        take_client_rank_snapshot(lead.pk)
+        KeywordRankCheck.objects.create(keyword=lead.keywords_list.get(), position=2)
+
+        take_client_rank_snapshot(lead.pk)
+
+        self.assertEqual(lead.rank_snapshots.get().positions[0]['position'], 2)
+
+    def test_query_count_does_not_grow_with_clients(self):
+        """Liczba zapytań snapshotu miesięcznego nie zależy od liczby klientów"""
+        self._client("a", [[1], [2]])
+        with CaptureQueriesContext(connection) as few:
+            monthly_snapshot_all_clients()
+
+        for i in range(10):
+            self._client(f"klient{i}", [[3, 4], [5]])
+        with CaptureQueriesContext(connection) as many:
+            saved = monthly_snapshot_all_clients()
+
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+        self.assertEqual(saved, 11)
+        self.assertEqual(ClientRankSnapshot.objects.count(), 11)
@@ -0,0 +1,94 @@
+import threading
+import time
+from unittest.mock import patch
+from django.test import TestCase, override_settings
+from ...services.rate_limit import SharedRateLimiter, concurrency_slot
+
+SHARED_LOCMEM = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'rate-limit-test'},
+}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@override_settings(CACHES=SHARED_LOCMEM)
+class SharedRateLimiterTest(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        clock_patch = patch('leads.services.rate_limit.time', self.clock)
+        clock_patch.start()
+        self.addCleanup(clock_patch.stop)
+
+    def test_processes_share_one_quota(self):
+        """Dwa procesy (dwa limitery) dzielą jedną pulę — 120/min to 2 zapytania na sekundę łącznie"""
+        worker, web = SharedRateLimiter('gbp', 120), SharedRateLimiter('gbp', 120)
+
+        worker.acquire()
+        web.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+
+        worker.acquire()
+        self.assertEqual(self.clock.sleeps, [1.0])
+
+    def test_falls_back_to_local_bucket_without_cache(self):
+        """Gdy cache jest niedostępny, obowiązuje lokalny limit procesu"""
+        limiter = SharedRateLimiter('gbp', 60)
+        with patch('leads.services.rate_limit.caches') as caches:
+            caches.__getitem__.side_effect = ConnectionError('redis down')
+            limiter.acquire()
+            limiter.acquire()
+
+        self.assertEqual(self.clock.sleeps, [1.0])
+
+    def test_degraded_limiter_skips_cache_until_cooldown(self):
+        """Po błędzie cache kolejne zapytania nie czekają na Redisa aż do końca przerwy"""
+        from ...services.rate_limit import DEGRADED_RETRY_AFTER
+        limiter = SharedRateLimiter('gbp', 600)
+        with patch('leads.services.rate_limit.caches') as caches:
+            caches.__getitem__.side_effect = ConnectionError('redis down')
+            limiter.acquire()
+            limiter.acquire()
+            self.assertEqual(caches.__getitem__.call_count, 1)
+
+            self.clock.now += DEGRADED_RETRY_AFTER
+            limiter.acquire()
+            self.assertEqual(caches.__getitem__.call_count, 2)
+
+
+@override_settings(CACHES=SHARED_LOCMEM)
+class ConcurrencySlotTest(TestCase):
+
+    def test_slots_cap_concurrency_across_workers(self):
+        """Przy limicie 1 drugi worker czeka, aż pierwszy zwolni miejsce"""
+        order = []
+
+        def worker(name, hold):
+            with concurrency_slot('gbp', 1, ttl=60):
+                order.append(f'{name} start')
+                time.sleep(hold)
+                order.append(f'{name} koniec')
+
+        with patch('leads.services.rate_limit.SLOT_POLL_INTERVAL', 0.01):
+            first = threading.Thread(target=worker, args=('a', 0.2))
+            first.start()
+            time.sleep(0.05)
+            worker('b', 0)
+            first.join()
+
+        self.assertEqual(order, ['a start', 'a koniec', 'b start', 'b koniec'])
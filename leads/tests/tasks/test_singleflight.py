@@ -0,0 +1,84 @@
+import threading
+import time
+from unittest.mock import patch
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from ...services.singleflight import single_flight, suppressed_count, request_key
+
+SHARED_LOCMEM = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'singleflight-test'},
+}
+
+
+@override_settings(CACHES=SHARED_LOCMEM)
+class SingleFlightTest(TestCase):
+
+    def setUp(self):
+        caches['shared'].clear()
+
+    def test_key_ignores_payload_key_order(self):
+        """Ten sam payload z inną kolejnością kluczy ma ten sam klucz"""
+        self.assertEqual(
+            request_key('serp', {'keyword': 'pizza', 'depth': 20}),
+            request_key('serp', {'depth': 20, 'keyword': 'pizza'}),
+        )
+
+    def test_concurrent_callers_share_one_request(self):
+        """Równoczesne identyczne zapytania wykonują się raz, reszta dostaje ten sam wynik"""
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.3)
+            return {'items': [1, 2, 3]}
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(single_flight('serp', {'keyword': 'pizza'}, fetch)))
+            for _ in range(4)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'items': [1, 2, 3]}] * 4)
+        self.assertEqual(suppressed_count('serp'), 3)
+
+    def test_falls_back_without_cache(self):
+        """Gdy cache jest niedostępny, zapytanie idzie bez koalescencji"""
+        with patch('leads.services.singleflight.caches') as caches:
+            caches.__getitem__.side_effect = ConnectionError('redis down')
+            self.assertEqual(single_flight('serp', {'keyword': 'pizza'}, lambda: 'ok'), 'ok')
+
+    def test_waiter_reads_result_before_taking_over(self):
+        """Po timeoucie oczekiwania gotowy wynik lidera jest użyty zamiast drugiego płatnego zapytania"""
+        key = request_key('serp', {'keyword': 'pizza'})
+        caches['shared'].set(f'{key}:lock', 'inny-lider', 60)
+        caches['shared'].set(f'{key}:result', {'items': [1]}, 60)
+        calls = []
+
+        with patch('leads.services.singleflight.WAIT_TIMEOUT', 0):
+            result = single_flight('serp', {'keyword': 'pizza'}, lambda: calls.append(1))
+
+        self.assertEqual((result, calls), ({'items': [1]}, []))
+
+    def test_result_write_error_does_not_lose_result(self):
+        """Błąd zapisu wyniku do cache tylko loguje — lider zwraca opłacony wynik"""
+        with patch.object(caches['shared'], 'set', side_effect=ConnectionError('redis down')):
+            result = single_flight('serp', {'keyword': 'pizza'}, lambda: {'items': [1]})
+
+        self.assertEqual(result, {'items': [1]})
+
+    def test_cache_errors_around_request_do_not_raise(self):
+        """Błąd cache po założeniu blokady (usuwanie wyniku, licznik, odczyt blokady) nie przerywa zapytania"""
+        with patch.object(caches['shared'], 'delete', side_effect=ConnectionError('redis down')):
+            self.assertEqual(single_flight('serp', {'keyword': 'pizza'}, lambda: {'items': [1]}), {'items': [1]})
+
+        key = request_key('serp', {'keyword': 'kebab'})
+        caches['shared'].set(f'{key}:lock', 'inny-lider', 60)
+        caches['shared'].set(f'{key}:result', {'items': [2]}, 60)
+        with patch.object(caches['shared'], 'incr', side_effect=ConnectionError('redis down')):
+            self.assertEqual(single_flight('serp', {'keyword': 'kebab'}, lambda: None), {'items': [2]})
@@ -0,0 +1,105 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth.models import User
+from datetime import date
+from ...models import City, Lead, GBPMetricsSnapshot
+from ...services.gbp_metrics_query import metrics_for_range
+from ...services.gbp_series import write_days
+
+
+class ReportMetricsQueryTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        city = City.objects.create(name="Kraków")
+        self.lead = Lead.objects.create(city=city, name="Pizzeria Roma", status='client')
+
+    def _row(self, year, month, day=None, source=GBPMetricsSnapshot.SOURCE_API, **metrics):
+        if day is not None:
+            # Dni z API trafiają też do spakowanych miesięcy, jak w ingest_daily_metrics
+            write_days(self.lead.pk, {date(year, month, day): metrics})
+        return GBPMetricsSnapshot.objects.create(lead=self.lead, year=year, month=month, day=day, source=source, **metrics)
+
+    def test_prefers_rollup_then_manual_then_daily(self):
+        """Miesiąc z rollupem bierze rollup, bez rollupu — wpis ręczny, bez obu — sumę dni"""
+        self._row(2026, 1, calls=10, conversations=None)
+        self._row(2026, 1, day=5, calls=3, conversations=2)
+        self._row(2026, 2, source=GBPMetricsSnapshot.SOURCE_MANUAL, calls=7)
+        self._row(2026, 3, day=1, calls=1)
+        self._row(2026, 3, day=2, calls=2)
+
+        data = metrics_for_range(self.lead.pk, date(2026, 1, 1), date(2026, 3, 31))
+
+        self.assertEqual([(m['month'], m['source'], m['calls']) for m in data['months']],
+                         [(1, 'api', 10), (2, 'manual', 7), (3, 'daily', 3)])
+        # Brakujące conversations w rollupie uzupełnione sumą dni
+        self.assertEqual(data['conversations'], 2)
+        self.assertEqual(data['calls'], 20)
+        self.assertEqual(data['total_interactions'], 22)
+
+    def test_partial_month_uses_days_in_range(self):
+        """Zakres obejmujący część miesiąca liczy tylko dni z zakresu"""
+        self._row(2026, 3, calls=100)
+        for day in (1, 10, 20):
+            self._row(2026, 3, day=day, calls=day)
+
+        data = metrics_for_range(self.lead.pk, date(2026, 3, 5), date(2026, 3, 31))
+
+        self.assertEqual(data['calls'], 30)
+        self.assertEqual(data['months'][0]['source'], 'daily')
+        self.assertIsNone(metrics_for_range(self.lead.pk, date(2025, 1, 1), date(2025, 12, 31)))
+
+    def test_result_is_cached_until_new_data(self):
+        """Drugi odczyt to tylko zapytanie o wersję; nowy dzień unieważnia cache"""
+        self._row(2026, 3, day=1, calls=1)
+        metrics_for_range(self.lead.pk, date(2026, 3, 1), date(2026, 3, 31))
+
+        with CaptureQueriesContext(connection) as ctx:
+            metrics_for_range(self.lead.pk, date(2026, 3, 1), date(2026, 3, 31))
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        self._row(2026, 3, day=2, calls=5)
+        self.assertEqual(metrics_for_range(self.lead.pk, date(2026, 3, 1), date(2026, 3, 31))['calls'], 6)
+
+    def test_report_preview_shows_metrics(self):
+        """Podgląd raportu pokazuje sumy z warstwy zapytań"""
+        self._row(2026, 3, calls=12, profile_views=345, website_visits=0, direction_requests=0)
+        client = Client()
+        User.objects.create_user(username="testuser", password="testpass")
+        client.login(username="testuser", password="testpass")
+
+        response = client.get(
+            reverse('leads:activity_report_preview', args=[self.lead.pk]),
+            {'report_from': '2026-03-01', 'report_to': '2026-03-31'},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['metrics_data']['calls'], 12)
+        self.assertContains(response, '345')
+
+
+class GBPMetricsIndexViewTest(TestCase):
+
+    def test_recent_days_are_summed_from_packed_months(self):
+        """Sumy z ostatnich dni na stronie metryk pochodzą ze spakowanych miesięcy"""
+        from datetime import timedelta
+        from django.utils import timezone
+        city = City.objects.create(name="Kraków")
+        lead = Lead.objects.create(city=city, name="Pizzeria Roma", status='client')
+        today = timezone.now().date()
+        write_days(lead.pk, {
+            today - timedelta(days=6): {'calls': 2, 'website_visits': 1},
+            today - timedelta(days=7): {'calls': 3},
+            today - timedelta(days=60): {'calls': 100},
+        })
+        client = Client()
+        User.objects.create_user(username="testuser", password="testpass")
+        client.login(username="testuser", password="testpass")
+
+        response = client.get(reverse('leads:gbp_metrics_index', args=[lead.pk]))
+
+        totals = response.context['daily_totals']
+        self.assertEqual((totals['count'], totals['calls'], totals['total_interactions']), (2, 5, 6))
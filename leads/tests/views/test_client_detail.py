@@ -0,0 +1,94 @@
+import json
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth.models import User
+from ...models import City, GeoGridScan, Lead, LeadKeyword, KeywordRankCheck
+from ...services.rank_analytics import CHART_POINTS, compute_lead_charts
+
+
+class ClientDetailChartsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        User.objects.create_user(username="testuser", password="testpass")
+        self.client.login(username="testuser", password="testpass")
+        city = City.objects.create(name="Kraków")
+        self.lead = Lead.objects.create(city=city, name="Pizzeria Roma", status='client')
+        self.url = reverse('leads:client_detail', args=[self.lead.pk])
+
+    def _keyword(self, phrase, positions):
+        kw = LeadKeyword.objects.create(lead=self.lead, phrase=phrase)
+        KeywordRankCheck.objects.bulk_create([KeywordRankCheck(keyword=kw, position=p) for p in positions])
+        return kw
+
+    def _queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.url)
+        return len(ctx.captured_queries)
+
+    def test_trend_and_visibility(self):
+        """Trend porównuje dwie ostatnie znane pozycje, widoczność liczona z ostatniej"""
+        self._keyword("pizza kraków", [8, None, 5, 1])
+
+        charts = json.loads(self.client.get(self.url).context['charts_json'])
+
+        self.assertEqual(charts[0]['data'], [8, None, 5, 1])
+        self.assertEqual(charts[0]['trend'], 4)
+        self.assertEqual(charts[0]['visibility'], 100.0)
+
+    def test_long_series_is_downsampled(self):
+        """Długa historia jest uśredniana do stałej liczby punktów wykresu"""
+        self._keyword("pizza kraków", [(i % 10) + 1 for i in range(500)])
+
+        chart = compute_lead_charts(self.lead.pk)[0]
+
+        self.assertEqual(len(chart['data']), CHART_POINTS)
+        self.assertEqual(len(chart['labels']), CHART_POINTS)
+        self.assertEqual(chart['checks'], 500)
+
+    def test_query_count_does_not_grow_with_keywords(self):
+        """Liczba zapytań strony klienta nie rośnie z liczbą fraz"""
+        self._keyword("fraza 0", [3, 4])
+        self.client.get(self.url)  # pierwsze wejście zakłada sesję i ustawienia
+        few = self._queries()
+        for i in range(1, 10):
+            self._keyword(f"fraza {i}", [3, 4, 5])
+
+        self.assertEqual(self._queries(), few)
+
+    def test_cache_refreshes_after_new_check(self):
+        """Nowe sprawdzenie pozycji unieważnia dane wykresów w cache"""
+        kw = self._keyword("pizza kraków", [5, 4])
+        self.client.get(self.url)
+        KeywordRankCheck.objects.create(keyword=kw, position=2)
+
+        charts = json.loads(self.client.get(self.url).context['charts_json'])
+
+        self.assertEqual(charts[0]['data'], [5, 4, 2])
+
+
+class KeywordGridScanViewTest(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        User.objects.create_user(username="testuser", password="testpass")
+        self.client.login(username="testuser", password="testpass")
+        city = City.objects.create(name="Kraków", latitude=50.06, longitude=19.94)
+        lead = Lead.objects.create(city=city, name="Pizzeria Roma", status='client')
+        keyword = LeadKeyword.objects.create(lead=lead, phrase="pizzeria kraków")
+        self.url = reverse('leads:keyword_grid_scan', args=[lead.pk, keyword.pk])
+
+    def test_invalid_spacing_is_rejected(self):
+        """Zerowy, ujemny, nieliczbowy albo nieskończony odstęp siatki to 400, nie 500"""
+        for spacing in ('0', '-1', 'abc', 'nan', 'inf', '50'):
+            with self.subTest(spacing=spacing):
+                response = self.client.post(self.url, {'size': 3, 'spacing_km': spacing})
+
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+        self.assertFalse(GeoGridScan.objects.exists())
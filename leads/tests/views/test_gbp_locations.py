@@ -0,0 +1,76 @@
+from html.parser import HTMLParser
+from unittest.mock import patch
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.contrib.auth.models import User
+from ...models import AppSettings, City, Lead, GBPLocation
+
+
+class _SelectedOptions(HTMLParser):
+    """{nazwa selecta: wartość zaznaczonej opcji} z HTML strony."""
+
+    def __init__(self):
+        super().__init__()
+        self.selected = {}
+        self.select = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'select':
+            self.select = attrs.get('name')
+        elif tag == 'option' and self.select and 'selected' in attrs:
+            self.selected[self.select] = attrs.get('value')
+
+
+def _selected(response):
+    parser = _SelectedOptions()
+    parser.feed(response.content.decode())
+    return parser.selected
+
+
+class GBPLocationsViewTest(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        User.objects.create_user(username="testuser", password="testpass")
+        self.client.login(username="testuser", password="testpass")
+        settings = AppSettings.get()
+        settings.google_refresh_token = 'refresh'
+        settings.save()
+        city = City.objects.create(name="Kraków")
+        self.lead = Lead.objects.create(city=city, name="Pizzeria Roma", status='client', gbp_location_name='locations/10')
+        GBPLocation.objects.create(location_id='10', account_name='accounts/1', title='Pizzeria Roma')
+        self.url = reverse('leads:gbp_locations')
+
+    def test_list_comes_from_registry(self):
+        """Strona przypisań czyta wizytówki z rejestru, bez zapytań do Google"""
+        with patch('requests.get') as get, patch('requests.post') as post:
+            response = self.client.get(self.url)
+
+        get.assert_not_called()
+        post.assert_not_called()
+        self.assertEqual(_selected(response), {f'lead_{self.lead.pk}': 'accounts/1/locations/10'})
+
+    def test_assignment_outside_registry_survives_save(self):
+        """Przypisanie spoza rejestru (np. pusty rejestr) jest zaznaczone i zapis go nie kasuje"""
+        GBPLocation.objects.all().delete()
+        other = Lead.objects.create(city=self.lead.city, name="Kebab", status='client')
+
+        response = self.client.get(self.url)
+        selected = _selected(response)
+        self.assertEqual(selected, {f'lead_{self.lead.pk}': 'locations/10'})
+
+        self.client.post(self.url, {f'lead_{self.lead.pk}': 'locations/10', f'lead_{other.pk}': 'locations/20'})
+
+        self.lead.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.lead.gbp_location_name, other.gbp_location_name), ('locations/10', 'locations/20'))
+
+    def test_refresh_button_updates_registry(self):
+        """Przycisk odświeżenia przebudowuje rejestr"""
+        with patch('leads.views.gbp.get_access_token', return_value='token'), \
+             patch('leads.views.gbp.refresh_registry') as refresh:
+            response = self.client.post(self.url, {'action': 'refresh'})
+
+        self.assertRedirects(response, self.url)
+        refresh.assert_called_once_with('token')
@@ -0,0 +1,42 @@
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth.models import User
+from ...models import Voivodeship, VoivodeshipKeyword
+
+
+class VoivodeshipKeywordDetailTest(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        User.objects.create_user(username="testuser", password="testpass")
+        self.client.login(username="testuser", password="testpass")
+        self.voivodeship = Voivodeship.objects.create(name='małopolskie')
+        other = Voivodeship.objects.create(name='śląskie')
+        VoivodeshipKeyword.objects.bulk_create(
+            [VoivodeshipKeyword(voivodeship=self.voivodeship, phrase=f'fraza {i}', monthly_searches='10') for i in range(300)]
+            + [VoivodeshipKeyword(voivodeship=other, phrase='obca fraza', monthly_searches='5')]
+        )
+        self.keywords = list(self.voivodeship.keywords.order_by('pk'))
+        self.url = reverse('leads:voivodeship_keyword_detail', args=[self.voivodeship.pk])
+
+    def test_edit_grid_saves_changes_in_bulk(self):
+        """Siatka edycji zapisuje zmienione wartości zbiorczo — liczba zapytań nie zależy od liczby pól"""
+        data = {f'searches_{kw.pk}': '10' for kw in self.keywords}
+        data.update({f'searches_{kw.pk}': '20' for kw in self.keywords[:250]})
+        data[f'searches_{self.keywords[-1].pk}'] = ''
+        foreign = VoivodeshipKeyword.objects.get(phrase='obca fraza')
+        data[f'searches_{foreign.pk}'] = '99'
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, data)
+
+        self.assertRedirects(response, self.url, fetch_redirect_response=False)
+        self.assertLess(len(queries), 10)
+        self.assertEqual(self.voivodeship.keywords.filter(monthly_searches='20', searches_updated_at__isnull=False).count(), 250)
+        cleared = VoivodeshipKeyword.objects.get(pk=self.keywords[-1].pk)
+        self.assertEqual((cleared.monthly_searches, cleared.searches_updated_at), (None, None))
+        # Fraza innego województwa nie jest ruszana
+        foreign.refresh_from_db()
+        self.assertEqual(foreign.monthly_searches, '5')
@@ -60,6 +60,8 @@ urlpatterns = [
     path('klienci/<int:pk>/', views.client.client_detail, name='client_detail'),
     path('klienci/<int:pk>/snapshot/', views.client.client_snapshot_trigger, name='client_snapshot_trigger'),
     path('klienci/<int:pk>/check-rankings/', views.client.client_check_rankings, name='client_check_rankings'),
+    path('klienci/<int:pk>/frazy/<int:keyword_pk>/konkurencja/', views.client.keyword_competitors, name='keyword_competitors'),
+    path('klienci/<int:pk>/frazy/<int:keyword_pk>/grid/', views.client.keyword_grid_scan, name='keyword_grid_scan'),
 
     # Reczna edycja pozycji frazy (dla wszystkich leadow)
     path('leads/<int:pk>/rank-manual/', views.client.keyword_rank_manual, name='keyword_rank_manual'),
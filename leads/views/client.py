@@ -9,13 +9,26 @@ from ..tasks_analysis import take_client_rank_snapshot, check_keyword_rankings
 
 @login_required
 def client_index(request):
+    from django.db.models import F
+    from ..services.gbp_health import flag_label
     now = timezone.now()
+
+    # Sortowanie: po nazwie albo po kondycji GBP (GBPHealth liczone w nocy dla wszystkich)
+    sort = request.GET.get('sort', 'name')
+    orderings = {
+        'name': ['name'],
+        'health': [F('gbp_health__score').desc(nulls_last=True), 'name'],
+        'wow': [F('gbp_health__wow_change').asc(nulls_last=True), 'name'],
+        'mom': [F('gbp_health__mom_change').asc(nulls_last=True), 'name'],
+    }
+    if sort not in orderings:
+        sort = 'name'
     clients = (
         Lead.objects
         .filter(status='client')
-        .select_related('city')
+        .select_related('city', 'gbp_health')
         .prefetch_related('keywords_list')
-        .order_by('name')
+        .order_by(*orderings[sort])
     )
 
     # Działania w tym miesiącu — jedna query dla wszystkich klientów
@@ -69,8 +82,11 @@ def client_index(request):
 
     data = []
     for client in clients:
+        health = getattr(client, 'gbp_health', None)
         data.append({
             'lead': client,
+            'gbp_health': health,
+            'gbp_flags': [flag_label(flag) for flag in health.flags] if health else [],
             'keywords_count': client.keywords_list.count(),
             'activities_this_month': activity_counts.get(client.pk, 0),
             'activities_30d': activity_counts_30d.get(client.pk, 0),
@@ -87,6 +103,7 @@ def client_index(request):
 
     return render(request, 'leads/client/index.html', {
         'data': data,
+        'sort': sort,
         'total_duration_month': format_duration(total_duration_month),
         'total_duration_30d': format_duration(total_duration_30d),
         'total_activities_month': total_activities_month,
@@ -97,33 +114,12 @@ def client_index(request):
 @login_required
 def client_detail(request, pk):
     lead = get_object_or_404(Lead, pk=pk, status='client')
-    from ..models import KeywordRankCheck, ClientRankSnapshot
+    from ..services.rank_analytics import lead_charts
     from django.utils import timezone
     import json
 
-    # --- Dane do wykresow: wszystkie rank_checks per fraza ---
-    charts = []
-    for kw in lead.keywords_list.prefetch_related('rank_checks').all():
-        checks = list(
-            kw.rank_checks
-            .order_by('checked_at')
-            .values('position', 'checked_at')
-        )
-        if not checks:
-            continue
-
-        # Snapshoty miesięczne jako pionowe linie na wykresie
-        snapshot_labels = {
-            f"{s.year}-{s.month:02d}": s.label
-            for s in lead.rank_snapshots.all()
-        }
-
-        charts.append({
-            'phrase': kw.phrase,
-            'labels': [timezone.localtime(c['checked_at']).strftime('%d.%m.%Y') for c in checks],
-            'data': [c['position'] for c in checks],
-            'trend': _calc_trend(checks),
-        })
+    # --- Dane do wykresow: historia pozycji wszystkich fraz (jedno zapytanie, cache do nowego sprawdzenia) ---
+    charts = lead_charts(lead.pk)
 
     # Boksy z podsumowaniem aktywności
     from django.db.models import Sum
@@ -170,14 +166,6 @@ def client_detail(request, pk):
     })
 
 
-def _calc_trend(checks):
-    """Porownuje ostatnia vs przedostatnia znana pozycje."""
-    known = [c for c in checks if c['position'] is not None]
-    if len(known) < 2:
-        return None
-    return known[-2]['position'] - known[-1]['position']  # dodatni = lepiej
-
-
 @login_required
 def client_snapshot_trigger(request, pk):
     """Reczne wywolanie snapshotu dla klienta."""
@@ -224,3 +212,71 @@ def keyword_rank_manual(request, pk):
         )
 
     return redirect('leads:lead_detail', pk=pk)
+
+
+@login_required
+def keyword_competitors(request, pk, keyword_pk):
+    """JSON: konkurencja nad klientem dla frazy — z indeksu zapisanych SERP-ów, bez API."""
+    from ..models import LeadKeyword
+    from ..services.serp_competitors import competitors_above
+    keyword = get_object_or_404(
+        LeadKeyword.objects.select_related('lead', 'lead__city'), pk=keyword_pk, lead_id=pk,
+    )
+    try:
+        compare_days = int(request.GET.get('days', 7))
+    except ValueError:
+        compare_days = 7
+    data = competitors_above(keyword, compare_days=compare_days)
+    return JsonResponse({
+        'phrase': keyword.phrase,
+        'day': data['day'].isoformat() if data['day'] else None,
+        'compared_to': data['compared_to'].isoformat() if data['compared_to'] else None,
+        'client_rank': data['client_rank'],
+        'competitors': data['competitors'],
+    })
+
+
+@login_required
+def keyword_grid_scan(request, pk, keyword_pk):
+    """GET: ostatni skan geo-grid frazy (JSON do heatmapy). POST: nowy skan w tle
+    (size, spacing_km, changed_only=1 — tylko zmienione komórki)."""
+    from ..models import LeadKeyword
+    from ..services.geo_grid import MAX_SPACING_KM, MIN_SPACING_KM, create_scan
+    from ..tasks_analysis import run_geo_grid_scans
+    keyword = get_object_or_404(
+        LeadKeyword.objects.select_related('lead', 'lead__city'), pk=keyword_pk, lead_id=pk,
+    )
+
+    if request.method == 'POST':
+        try:
+            size = min(max(int(request.POST.get('size', 5)), 1), 15)
+            spacing_km = float(request.POST.get('spacing_km', 1.0))
+        except ValueError:
+            return JsonResponse({'error': 'Nieprawidłowe parametry siatki'}, status=400)
+        # NaN nie spełnia żadnego porównania, inf wypada poza zakres
+        if not MIN_SPACING_KM <= spacing_km <= MAX_SPACING_KM:
+            return JsonResponse(
+                {'error': f'Odstęp siatki musi mieścić się w zakresie {MIN_SPACING_KM}–{MAX_SPACING_KM} km'},
+                status=400,
+            )
+        try:
+            scan = create_scan(keyword, size=size, spacing_km=spacing_km)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        run_geo_grid_scans.delay([scan.pk], changed_only=request.POST.get('changed_only') == '1')
+        return JsonResponse({'scan_id': scan.pk, 'status': scan.status})
+
+    scan = keyword.grid_scans.first()
+    if scan is None:
+        return JsonResponse({'scan': None})
+    return JsonResponse({'scan': {
+        'id': scan.pk,
+        'status': scan.status,
+        'size': scan.size,
+        'spacing_km': scan.spacing_km,
+        'points': scan.points,
+        'positions': scan.positions,
+        'changed_cells': scan.changed_cells,
+        'fetched_cells': scan.fetched_cells,
+        'created_at': scan.created_at.isoformat(),
+    }})
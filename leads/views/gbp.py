@@ -1,59 +1,55 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
-from ..models import Lead, AppSettings
-from ..services.gbp_service import get_access_token, list_locations
+from django.db.models import Max
+from ..models import Lead, AppSettings, GBPLocation
+from ..services.gbp_service import get_access_token
+from ..services.gbp_locations import location_id, refresh_registry
 
 
 @login_required
 def gbp_locations(request):
     app_settings = AppSettings.get()
     error = None
-    locations = []
-    clients = Lead.objects.filter(status='client').order_by('name')
+    clients = list(Lead.objects.filter(status='client').order_by('name'))
 
     if not app_settings.google_refresh_token:
         error = 'Brak autoryzacji Google. Przejdź do Ustawień i kliknij "Autoryzuj z Google".'
-    else:
-        try:
-            access_token = get_access_token(app_settings.google_refresh_token)
-            locs = list_locations(access_token)
-            for loc in locs:
-                locations.append({
-                    'name': loc.get('name'),
-                    'title': loc.get('title', '—'),
-                    'address': _format_address(loc.get('storefrontAddress', {})),
-                    'website': loc.get('websiteUri', ''),
-                })
-        except Exception as e:
-            import requests as req_lib
-            if isinstance(e, req_lib.HTTPError) and e.response is not None:
-                error = f'HTTP {e.response.status_code}\n\n{e.response.text}'
-            else:
-                import traceback
-                error = f'{e}\n\n{traceback.format_exc()}'
 
-    if request.method == 'POST':
-        for key, value in request.POST.items():
-            if key.startswith('lead_'):
-                try:
-                    lead_pk = int(key[5:])
-                    lead = Lead.objects.get(pk=lead_pk, status='client')
-                    lead.gbp_location_name = value.strip()
-                    lead.save(update_fields=['gbp_location_name'])
-                except (Lead.DoesNotExist, ValueError):
-                    pass
+    if request.method == 'POST' and request.POST.get('action') == 'refresh':
+        if not error:
+            try:
+                access_token = get_access_token(app_settings.google_refresh_token)
+                refresh_registry(access_token)
+                return redirect('leads:gbp_locations')
+            except Exception as e:
+                import requests as req_lib
+                if isinstance(e, req_lib.HTTPError) and e.response is not None:
+                    error = f'HTTP {e.response.status_code}\n\n{e.response.text}'
+                else:
+                    import traceback
+                    error = f'{e}\n\n{traceback.format_exc()}'
+
+    elif request.method == 'POST':
+        # Zapisujemy tylko zmienione przypisania — wartość spoza rejestru wraca z formularza bez zmian
+        for client in clients:
+            value = request.POST.get(f'lead_{client.pk}')
+            if value is None or location_id(value) == location_id(client.gbp_location_name):
+                continue
+            client.gbp_location_name = value.strip()
+            client.save(update_fields=['gbp_location_name'])
         return redirect('leads:gbp_locations')
 
+    # Lista wizytówek z rejestru — bez zapytań do Google przy każdym wejściu
+    locations = list(GBPLocation.objects.all())
+    registered = {loc.location_id for loc in locations}
+    for client in clients:
+        client.gbp_location_id = location_id(client.gbp_location_name)
+        # Przypisanie, którego nie ma w rejestrze (pusty rejestr, usunięta wizytówka) — pokazujemy je jako opcję
+        client.gbp_location_unregistered = bool(client.gbp_location_id) and client.gbp_location_id not in registered
+
     return render(request, 'leads/gbp/locations.html', {
         'clients': clients,
         'locations': locations,
+        'refreshed_at': GBPLocation.objects.aggregate(last=Max('refreshed_at'))['last'],
         'error': error,
     })
-
-
-def _format_address(addr):
-    if not addr:
-        return ''
-    parts = addr.get('addressLines', [])
-    city = addr.get('locality', '')
-    return ', '.join(filter(None, parts + [city]))
@@ -4,7 +4,7 @@ from datetime import timedelta
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
-from ..models import Lead, GBPMetricsSnapshot, AppSettings
+from ..models import Lead, GBPMetricsSnapshot, GBPBackfill, AppSettings
 
 
 @login_required
@@ -46,14 +46,8 @@ def gbp_metrics_fetch_test(request, lead_pk):
     if not error and request.method == 'POST':
         action = request.POST.get('action', 'fetch_30')
 
-        # Normalizacja location_name
-        stored = lead.gbp_location_name.strip()
-        if '/locations/' in stored and stored.startswith('accounts/'):
-            location_name = 'locations/' + stored.split('/locations/')[-1]
-        elif stored.startswith('locations/'):
-            location_name = stored
-        else:
-            location_name = 'locations/' + stored
+        from ..services.gbp_locations import performance_name
+        location_name = performance_name(lead.gbp_location_name)
 
         # Wyznacz zakres dat
         from datetime import date as date_cls
@@ -71,39 +65,14 @@ def gbp_metrics_fetch_test(request, lead_pk):
         else:
             date_from = date_to = (now - timedelta(days=7)).date()
 
-        # Znajdź dni które już są w bazie
-        existing_days = set(
-            GBPMetricsSnapshot.objects
-            .filter(
-                lead=lead,
-                source=GBPMetricsSnapshot.SOURCE_API,
-                day__isnull=False,
-                year__gte=date_from.year,
-            )
-            .values_list('year', 'month', 'day')
-        )
-
-        all_days = set()
-        d = date_from
-        while d <= date_to:
-            all_days.add((d.year, d.month, d.day))
-            d += timedelta(days=1)
-
-        missing_days = all_days - existing_days
+        # Brakujące dni (bez tych, dla których Google już nie zwracało danych)
+        from ..services.gbp_gaps import missing_days as find_missing_days, days_between, day_ranges, as_day_tuples, record_unavailable
+        all_days = days_between(date_from, date_to)
+        missing_days = find_missing_days([lead.pk], date_from, date_to)[lead.pk]
 
         force_refresh = request.POST.get('force_refresh') == '1'
         if force_refresh and all_days:
-            # Usuń tylko konkretne dni z zakresu — nie całe miesiące
-            from django.db.models import Q
-            q = Q()
-            for y, m, d in all_days:
-                q |= Q(year=y, month=m, day=d)
-            GBPMetricsSnapshot.objects.filter(
-                lead=lead,
-                source=GBPMetricsSnapshot.SOURCE_API,
-                day__isnull=False,
-            ).filter(q).delete()
-            existing_days = set()
+            # Upsert nadpisze dni z zakresu — bez kasowania
             missing_days = all_days
 
         if not missing_days:
@@ -114,63 +83,51 @@ def gbp_metrics_fetch_test(request, lead_pk):
             error_trace = None
         else:
             try:
-                from ..services.gbp_service import get_access_token, get_performance_metrics, parse_performance, compute_monthly_snapshot, _metrics_to_snapshot_kwargs, get_direction_requests
+                from ..services.gbp_service import get_access_token, get_performance_metrics, parse_performance, ingest_daily_metrics, get_direction_requests
+                from ..services.gbp_rollup import rollup_months
                 settings = AppSettings.get()
                 access_token = get_access_token(settings.google_refresh_token)
 
-                raw_result = get_performance_metrics(access_token, location_name, date_from, date_to)
-                parsed_full = parse_performance(raw_result)
-                daily_data = parsed_full.get('daily', {})
-
-                # Pobierz trasy osobnym endpointem
-                direction_map = get_direction_requests(access_token, location_name, date_from, date_to)
-
-                # Zachowaj surową odpowiedź directions do debugowania
-                from urllib.parse import urlencode as _ue
-                _params = [
-                    ('dailyMetric', 'BUSINESS_DIRECTION_REQUESTS'),
-                    ('dailyRange.startDate.year', date_from.year),
-                    ('dailyRange.startDate.month', date_from.month),
-                    ('dailyRange.startDate.day', date_from.day),
-                    ('dailyRange.endDate.year', date_to.year),
-                    ('dailyRange.endDate.month', date_to.month),
-                    ('dailyRange.endDate.day', date_to.day),
-                ]
+                # Pytamy tylko o brakujące zakresy, nie o całe okno
+                ranges = day_ranges(missing_days)
+                raw_results, daily_data, direction_map, directions_raws = [], {}, {}, []
                 import requests as _req
-                _resp = _req.get(
-                    f'https://businessprofileperformance.googleapis.com/v1/{location_name}:getDailyMetricsTimeSeries?{_ue(_params)}',
-                    headers={'Authorization': f'Bearer {access_token}'},
+                from urllib.parse import urlencode as _ue
+                for range_from, range_to in ranges:
+                    raw = get_performance_metrics(access_token, location_name, range_from, range_to)
+                    raw_results.append(raw)
+                    daily_data.update(parse_performance(raw).get('daily', {}))
+
+                    # Pobierz trasy osobnym endpointem
+                    direction_map.update(get_direction_requests(access_token, location_name, range_from, range_to))
+
+                    # Zachowaj surową odpowiedź directions do debugowania
+                    _params = [
+                        ('dailyMetric', 'BUSINESS_DIRECTION_REQUESTS'),
+                        ('dailyRange.startDate.year', range_from.year),
+                        ('dailyRange.startDate.month', range_from.month),
+                        ('dailyRange.startDate.day', range_from.day),
+                        ('dailyRange.endDate.year', range_to.year),
+                        ('dailyRange.endDate.month', range_to.month),
+                        ('dailyRange.endDate.day', range_to.day),
+                    ]
+                    _resp = _req.get(
+                        f'https://businessprofileperformance.googleapis.com/v1/{location_name}:getDailyMetricsTimeSeries?{_ue(_params)}',
+                        headers={'Authorization': f'Bearer {access_token}'},
+                    )
+                    directions_raws.append(_resp.json())
+                raw_result = raw_results[0] if len(raw_results) == 1 else raw_results
+                directions_raw = json.dumps(
+                    directions_raws[0] if len(directions_raws) == 1 else directions_raws,
+                    indent=2, ensure_ascii=False,
                 )
-                directions_raw = json.dumps(_resp.json(), indent=2, ensure_ascii=False)
 
-                saved_count = 0
-                skipped_count = len(existing_days)
-
-                for date_str, metrics in daily_data.items():
-                    try:
-                        d = date_cls.fromisoformat(date_str)
-                    except ValueError:
-                        continue
-
-                    if (d.year, d.month, d.day) in existing_days:
-                        continue
-
-                    GBPMetricsSnapshot.objects.create(
-                        lead=lead,
-                        year=d.year, month=d.month, day=d.day,
-                        source=GBPMetricsSnapshot.SOURCE_API,
-                        **_metrics_to_snapshot_kwargs(metrics, direction_map, date_str),
-                    )
-                    saved_count += 1
+                skipped_count = len(all_days) - len(missing_days)
+                saved_count = ingest_daily_metrics(lead, daily_data, direction_map, only_days=as_day_tuples(missing_days))
+                record_unavailable(lead.pk, missing_days, daily_data)
 
-                # Aktualizuj sumy miesięczne
-                months_in_range = set()
-                d = date_from
-                while d <= date_to:
-                    months_in_range.add((d.year, d.month))
-                    d += timedelta(days=1)
-                for year, month in months_in_range:
-                    compute_monthly_snapshot(lead, year, month)
+                # Aktualizuj sumy miesięczne (tylko miesiące ze zmienionymi dniami)
+                rollup_months(lead_ids=[lead.pk], since=(date_from.year, date_from.month))
 
                 saved = True
                 already_existed = False
@@ -217,8 +174,14 @@ def gbp_metrics_daily(request, lead_pk):
     )
 
     if request.method == 'POST' and request.POST.get('action') == 'delete':
+        from ..services.gbp_rollup import mark_month_dirty
+        from ..services.gbp_series import clear_days
         pk = request.POST.get('pk')
-        GBPMetricsSnapshot.objects.filter(pk=pk, lead=lead).delete()
+        entry = daily_qs.filter(pk=pk).first()
+        if entry:
+            entry.delete()
+            mark_month_dirty(lead.pk, entry.year, entry.month)
+            clear_days(lead.pk, [date(entry.year, entry.month, entry.day)])
         return redirect('leads:gbp_metrics_daily', lead_pk=lead.pk)
 
     paginator = Paginator(daily_qs, 31)
@@ -265,44 +228,30 @@ def gbp_metrics_index(request, lead_pk):
             pk = request.POST.get('pk')
             GBPMetricsSnapshot.objects.filter(pk=pk, lead=lead).delete()
 
+        elif action == 'backfill' and lead.gbp_location_name:
+            from ..tasks import backfill_gbp_metrics
+            backfill_gbp_metrics.delay(lead_ids=[lead.pk])
+
         return redirect('leads:gbp_metrics_index', lead_pk=lead.pk)
 
     # Tylko ręczne wpisy miesięczne (day=NULL)
     snapshots = lead.gbp_metrics.filter(day__isnull=True, source=GBPMetricsSnapshot.SOURCE_MANUAL)
 
-    # Dane dzienne z API — ostatnie 30 dni
-    from datetime import date
+    # Dane dzienne z API — ostatnie 30 dni, jeden odczyt spakowanych miesięcy
+    import numpy as np
+    from ..services.gbp_series import read_range
+    from ..services.gbp_service import INTERACTION_FIELDS
     today = timezone.now().date()
     thirty_days_ago = today - timedelta(days=35)  # bufor na opóźnienie
-    daily_snapshots = (
-        lead.gbp_metrics
-        .filter(source=GBPMetricsSnapshot.SOURCE_API, day__isnull=False)
-        .filter(year__gte=thirty_days_ago.year)
-        .order_by('-year', '-month', '-day')
-    )
-    # Filtruj po dacie w Pythonie (prosto)
-    daily_snapshots = [
-        s for s in daily_snapshots
-        if date(s.year, s.month, s.day) >= thirty_days_ago
-    ]
+    _, daily_values = read_range(lead.pk, thirty_days_ago, today)
+    known_days = np.zeros(len(next(iter(daily_values.values()))), dtype=bool)
+    for values in daily_values.values():
+        known_days |= ~np.isnan(values)
 
     # Sumy z ostatnich 30 dni
-    daily_totals = {
-        'calls': sum(s.calls or 0 for s in daily_snapshots),
-        'profile_views': sum(s.profile_views or 0 for s in daily_snapshots),
-        'website_visits': sum(s.website_visits or 0 for s in daily_snapshots),
-        'direction_requests': sum(s.direction_requests or 0 for s in daily_snapshots),
-        'conversations': sum(s.conversations or 0 for s in daily_snapshots),
-        'bookings': sum(s.bookings or 0 for s in daily_snapshots),
-        'food_orders': sum(s.food_orders or 0 for s in daily_snapshots),
-        'food_menu_clicks': sum(s.food_menu_clicks or 0 for s in daily_snapshots),
-        'count': len(daily_snapshots),
-    }
-    daily_totals['total_interactions'] = (
-        daily_totals['calls'] + daily_totals['website_visits'] +
-        daily_totals['direction_requests'] + daily_totals['conversations'] +
-        daily_totals['bookings'] + daily_totals['food_orders'] + daily_totals['food_menu_clicks']
-    )
+    daily_totals = {field: int(np.nansum(values)) for field, values in daily_values.items()}
+    daily_totals['count'] = int(known_days.sum())
+    daily_totals['total_interactions'] = sum(daily_totals[field] for field in INTERACTION_FIELDS)
 
     # Miesiące do selecta — bieżący rok i rok poprzedni
     months = [(y, m) for y in [now.year, now.year - 1] for m in range(1, 13)]
@@ -340,9 +289,9 @@ def gbp_metrics_index(request, lead_pk):
     return render(request, 'leads/gbp_metrics/index.html', {
         'lead': lead,
         'snapshots': snapshots,
-        'daily_snapshots': daily_snapshots,
         'daily_totals': daily_totals,
         'chart_data': json.dumps(chart_data),
+        'backfill': GBPBackfill.objects.filter(lead=lead).first(),
         'months_choices': months_choices,
         'current_year': now.year,
         'current_month': now.month,
@@ -1,7 +1,8 @@
 from django.shortcuts import get_object_or_404, redirect, render
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from leads.models import Lead, KeywordSuggestionBatch, LeadKeyword
+from leads.models import Lead, KeywordSuggestionBatch
+from leads.services.lead_keywords import add_lead_keywords
 from leads.tasks_analysis import generate_keyword_suggestions
 
 
@@ -31,8 +32,7 @@ def keyword_suggestions(request, pk):
         if action == 'add_selected':
             phrase_ids = request.POST.getlist('phrases')
             if latest_batch:
-                for suggestion in latest_batch.suggestions.filter(pk__in=phrase_ids):
-                    LeadKeyword.objects.get_or_create(lead=lead, phrase=suggestion.phrase)
+                add_lead_keywords(lead, latest_batch.suggestions.filter(pk__in=phrase_ids).values_list('phrase', flat=True))
             messages.success(request, f'Dodano {len(phrase_ids)} fraz do leada.')
             return redirect('leads:lead_detail', pk=pk)
 
@@ -17,10 +17,7 @@ def activity_report_preview(request, pk):
     """Podgląd raportu miesięcznego z działań."""
     from datetime import date, timedelta
     from django.utils import timezone
-    from django.db.models import Sum
-    from leads.models import (
-        ClientActivityLog, LeadKeyword, KeywordRankCheck, GBPMetricsSnapshot
-    )
+    from leads.models import ClientActivityLog
 
     lead = get_object_or_404(Lead, pk=pk, status='client')
 
@@ -52,85 +49,11 @@ def activity_report_preview(request, pk):
         total_duration = 0
 
     # --- Metryki GBP ---
+    # Sumy i miesiące jednym zapytaniem (rollup → wpis ręczny → suma dni), z cache do nowych danych
     metrics_data = None
     if include_metrics:
-        # Znajdź snapshoty miesięczne w zakresie dat — oba źródła
-        snapshots = GBPMetricsSnapshot.objects.filter(
-            lead=lead,
-            day__isnull=True,
-            year__gte=date_from.year,
-            year__lte=date_to.year,
-        )
-        snapshots = [
-            s for s in snapshots
-            if (s.year, s.month) >= (date_from.year, date_from.month)
-            and (s.year, s.month) <= (date_to.year, date_to.month)
-        ]
-        # Jeśli brak miesięcznych — spróbuj zsumować dzienne z API
-        if not snapshots:
-            daily = GBPMetricsSnapshot.objects.filter(
-                lead=lead,
-                source='api',
-                day__isnull=False,
-                year__gte=date_from.year,
-                year__lte=date_to.year,
-            )
-            daily = [
-                s for s in daily
-                if (s.year, s.month) >= (date_from.year, date_from.month)
-                and (s.year, s.month) <= (date_to.year, date_to.month)
-            ]
-            if daily:
-                snapshots = [type('S', (), {
-                    'calls': sum(s.calls or 0 for s in daily),
-                    'profile_views': sum(s.profile_views or 0 for s in daily),
-                    'direction_requests': sum(s.direction_requests or 0 for s in daily),
-                    'website_visits': sum(s.website_visits or 0 for s in daily),
-                    'conversations': sum(s.conversations or 0 for s in daily),
-                    'bookings': sum(s.bookings or 0 for s in daily),
-                    'food_orders': sum(s.food_orders or 0 for s in daily),
-                    'food_menu_clicks': sum(s.food_menu_clicks or 0 for s in daily),
-                })()]
-        if snapshots:
-            calls = sum(s.calls or 0 for s in snapshots)
-            website_visits = sum(s.website_visits or 0 for s in snapshots)
-            direction_requests = sum(s.direction_requests or 0 for s in snapshots)
-            conversations = sum(s.conversations or 0 for s in snapshots)
-            bookings = sum(s.bookings or 0 for s in snapshots)
-            food_orders = sum(s.food_orders or 0 for s in snapshots)
-            food_menu_clicks = sum(s.food_menu_clicks or 0 for s in snapshots)
-
-            # Jeśli conversations jest NULL (stary wpis przed migracją) — sprawdź dane dzienne
-            if all(getattr(s, 'conversations', None) is None for s in snapshots):
-                daily_fallback = GBPMetricsSnapshot.objects.filter(
-                    lead=lead,
-                    source='api',
-                    day__isnull=False,
-                    year__gte=date_from.year,
-                    year__lte=date_to.year,
-                )
-                daily_fallback = [
-                    s for s in daily_fallback
-                    if (s.year, s.month) >= (date_from.year, date_from.month)
-                    and (s.year, s.month) <= (date_to.year, date_to.month)
-                ]
-                if daily_fallback:
-                    conversations = sum(s.conversations or 0 for s in daily_fallback)
-                    bookings = sum(s.bookings or 0 for s in daily_fallback)
-                    food_orders = sum(s.food_orders or 0 for s in daily_fallback)
-                    food_menu_clicks = sum(s.food_menu_clicks or 0 for s in daily_fallback)
-            metrics_data = {
-                'calls': calls,
-                'profile_views': sum(s.profile_views or 0 for s in snapshots),
-                'direction_requests': direction_requests,
-                'website_visits': website_visits,
-                'conversations': conversations,
-                'bookings': bookings,
-                'food_orders': food_orders,
-                'food_menu_clicks': food_menu_clicks,
-                'total_interactions': calls + website_visits + direction_requests + conversations + bookings + food_orders + food_menu_clicks,
-                'months': snapshots,
-            }
+        from leads.services.gbp_metrics_query import metrics_for_range
+        metrics_data = metrics_for_range(lead.pk, date_from, date_to)
 
     # --- Słowa kluczowe ---
     keywords_data = []
@@ -2,9 +2,9 @@ from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from leads.services.apify import get_apify_balance
+from leads.services.dataforseo_client import DataForSEOClient
 from leads.models import AppSettings
 import requests
-import base64
 
 
 def get_openai_balance(api_key):
@@ -27,20 +27,13 @@ def get_dataforseo_balance(login, password):
     if not login or not password:
         return None
     try:
-        credentials = base64.b64encode(f'{login}:{password}'.encode()).decode()
-        resp = requests.get(
-            'https://api.dataforseo.com/v3/appendix/user_data',
-            headers={'Authorization': f'Basic {credentials}'},
-            timeout=10,
-        )
-        if resp.status_code == 200:
-            data = resp.json()
-            info = data.get('tasks', [{}])[0].get('result', [{}])[0] or {}
-            money = info.get('money', {})
-            return {
-                'balance': round(money.get('balance', 0), 2),
-                'spent': round(money.get('spent_today', 0), 4),
-            }
+        data = DataForSEOClient(login, password).get('appendix/user_data', timeout=10)
+        info = data.get('tasks', [{}])[0].get('result', [{}])[0] or {}
+        money = info.get('money', {})
+        return {
+            'balance': round(money.get('balance', 0), 2),
+            'spent': round(money.get('spent_today', 0), 4),
+        }
     except Exception:
         pass
     return None
@@ -2,8 +2,9 @@ from django.shortcuts import get_object_or_404, redirect, render
 from django.contrib.auth.decorators import login_required
 from django.db import models
 from django.utils import timezone
-from ..models import Voivodeship, VoivodeshipKeyword, AppSettings
+from ..models import Voivodeship, VoivodeshipKeyword, KeywordVolumeTask, AppSettings
 from ..constants import get_dataforseo_location_code
+from ..services.dataforseo_volumes import UPDATE_BATCH_SIZE
 
 
 @login_required
@@ -27,21 +28,24 @@ def voivodeship_keyword_detail(request, pk):
     voivodeship = get_object_or_404(Voivodeship, pk=pk)
 
     if request.method == 'POST':
-        # Zapisz wszystkie nadesłane wartości naraz
-        updated = 0
+        # Zapisz wszystkie nadesłane wartości naraz: jeden odczyt i bulk_update zmienionych fraz
+        submitted = {}
         for key, value in request.POST.items():
             if key.startswith('searches_'):
                 kw_id = key.replace('searches_', '')
-                try:
-                    kw = VoivodeshipKeyword.objects.get(pk=kw_id, voivodeship=voivodeship)
-                    new_val = value.strip() or None
-                    if kw.monthly_searches != new_val:
-                        kw.monthly_searches = new_val
-                        kw.searches_updated_at = timezone.now() if new_val is not None else None
-                        kw.save(update_fields=['monthly_searches', 'searches_updated_at'])
-                        updated += 1
-                except VoivodeshipKeyword.DoesNotExist:
-                    pass
+                if kw_id.isdigit():
+                    submitted[int(kw_id)] = value.strip() or None
+        now = timezone.now()
+        changed = []
+        for kw in voivodeship.keywords.filter(pk__in=list(submitted)):
+            new_val = submitted[kw.pk]
+            if kw.monthly_searches != new_val:
+                kw.monthly_searches = new_val
+                kw.searches_updated_at = now if new_val is not None else None
+                changed.append(kw)
+        VoivodeshipKeyword.objects.bulk_update(
+            changed, ['monthly_searches', 'searches_updated_at'], batch_size=UPDATE_BATCH_SIZE,
+        )
         return redirect('leads:voivodeship_keyword_detail', pk=pk)
 
     keywords = voivodeship.keywords.all()
@@ -61,12 +65,18 @@ def voivodeship_keyword_detail(request, pk):
         searches_updated_at__isnull=False,
         searches_updated_at__gte=stale_threshold,
     ).count()
+    # Frazy wysłane do kolejki standard DataForSEO, jeszcze nieodebrane
+    queued_count = sum(
+        len(phrases) for phrases in
+        voivodeship.volume_tasks.filter(status=KeywordVolumeTask.STATUS_PENDING).values_list('phrases', flat=True)
+    )
     return render(request, 'leads/voivodeship_keywords/detail.html', {
         'voivodeship': voivodeship,
         'keywords': keywords,
         'missing_count': missing_count,
         'fetchable_count': fetchable_count,
         'checked_no_data': checked_no_data,
+        'queued_count': queued_count,
         'dataforseo_location': f"{get_dataforseo_location_code(voivodeship.name)} ({voivodeship.name})",
     })
 
@@ -74,17 +84,12 @@ def voivodeship_keyword_detail(request, pk):
 @login_required
 def voivodeship_keyword_debug(request, pk):
     """Diagnostyka — dwa testy: surowe API + fetch_keyword_volumes()"""
-    import requests as req
-    import base64
-    from ..services.dataforseo_volumes import fetch_keyword_volumes
+    from ..services.dataforseo_client import DataForSEOClient, endpoint_stats
+    from ..services.dataforseo_volumes import fetch_keyword_volumes, SEARCH_VOLUME_ENDPOINT
 
     voivodeship = get_object_or_404(Voivodeship, pk=pk)
     app_settings = AppSettings.get()
 
-    credentials = base64.b64encode(
-        f"{app_settings.dataforseo_login}:{app_settings.dataforseo_password}".encode()
-    ).decode()
-
     test_phrases = list(
         voivodeship.keywords.filter(monthly_searches__isnull=True)
         .values_list('phrase', flat=True)[:3]
@@ -93,13 +98,10 @@ def voivodeship_keyword_debug(request, pk):
 
     # Test 1: surowe API
     try:
-        response = req.post(
-            "https://api.dataforseo.com/v3/keywords_data/google_ads/search_volume/live",
-            headers={"Authorization": f"Basic {credentials}", "Content-Type": "application/json"},
-            json=[{"keywords": test_phrases, "location_code": location_code, "language_name": "Polish"}],
-            timeout=60,
+        raw = DataForSEOClient(app_settings.dataforseo_login, app_settings.dataforseo_password).post(
+            SEARCH_VOLUME_ENDPOINT,
+            [{"keywords": test_phrases, "location_code": location_code, "language_name": "Polish"}],
         )
-        raw = response.json()
         task = (raw.get('tasks') or [{}])[0]
         task_status = task.get('status_code')
         task_message = task.get('status_message')
@@ -140,6 +142,7 @@ def voivodeship_keyword_debug(request, pk):
         'service_result': service_result,
         'service_count': service_count,
         'service_error': service_error,
+        'api_stats': endpoint_stats(),
     })
 
 
@@ -0,0 +1,77 @@
+"""
+Benchmark zapisu dziennych metryk GBP: stara ścieżka (create per dzień)
+vs ingest_daily_metrics (jeden upsert).
+
+Uruchomienie:
+    python manage.py shell < scripts/benchmark_gbp_ingest.py
+
+Wszystko dzieje się w transakcji, która na końcu jest wycofywana —
+w bazie nie zostaje tymczasowy lead ani metryki.
+"""
+
+import time
+from datetime import date, timedelta
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from leads.models import City, Lead, GBPMetricsSnapshot
+from leads.services.gbp_service import ingest_daily_metrics, _metrics_to_snapshot_kwargs
+
+
+def fake_series(days):
+    """Szereg dzienny w formacie parse_performance()['daily'] + mapa tras."""
+    start = date.today() - timedelta(days=days + 5)
+    daily, directions = {}, {}
+    for i in range(days):
+        date_str = (start + timedelta(days=i)).isoformat()
+        daily[date_str] = {
+            'BUSINESS_IMPRESSIONS_MOBILE_MAPS': 100 + i,
+            'CALL_CLICKS': i % 7,
+            'WEBSITE_CLICKS': i % 5,
+        }
+        directions[date_str] = i % 3
+    return daily, directions
+
+
+def old_path(lead, daily, directions):
+    for date_str, metrics in daily.items():
+        d = date.fromisoformat(date_str)
+        GBPMetricsSnapshot.objects.create(
+            lead=lead,
+            year=d.year, month=d.month, day=d.day,
+            source=GBPMetricsSnapshot.SOURCE_API,
+            **_metrics_to_snapshot_kwargs(metrics, directions, date_str),
+        )
+
+
+def measure(fn):
+    with CaptureQueriesContext(connection) as ctx:
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+    return elapsed, len(ctx.captured_queries)
+
+
+class Rollback(Exception):
+    pass
+
+
+try:
+    with transaction.atomic():
+        city = City.objects.create(name='Benchmark')
+        for days in (30, 365):
+            daily, directions = fake_series(days)
+
+            lead = Lead.objects.create(city=city, name=f'Benchmark create {days}', status='client')
+            old_time, old_queries = measure(lambda: old_path(lead, daily, directions))
+
+            lead = Lead.objects.create(city=city, name=f'Benchmark upsert {days}', status='client')
+            new_time, new_queries = measure(lambda: ingest_daily_metrics(lead, daily, directions))
+
+            print(f"{days:>3} dni | create per dzień: {old_time * 1000:8.1f} ms, {old_queries:>4} zapytań"
+                  f" | upsert: {new_time * 1000:8.1f} ms, {new_queries:>4} zapytań"
+                  f" | x{old_time / new_time:.1f}")
+        raise Rollback
+except Rollback:
+    print("Dane testowe wycofane.")